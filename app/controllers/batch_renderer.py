@@ -0,0 +1,123 @@
+"""
+This file contains the controller rendering the resumes and cover letters of many runs or variants at once
+authors: Erin Hwang
+"""
+from app.utils.logger import LoggerConfig
+from app.controllers.render_pool import get_render_pool
+
+class BatchRendererController:
+    """
+    Renders the documents of many runs in one batch on the render pool
+
+    The runs of one user share the same uploaded resume and cover letter, so the batch is grouped by
+    template and every render worker compiles each template once, then only clones, patches and saves
+    it per run. A run failing to render is reported in its own result and does not fail the batch.
+    `from_template` builds the batch of N variants of one template, ie one user's listings.
+
+    Args:
+        run_states (dict[str, dict]): Run states returned by ScrapePipelineController.run_state, keyed by run ID;
+            once processed, holds the new run states with the rendered file paths
+        cover_letters (bool): Whether to also render the cover letters
+    """
+
+    def __init__(self, run_states: dict[str, dict], cover_letters: bool = True):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.run_states = run_states
+        self.cover_letters = cover_letters
+
+    @classmethod
+    def from_template(
+            cls, resume_path: str, variants: list[dict], cl_path: str | None = None
+            ) -> "BatchRendererController":
+        """
+        Batch of variants rendered from one resume template, and cover letter template if given
+
+        Args:
+            resume_path (str): Path to the base resume
+            variants (list[dict]): Generated content per variant: variant_id (optional, defaults to its
+                position), source_name, resume_content, cl_keyword_md, soft_cosine_similarity and contact_name
+            cl_path (str, optional): Path to the base cover letter, no cover letter is rendered without it
+
+        Raises:
+            ValueError: If two variants share the same ID
+
+        Returns:
+            BatchRendererController: The batch, keyed by variant ID
+        """
+        run_states = {}
+        for i_variant, variant in enumerate(variants):
+            variant_id = variant.get("variant_id") or str(i_variant)
+            if variant_id in run_states:
+                raise ValueError(f"Duplicate variant ID {variant_id}")
+            score = variant.get("soft_cosine_similarity")
+            run_states[variant_id] = {
+                "resume_path": resume_path,
+                "cl_path": cl_path,
+                "contact_name": variant.get("contact_name"),
+                "source_name": variant["source_name"],
+                "cl_keyword_md": variant["cl_keyword_md"],
+                "semantic_scores": {"soft_cosine_similarity": "" if score is None else score},
+                "resume_content": variant["resume_content"],
+                }
+        return cls(run_states, cover_letters=cl_path is not None)
+
+    def resume_kwargs(self, run_id: str, run_state: dict) -> dict:
+        """ResumeRendererController arguments of a run"""
+        # the run ID keeps the runs of a same source from writing to the same file
+        return {
+            "resume_path": run_state["resume_path"],
+            "generated_content": run_state["resume_content"],
+            "source_name": f"{run_state['source_name']}_{run_id}",
+            "md_info": run_state["cl_keyword_md"],
+            }
+
+    def cover_letter_kwargs(self, run_id: str, run_state: dict) -> dict:
+        """CoverLetterRendererController arguments of a run"""
+        return {
+            "cl_path": run_state["cl_path"],
+            "soft_cos_score": run_state["semantic_scores"]["soft_cosine_similarity"],
+            "md_info": run_state["cl_keyword_md"],
+            "contact_name": run_state["contact_name"],
+            "source_name": f"cl_{run_state['source_name']}_{run_id}",
+            }
+
+    @LoggerConfig().log_execution
+    async def process(self) -> dict[str, dict]:
+        """
+        Execute the batch render
+
+        Returns:
+            dict[str, dict]: Per run ID, the status, resume_filepath, cover_letter_filepath and error messages
+        """
+        pool = get_render_pool()
+        run_ids = list(self.run_states)
+        resume_results = await pool.render_resumes(
+            [self.resume_kwargs(run_id, self.run_states[run_id]) for run_id in run_ids]
+            )
+        cl_run_ids = [run_id for run_id in run_ids if self.cover_letters and self.run_states[run_id].get("cl_path")]
+        cl_results = dict(zip(cl_run_ids, await pool.render_cover_letters(
+            [self.cover_letter_kwargs(run_id, self.run_states[run_id]) for run_id in cl_run_ids]
+            )))
+
+        results = {}
+        for run_id, resume_result in zip(run_ids, resume_results):
+            rendered = {}
+            result = {"status": "success", "resume_filepath": None, "cover_letter_filepath": None, "errors": []}
+            if resume_result["status"] == "success":
+                rendered["resume_filepath"] = result["resume_filepath"] = resume_result["filepath"]
+            else:
+                result["errors"].append(f"resume: {resume_result['message']}")
+            cl_result = cl_results.get(run_id)
+            if cl_result is not None and cl_result["status"] == "success":
+                rendered["cl_filepath"] = result["cover_letter_filepath"] = cl_result["filepath"]
+            elif cl_result is not None:
+                result["errors"].append(f"cover letter: {cl_result['message']}")
+            if result["errors"]:
+                result["status"] = "error"
+            results[run_id] = result
+            # replace the run state rather than changing it, other requests may be reading it
+            self.run_states[run_id] = {**self.run_states[run_id], **rendered}
+
+        failed = sum(result["status"] != "success" for result in results.values())
+        self.logger.info("Batch rendered %s run(s), %s failed", len(results), failed)
+        return results
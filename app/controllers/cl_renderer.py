@@ -3,14 +3,18 @@ This file contains the controllers for the resume generator application
 authors: Erin Hwang
 """
 import os
-import re
+from io import BytesIO
 from app.utils.logger import LoggerConfig
-from langchain.text_splitter import MarkdownHeaderTextSplitter
+from app.utils.markdown import MarkdownHeaderSplitter, strip_markdown_fence
 from datetime import datetime
-from docx import Document
+from app.services.docx_template import GREETING_MARKER, RENDER_BACKEND, get_compiled_template
+from app.utils.placeholder_tokenizer import substitute_placeholders
 
 GENERATED_CL_PATH = os.getenv("GENERATED_CL_PATH")
 CHAT_MODEL = os.getenv("CHAT_MODEL")
+
+KEYWORD_SPLITTER = MarkdownHeaderSplitter(headers_to_split_on=[("#", "header"),], strip_headers=False)
+
 class CoverLetterRendererController:
     """
     Render a cover letter from a template and extracted content
@@ -20,24 +24,23 @@ class CoverLetterRendererController:
         soft cos score
         extract info md
         contact_name
+        render_backend (str): "python-docx" or "ooxml", see CompiledDocxTemplate
 
     Returns:
         #TODO: figure this out
     """
-    pattern = r"\[[^\[\]]*\]"
-    start_pattern = r"\[(?![^\[\]]*\])[^]]*$"
-    end_pattern = r"^(?!.*?\[[^\[\]]*\]).*?\]"
-    middle_pattern = r"^[^\[\]]*$"
 
-    def __init__(self, cl_path: str, soft_cos_score: str, md_info: str, contact_name: str | None, source_name: str):
+    def __init__(
+            self, cl_path: str, soft_cos_score: str, md_info: str, contact_name: str | None, source_name: str,
+            render_backend: str = RENDER_BACKEND
+            ):
         self.logger = LoggerConfig().get_logger(__name__)
+        self.render_backend = render_backend
         self.source_name = source_name
         self.data_dir = GENERATED_CL_PATH
         self.cl_path = cl_path
         self.generated_md_content = md_info
-        self.keyword_splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on=[("#", "header"),],
-            strip_headers=False)
+        self.keyword_splitter = KEYWORD_SPLITTER
         self.md_info = md_info
         self.soft_cos_score = soft_cos_score
         self.contact_name = contact_name
@@ -47,10 +50,10 @@ class CoverLetterRendererController:
         """Cleanse the markdown prefix and suffix text"""
         final = {}
         keys = ["[CompanyName]", "[CityState]", "[PositionName]"]
-        cleansed_text = self.md_info.replace("```markdown", "").replace("```", "").strip()
+        cleansed_text = strip_markdown_fence(self.md_info)
         splits = self.keyword_splitter.split_text(cleansed_text)
         assert len(splits) == 3, "Cover letter md output does not contain 3 headers"
-        keywords = [each.metadata["header"] for each in splits]
+        keywords = [metadata["header"] for _, metadata in splits]
 
         for each in list(zip(keys, keywords)):
             if "Not Available" in each[1]:
@@ -71,11 +74,13 @@ class CoverLetterRendererController:
         CHAT_MODEL
         return cleansed_content
 
-    def render_greeting(self, all_paragraphs, content_dict: dict):
-        for paragraph in all_paragraphs:
+    def render_greeting(self, all_paragraphs, content_dict: dict, i_greeting: int | None = None):
+        """Replace the greeting when there is no contact name, returns the index of the replaced paragraph"""
+        candidates = enumerate(all_paragraphs) if i_greeting is None else [(i_greeting, all_paragraphs[i_greeting])]
+        for i_par, paragraph in candidates:
             full_paragraph_text = "".join([run.text for run in paragraph.runs])
 
-            if "Dear [" in full_paragraph_text and not content_dict["[ContactName]"]:
+            if GREETING_MARKER in full_paragraph_text and not content_dict["[ContactName]"]:
                 all_runs = paragraph.runs
                 paragraph.runs[0].text = "To whom it may concern,"
                 paragraph.runs[0].font.name = "Calibri"
@@ -83,105 +88,59 @@ class CoverLetterRendererController:
                 if len(all_runs) > 1:
                     for each_run in all_runs[1:]:
                         each_run.text = ""
-                break
+                return i_par
+        return None
 
     def edit_paragraphs(self, all_paragraphs, i_edit_list: list[int], content_dict: dict):
-        cleansed_content = content_dict
+        """Replace the [Placeholder] values of the listed paragraphs, including the ones split across runs"""
         for i_par_edit in i_edit_list:
-            # print(i_par_edit)
-            par = all_paragraphs[i_par_edit]
-            # print(f"Paragraph {i_par} text:\n{par.text}\n-Here are the runs:")
-
-            full_matches = []
-            start_matches = []
-            end_matches = []
-            middle_matches = []
-
-
-
-            for i_run, run in enumerate(par.runs):
-                # print(run.text)
-                full_match = [(i_run, val) for val in re.findall(self.pattern, run.text)]
-                full_matches.extend(full_match)
-                start_match =  [(i_run, val) for val in re.findall(self.start_pattern, run.text)]
-                start_matches.extend(start_match)
-                end_match =  [(i_run, val) for val in re.findall(self.end_pattern, run.text)]
-                end_matches.extend(end_match)
-                middle_match = [(i_run, val) for val in re.findall(self.middle_pattern, run.text)]
-                middle_matches.extend(middle_match)
-
-            if full_matches:
-                # print("here")
-                # print(full_matches)
-                for each_full_match in full_matches:
-                    # print(each_full_match[0])
-                    all_paragraphs[i_par_edit].runs[each_full_match[0]].text = all_paragraphs[i_par_edit].runs[each_full_match[0]].text.replace(each_full_match[1], cleansed_content[each_full_match[1]])
-                    all_paragraphs[i_par_edit].runs[each_full_match[0]].font.name = "Calibri"
-                    all_paragraphs[i_par_edit].runs[each_full_match[0]].font.size = 133350
-
-            if start_matches:
-                assert len(start_matches) == len(end_matches)
-
-                i_curr = 0
-                for start, end in zip(start_matches, end_matches):
-
-                    i_start = start[0]
-                    val_start = start[1]
-
-                    i_end = end[0]
-                    val_end = end[1]
-
-                    curr_middle_match = None if len(middle_matches) == 0 else middle_matches[i_curr]
-
-                    if i_end - i_start >= 2:
-                        assert curr_middle_match is not None
-                        determined_term = val_start + curr_middle_match[1] + val_end
-                        all_paragraphs[i_par_edit].runs[curr_middle_match[0]].text = all_paragraphs[i_par_edit].runs[curr_middle_match[0]].text.replace(curr_middle_match[1], "")
-
-                        all_paragraphs[i_par_edit].runs[curr_middle_match[0]].font.name = "Calibri"
-                        all_paragraphs[i_par_edit].runs[curr_middle_match[0]].font.size = 133350
-                    else:
-                        assert curr_middle_match is None
-                        determined_term = val_start + val_end
-
-                    # for
-                    i_curr += 1
-
-                    #replacing at the run where [ is first found
-                    all_paragraphs[i_par_edit].runs[i_start].text = all_paragraphs[i_par_edit].runs[i_start].text.replace(val_start, cleansed_content[determined_term])
-                    all_paragraphs[i_par_edit].runs[i_start].font.name = "Calibri"
-                    all_paragraphs[i_par_edit].runs[i_start].font.size = 133350
-
-                    #replace at the run where ] is found
-                    all_paragraphs[i_par_edit].runs[i_end].text = all_paragraphs[i_par_edit].runs[i_end].text.replace(val_end, "")
-                    all_paragraphs[i_par_edit].runs[i_end].font.name = "Calibri"
-                    all_paragraphs[i_par_edit].runs[i_end].font.size = 133350
+            substitute_placeholders(all_paragraphs[i_par_edit].runs, content_dict, style_split_runs=True)
 
+    def output_path(self) -> str:
+        """Path the rendered cover letter is saved to"""
+        return f"{self.data_dir}/{self.source_name}.docx"
 
-    @LoggerConfig().log_execution
-    def execute(self):
+    def render_document(self):
+        """Render the cover letter into a clone of the compiled template, returns the template and the clone"""
         cleansed_content = self.cleanse_user_input()
         self.logger.info(f"Successfully cleansed both user input and model generated output. Ready to render cover letter...")
 
-        doc = Document(self.cl_path)
+        # the template is parsed and indexed once, every render patches a clone of it
+        template = get_compiled_template(self.cl_path)
+        doc = template.clone(self.render_backend)
         all_paragraphs = doc.paragraphs
-        self.render_greeting(all_paragraphs, cleansed_content)
+        if template.greeting_paragraph is None:
+            i_greeting = None
+        else:
+            i_greeting = self.render_greeting(all_paragraphs, cleansed_content, template.greeting_paragraph)
         self.logger.info(f"Successfully rendered greeting. Ready to render remaining inputs...")
 
-        #collect the indices of paragraphs to edit
-        i_pars_to_edit = [i_par for i_par, par in enumerate(all_paragraphs) if par.text.__contains__("[")]
+        #collect the indices of paragraphs to edit, a replaced greeting no longer has placeholders
+        i_pars_to_edit = [i_par for i_par in template.placeholder_paragraphs if i_par != i_greeting]
 
         self.edit_paragraphs(all_paragraphs, i_pars_to_edit, cleansed_content)
         self.logger.info(f"Successully rendered cover letter.")
+        return template, doc
 
-        docx_fp = f"{self.data_dir}/{self.source_name}.docx"
-        docx_fp = os.path.abspath(docx_fp)
+    @LoggerConfig().log_execution
+    def execute(self):
+        template, doc = self.render_document()
+        docx_fp = os.path.abspath(self.output_path())
 
         #pprint the filepath here to determine if the correct name is bneing used
 
-        doc.save(docx_fp)
-        self.logger.info(f"Successfully saved cover letter at:\n\t\t{self.data_dir}/{self.source_name}.docx")
-        return f"{self.data_dir}/{self.source_name}.docx"
+        template.save(doc, docx_fp, self.render_backend)
+        self.logger.info(f"Successfully saved cover letter at:\n\t\t{self.output_path()}")
+        return self.output_path()
+
+    @LoggerConfig().log_execution
+    def execute_in_memory(self) -> bytes:
+        """Render the cover letter without touching the disk, returns the DOCX content"""
+        template, doc = self.render_document()
+        buffer = BytesIO()
+        template.save(doc, buffer, self.render_backend)
+        self.logger.info(f"Successfully rendered cover letter in memory ({buffer.tell()} bytes)")
+        return buffer.getvalue()
 
 if __name__ == "__main__":
     t_cl_path = "/Users/erinhwang/Projects/ResuMate/experiments/base_docs/thee_cover_letter_rendrrr.docx"
@@ -46,12 +46,21 @@ class JobListingLoader:
         job_str = await self.extractor.extract_details()
         return job_str
 
+    async def scrape(self, url: str):
+        """Scrape the job listing URL into a PDF and keep track of its file path"""
+        pdf_path = await self._convert_listing(url)
+        self.file_path = pdf_path
+        return pdf_path
+
+    async def extract(self, pdf_path: str):
+        """Extract the job listing content of a scraped PDF"""
+        return await self._extract_pdf(pdf_path)
+
     @LoggerConfig().log_execution
     async def process(self, url: str):
         """Execute job listing loading process"""
-        pdf_path = await self._convert_listing(url)
-        self.file_path = pdf_path
-        job_str = await self._extract_pdf(pdf_path)
+        pdf_path = await self.scrape(url)
+        job_str = await self.extract(pdf_path)
         return job_str
 
 async def test_main():
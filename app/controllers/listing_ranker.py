@@ -0,0 +1,99 @@
+"""
+This file contains the controller ranking the indexed job listings against a resume
+authors: Erin Hwang
+"""
+import asyncio
+import numpy as np
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+from app.services.embedding import get_micro_batch_encoder
+from app.services.listing_index import LISTING_INDEX_MODEL, ListingEmbeddingIndex, get_listing_index
+from app.controllers.threshold_evaluator import soft_cosine_similarity_batch
+
+
+class ListingRankerController:
+    """
+    Scores a resume against every indexed job listing and returns the best matches
+
+    Args:
+        resume_str (str): Extracted resume content
+        transformer_model (str): Sentence transformer model of the listing index
+        index (ListingEmbeddingIndex, optional): Listing index, defaults to the process-wide index of the model
+    """
+    ALLOWED_METRICS = ("soft_cosine_similarity", "cosine_similarity")
+
+    def __init__(
+        self,
+        resume_str: str,
+        transformer_model: str = LISTING_INDEX_MODEL,
+        index: ListingEmbeddingIndex | None = None,
+    ):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.resume_str = resume_str
+        self.transformer_model = transformer_model
+        self.index = index or get_listing_index(transformer_model)
+
+    def score(self, resume_embedding: np.ndarray, embeddings: np.ndarray) -> dict:
+        """
+        Score the resume against every listing with vectorized matrix products
+
+        Args:
+            resume_embedding (np.ndarray): Resume embedding of shape (d,) or (1, d)
+            embeddings (np.ndarray): Listing embeddings of shape (M, d)
+
+        Returns:
+            dict: Cosine and soft cosine similarity arrays of shape (M,)
+        """
+        query = np.asarray(resume_embedding, dtype=np.float64).reshape(-1)
+        candidates = np.asarray(embeddings, dtype=np.float64)
+        norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(query)
+        dots = candidates @ query
+        return {
+            "cosine_similarity": np.divide(dots, norms, out=np.zeros_like(dots), where=norms != 0),
+            "soft_cosine_similarity": soft_cosine_similarity_batch(query, candidates),
+        }
+
+    def rank(self, scores: dict, listings: list[dict], top_k: int, metric: str) -> list[dict]:
+        """Returns the top_k listings by the given metric, best first"""
+        values = scores[metric]
+        top_k = min(top_k, values.shape[0])
+        if top_k <= 0:
+            return []
+        top = np.argpartition(-values, top_k - 1)[:top_k]
+        top = top[np.argsort(-values[top])]
+        return [
+            {
+                **listings[row],
+                "cosine_similarity": float(scores["cosine_similarity"][row]),
+                "soft_cosine_similarity": float(scores["soft_cosine_similarity"][row]),
+            }
+            for row in top
+        ]
+
+    @LoggerConfig().log_execution
+    async def process(self, top_k: int = 10, metric: str = "soft_cosine_similarity") -> list[dict]:
+        """
+        Rank the indexed listings against the resume
+
+        Args:
+            top_k (int): Number of listings to return
+            metric (str): "soft_cosine_similarity" or "cosine_similarity"
+
+        Raises:
+            ValueError: If the metric is unknown
+
+        Returns:
+            list[dict]: Listing metadata with both similarity scores, best match first
+        """
+        if metric not in self.ALLOWED_METRICS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {self.ALLOWED_METRICS}")
+        # reads the listings other processes appended to the index
+        embeddings, listings = await asyncio.to_thread(self.index.snapshot)
+        if not listings:
+            return []
+        resume_embedding = await get_micro_batch_encoder(self.transformer_model).encode_documents([self.resume_str])
+        scores = self.score(resume_embedding, embeddings)
+        metrics.observe("listing_index.ranked_listings", len(listings))
+        self.logger.info("Ranked %s indexed listings by %s", len(listings), metric)
+        return self.rank(scores, listings, top_k, metric)
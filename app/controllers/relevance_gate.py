@@ -0,0 +1,179 @@
+"""
+This file contains the pre-LLM relevance gate rejecting obviously irrelevant job listings on raw text
+authors: Erin Hwang
+"""
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+from app.services.embedding import get_micro_batch_encoder
+from app.services.extractor import read_docx_sync, read_pdf_sync
+from app.controllers.threshold_evaluator import soft_cosine_similarity
+
+TRANSFORMER_MODEL = os.getenv("TRANSFORMER_MODEL")
+PRE_GATE_MODE = os.getenv("PRE_GATE_MODE", "off")
+PRE_GATE_THRESHOLD = os.getenv("PRE_GATE_THRESHOLD") or None
+PRE_GATE_MODEL = os.getenv("PRE_GATE_MODEL") or TRANSFORMER_MODEL
+
+ALLOWED_MODES = ("off", "lexical", "embedding")
+# default thresholds are deliberately low: the gate only rejects listings the LLM stages would waste time on
+DEFAULT_THRESHOLDS = {"lexical": 0.05, "embedding": 0.3}
+
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9+#]*(?:[.\-/][a-z0-9+#]+)*")
+STOPWORDS = frozenset("""
+    a about above after all also an and any are as at be been being both but by can could did do does
+    doing down during each few for from further had has have having he her here hers him his how i if in
+    into is it its itself just more most my no nor not now of off on once only or other our ours out over
+    own same she should so some such than that the their theirs them then there these they this those
+    through to too under until up very was we were what when where which while who whom why will with
+    would you your yours etc inc llc ie eg per via within across including using use used work working
+    """.split())
+
+
+class ListingNotRelevant(Exception):
+    """Raised by the relevance gate when the raw listing text scores below the pre-gate threshold"""
+
+    def __init__(self, relevance: dict):
+        super().__init__(f"Relevance pre-gate threshold NOT met: {relevance}")
+        self.relevance = relevance
+
+
+def relevance_gate_models() -> list[str]:
+    """Transformer models used by the relevance gate in the configured mode"""
+    return [PRE_GATE_MODEL] if PRE_GATE_MODE == "embedding" else []
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased content words of a raw text, stopwords and single characters removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+def term_profile(text: str) -> dict[str, float]:
+    """Sublinear (1 + log tf) term weights of a raw text, L2 normalized"""
+    weights = {term: 1.0 + math.log(count) for term, count in Counter(tokenize(text)).items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+def lexical_similarity(profile: dict[str, float], other: dict[str, float]) -> float:
+    """Cosine similarity of two normalized term profiles"""
+    if len(other) < len(profile):
+        profile, other = other, profile
+    return float(sum(weight * other.get(term, 0.0) for term, weight in profile.items()))
+
+def read_raw_text(file_path: str) -> str:
+    """Raw text of an uploaded resume or a scraped listing, no LLM involved"""
+    if Path(file_path).suffix.lower() == ".docx":
+        return read_docx_sync(Path(file_path))
+    return read_pdf_sync(Path(file_path))
+
+
+class ResumeProfileCache:
+    """
+    Raw text and term profile of every uploaded resume, read once per file version
+
+    Args:
+        max_entries (int): Number of resume profiles kept, the oldest is evicted first
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def get(self, resume_path: str) -> dict:
+        """Returns {"text", "terms"} of the resume, re-read when the file changed"""
+        key = f"{resume_path}:{os.path.getmtime(resume_path)}"
+        with self._lock:
+            if key in self._profiles:
+                return self._profiles[key]
+        text = read_raw_text(resume_path)
+        profile = {"text": text, "terms": term_profile(text)}
+        with self._lock:
+            self._profiles[key] = profile
+            while len(self._profiles) > self.max_entries:
+                self._profiles.pop(next(iter(self._profiles)))
+        return profile
+
+resume_profiles = ResumeProfileCache()
+
+
+class RelevanceGateController:
+    """
+    Scores the raw scraped listing against the raw uploaded resume before any listing LLM extraction
+
+    "lexical" compares sublinear term-frequency profiles (microseconds once the texts are read),
+    "embedding" compares the soft cosine similarity of the raw texts embedded by `transformer_model`.
+    Either score is only meant to catch obviously irrelevant listings, so its threshold is separate
+    from (and lower than) the SOFT_COSINE_THRESHOLD of the similarity gate on the extracted content.
+
+    Args:
+        resume_path (str): Path to the uploaded base resume
+        mode (str): "lexical" or "embedding"
+        threshold (float, optional): Minimum score to pass, defaults to PRE_GATE_THRESHOLD or the mode default
+        transformer_model (str): Sentence transformer model of the "embedding" mode
+        profiles (ResumeProfileCache, optional): Resume profile cache, defaults to the process-wide cache
+    """
+
+    def __init__(
+        self,
+        resume_path: str,
+        mode: str = PRE_GATE_MODE,
+        threshold: float | None = PRE_GATE_THRESHOLD,
+        transformer_model: str = PRE_GATE_MODEL,
+        profiles: ResumeProfileCache | None = None,
+    ):
+        if mode not in ALLOWED_MODES[1:]:
+            raise ValueError(f"Unknown relevance gate mode {mode}, expected one of {ALLOWED_MODES[1:]}")
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.resume_path = resume_path
+        self.mode = mode
+        self.threshold = float(threshold) if threshold is not None else DEFAULT_THRESHOLDS[mode]
+        self.transformer_model = transformer_model
+        self.profiles = profiles or resume_profiles
+
+    async def score(self, listing_text: str) -> float:
+        """Relevance score of the raw listing text against the resume profile"""
+        resume = await asyncio.to_thread(self.profiles.get, self.resume_path)
+        if self.mode == "lexical":
+            return lexical_similarity(resume["terms"], term_profile(listing_text))
+        embeddings = await get_micro_batch_encoder(self.transformer_model).encode_documents(
+            [resume["text"], listing_text]
+            )
+        return soft_cosine_similarity(embeddings[0], embeddings[1])
+
+    @LoggerConfig().log_execution
+    async def process(self, listing_pdf: str) -> dict:
+        """
+        Score the scraped listing PDF and reject it when it is below the threshold
+
+        Args:
+            listing_pdf (str): Path to the scraped job listing PDF
+
+        Raises:
+            ListingNotRelevant: If the listing scores below the threshold
+
+        Returns:
+            dict: The relevance score, mode and threshold
+        """
+        start = time.perf_counter()
+        listing_text = await asyncio.to_thread(read_raw_text, listing_pdf)
+        score = await self.score(listing_text)
+        relevance = {"relevance_score": score, "relevance_mode": self.mode, "relevance_threshold": self.threshold}
+
+        metrics.observe("relevance_gate.seconds", time.perf_counter() - start)
+        metrics.observe(f"relevance_gate.{self.mode}_score", score)
+        metrics.increment("relevance_gate.checks")
+        if score < self.threshold:
+            metrics.increment("relevance_gate.rejections")
+        metrics.set_gauge("relevance_gate.rejection_rate", metrics.ratio("relevance_gate.rejections", "relevance_gate.checks"))
+
+        if score < self.threshold:
+            self.logger.info("Relevance pre-gate threshold NOT met:\n\t%s", relevance)
+            raise ListingNotRelevant(relevance)
+        self.logger.info("Relevance pre-gate threshold met:\n\t%s", relevance)
+        return relevance
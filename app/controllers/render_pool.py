@@ -0,0 +1,217 @@
+"""
+This file contains the worker pool rendering resumes and cover letters off the event loop
+authors: Erin Hwang
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+from app.controllers.resume_renderer import ResumeRendererController
+from app.controllers.cl_renderer import CoverLetterRendererController
+
+RENDER_EXECUTOR = os.getenv("RENDER_EXECUTOR", "thread")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+
+def render_resume(kwargs: dict) -> str:
+    """Render a resume, runs on a render worker"""
+    return ResumeRendererController(**kwargs).execute()
+
+def render_cover_letter(kwargs: dict) -> str:
+    """Render a cover letter, runs on a render worker"""
+    return CoverLetterRendererController(**kwargs).execute()
+
+def render_resume_in_memory(kwargs: dict) -> dict:
+    """Render a resume into memory, runs on a render worker"""
+    renderer = ResumeRendererController(**kwargs)
+    return {"filepath": renderer.output_path(), "content": renderer.execute_in_memory()}
+
+def render_cover_letter_in_memory(kwargs: dict) -> dict:
+    """Render a cover letter into memory, runs on a render worker"""
+    renderer = CoverLetterRendererController(**kwargs)
+    return {"filepath": renderer.output_path(), "content": renderer.execute_in_memory()}
+
+def render_each(render, kwargs_list: list[dict]) -> list[dict]:
+    """Render every document of a batch, a failing document does not fail the others"""
+    results = []
+    for kwargs in kwargs_list:
+        try:
+            results.append({"status": "success", "filepath": render(kwargs)})
+        except Exception as e:
+            results.append({"status": "error", "message": str(e)})
+    return results
+
+def render_resume_batch(kwargs_list: list[dict]) -> list[dict]:
+    """Render a batch of resumes, runs on a render worker"""
+    return render_each(render_resume, kwargs_list)
+
+def render_cover_letter_batch(kwargs_list: list[dict]) -> list[dict]:
+    """Render a batch of cover letters, runs on a render worker"""
+    return render_each(render_cover_letter, kwargs_list)
+
+def ping_worker() -> int:
+    """Returns the PID of the worker, used to start the worker processes"""
+    return os.getpid()
+
+
+class RenderPool:
+    """
+    Dedicated pool rendering DOCX documents without blocking the event loop
+
+    python-docx holds the GIL while it patches and serializes the XML, so the "thread" kind keeps the
+    event loop responsive but renders about one document at a time; the "process" kind renders on
+    all cores and every worker process keeps its own compiled templates.
+
+    Args:
+        kind (str): "thread" or "process"
+        workers (int): Number of worker threads or processes
+    """
+    ALLOWED_KINDS = ("thread", "process")
+
+    def __init__(self, kind: str = RENDER_EXECUTOR, workers: int = RENDER_WORKERS):
+        if kind not in self.ALLOWED_KINDS:
+            raise ValueError(f"Unknown render executor {kind}, expected one of {self.ALLOWED_KINDS}")
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.in_flight = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        """The worker pool, created on first access"""
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                        )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+                self.logger.info("Started %s render %s worker(s)", self.workers, self.kind)
+        return self._pool
+
+    def warmup(self) -> None:
+        """Start every worker (blocking)"""
+        if self.kind == "process":
+            pids = {future.result() for future in [self.pool.submit(ping_worker) for _ in range(self.workers)]}
+            self.logger.info("Render worker processes ready: %s", sorted(pids))
+
+    async def submit(self, func, *args):
+        """
+        Run a module-level render function on a worker
+
+        Args:
+            func (Callable): Picklable function, ie render_resume
+            *args: Picklable arguments of `func`
+
+        Returns:
+            The result of `func`
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.in_flight += 1
+        metrics.set_gauge("render.in_flight", self.in_flight)
+        try:
+            return await loop.run_in_executor(self.pool, func, *args)
+        finally:
+            self.in_flight -= 1
+            metrics.set_gauge("render.in_flight", self.in_flight)
+            metrics.observe(f"render.{func.__name__}_seconds", time.perf_counter() - start)
+
+    async def render_resume(self, **kwargs) -> str:
+        """Render a resume, keyword arguments are those of ResumeRendererController"""
+        return await self.submit(render_resume, kwargs)
+
+    async def render_cover_letter(self, **kwargs) -> str:
+        """Render a cover letter, keyword arguments are those of CoverLetterRendererController"""
+        return await self.submit(render_cover_letter, kwargs)
+
+    async def render_resume_in_memory(self, **kwargs) -> dict:
+        """Render a resume without saving it, returns {"filepath" it would be saved to, "content"}"""
+        return await self.submit(render_resume_in_memory, kwargs)
+
+    async def render_cover_letter_in_memory(self, **kwargs) -> dict:
+        """Render a cover letter without saving it, returns {"filepath" it would be saved to, "content"}"""
+        return await self.submit(render_cover_letter_in_memory, kwargs)
+
+    async def render_batch(self, func, kwargs_list: list[dict], template_key: str) -> list[dict]:
+        """
+        Render a batch of documents split in one chunk per worker
+
+        Documents are grouped by template before they are chunked, so a template is compiled at most
+        once per worker and every other document of the chunk only pays for the clone, patch and save.
+
+        Args:
+            func (Callable): render_resume_batch or render_cover_letter_batch
+            kwargs_list (list[dict]): Renderer keyword arguments of every document
+            template_key (str): Keyword argument holding the template path, ie "resume_path"
+
+        Returns:
+            list[dict]: {"status": "success", "filepath"} or {"status": "error", "message"} per document, in order
+        """
+        if not kwargs_list:
+            return []
+        order = sorted(range(len(kwargs_list)), key=lambda i: str(kwargs_list[i][template_key]))
+        chunk_size = math.ceil(len(order) / self.workers)
+        chunks = [order[i:i + chunk_size] for i in range(0, len(order), chunk_size)]
+        chunk_results = await asyncio.gather(
+            *(self.submit(func, [kwargs_list[i] for i in chunk]) for chunk in chunks), return_exceptions=True
+            )
+
+        results = [None] * len(kwargs_list)
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            if isinstance(chunk_result, BaseException):
+                # ie a crashed worker process, only the documents of its chunk fail
+                chunk_result = [{"status": "error", "message": str(chunk_result)}] * len(chunk)
+            for i, result in zip(chunk, chunk_result):
+                results[i] = result
+        errors = sum(result["status"] != "success" for result in results)
+        metrics.observe("render.batch_documents", len(results))
+        metrics.increment("render.batch_errors", errors)
+        self.logger.info("Rendered a batch of %s documents in %s chunks, %s failed", len(results), len(chunks), errors)
+        return results
+
+    async def render_resumes(self, kwargs_list: list[dict]) -> list[dict]:
+        """Render a batch of resumes, see render_batch"""
+        return await self.render_batch(render_resume_batch, kwargs_list, "resume_path")
+
+    async def render_cover_letters(self, kwargs_list: list[dict]) -> list[dict]:
+        """Render a batch of cover letters, see render_batch"""
+        return await self.render_batch(render_cover_letter_batch, kwargs_list, "cl_path")
+
+    def shutdown(self) -> None:
+        """Stop the worker pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def status(self) -> dict:
+        """Configuration and load of the pool"""
+        return {"executor": self.kind, "workers": self.workers, "in_flight": self.in_flight}
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool() -> RenderPool:
+    """Returns the process-wide RenderPool"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = RenderPool()
+        return _render_pool
+
+def shutdown_render_pool() -> None:
+    """Stop the process-wide RenderPool, if started"""
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown()
@@ -4,15 +4,27 @@ authors: Erin Hwang
 """
 import re
 import asyncio
+from typing import Callable
 from app.utils.logger import LoggerConfig
-from langchain.text_splitter import MarkdownHeaderTextSplitter
-from app.services.generator import ChatGPTRequestService
+from app.utils.markdown import MarkdownHeaderSplitter, strip_markdown_fence
+from app.services.generator import ChatGPTRequestService, PROMPT_LAYOUT
+from app.schemas.generation import GeneratedSections
+from app.utils.metrics import metrics
 import os
 
 N_PRIMARY_BULLETS= os.getenv("N_PRIMARY_BULLETS")
 N_SECONDARY_BULLETS= os.getenv("N_SECONDARY_BULLETS")
 N_CORE_WORDS = os.getenv("N_CORE_WORDS")
 N_TECHNICAL_WORDS = os.getenv("N_TECHNICAL_WORDS")
+GENERATION_MODE = os.getenv("GENERATION_MODE", "fan_out")
+BATCHED_PROMPT_NAME = os.getenv("BATCHED_PROMPT_NAME", "resume_sections_batched")
+
+# every "#" header is tracked as "Core Expertise", the first name listed for a separator wins
+RESUME_SPLITTER = MarkdownHeaderSplitter(headers_to_split_on=[
+    ("#", "Core Expertise"), #TODO: bring it to config file?
+    ("#", "Technical Snapshot"),
+    ("##", "Professional Experience")
+    ], strip_headers=False)
 
 class ResumeGeneratorController:
     """
@@ -21,40 +33,55 @@ class ResumeGeneratorController:
     Args:
         resume_data (str): The base resume data to generate the resume from
         job_data (str): The job descriptions to generate the resume from
+        prompt_layout (str): Prompt layout passed to ChatGPTRequestService ("default" or "prefix_cached")
+        generation_mode (str): "fan_out" issues one LLM call per section; "batched" asks for every
+            section in a single JSON schema call and falls back on individual calls per section
+        on_section (Callable, optional): Called as on_section(section_name, content) as soon as each section
+            is generated, ie to stream the sections before the whole resume is ready
     """
+    ALLOWED_GENERATION_MODES = {"fan_out", "batched"}
+    BATCHED_SECTION_HEADERS = {
+        "core_expertise": "# Core Expertise",
+        "technical_snapshot": "# Technical Snapshot",
+        "professional_experience": "# Professional Experience",
+        }
 
-    def __init__(self, resume_data: str, job_data: str):
+    def __init__(
+            self, resume_data: str, job_data: str, prompt_layout: str = PROMPT_LAYOUT,
+            generation_mode: str = GENERATION_MODE, on_section: Callable | None = None
+            ):
         self.logger = LoggerConfig().get_logger(__name__)
+        self.prompt_layout = prompt_layout
+        if generation_mode not in self.ALLOWED_GENERATION_MODES:
+            raise ValueError(f"Invalid generation mode: {generation_mode}")
+        self.generation_mode = generation_mode
         self.resume_data = self.cleanse_text(resume_data)
         self.job_data = self.cleanse_text(job_data)
-        self.splitter =  MarkdownHeaderTextSplitter(headers_to_split_on=[
-            ("#", "Core Expertise"), #TODO: bring it to config file?
-            ("#", "Technical Snapshot"),
-            ("##", "Professional Experience")
-            ], strip_headers=False)
+        self.splitter = RESUME_SPLITTER
+        self.on_section = on_section
 
     def cleanse_text(self, text: str):
         """Cleanse the markdown prefix and suffix text"""
-        return text.replace("```markdown", "").replace("```", "").strip()
+        return strip_markdown_fence(text)
 
     def split_md_text(self):
         """Split the markdown text into sections"""
         sections = self.splitter.split_text(self.resume_data)
         results = {}
-        for section in sections:
-            if section.page_content.startswith("# Professional Summary"):
-                results["professional_summary"] = section.page_content
-            elif section.page_content.startswith("# Core Expertise"):
-                results["core_expertise"] = section.page_content
-            elif section.page_content.startswith("# Technical Snapshot"):
-                results["technical_snapshot"] = section.page_content
+        for section, _ in sections:
+            if section.startswith("# Professional Summary"):
+                results["professional_summary"] = section
+            elif section.startswith("# Core Expertise"):
+                results["core_expertise"] = section
+            elif section.startswith("# Technical Snapshot"):
+                results["technical_snapshot"] = section
             # elif section.page_content.__contains__("## Independent AI Engineer"):
             #     results["independent_experience"] = section.page_content
             else:
                 if "professional_experience" not in results:
-                    results['professional_experience'] = [section.page_content]
+                    results['professional_experience'] = [section]
                 else:
-                    results["professional_experience"].append(section.page_content)
+                    results["professional_experience"].append(section)
         professional_data = '\n\n'.join(results["professional_experience"])
         return results, professional_data
 
@@ -68,17 +95,18 @@ class ResumeGeneratorController:
             self.logger.error("Title not found in resume text")
             raise ValueError("Title not found in resume text")
 
-    @LoggerConfig().log_execution
-    async def generate_content(self):
-        """Execute resume generation process"""
+    def build_section_requests(self):
+        """
+        Build the generation request of every resume section
+
+        Returns:
+            dict: task name (section name or position title) -> (prompt name, prompt kwargs)
+        """
         resume_sections, professional_data = self.split_md_text()
-        tasks = {}
+        requests = {}
 
-        #start the async generations here
         for prompt_name, base_section in resume_sections.items():
             #define prompt kwargs here
-            service = ChatGPTRequestService(prompt_name = prompt_name)
-
             if prompt_name in ["core_expertise", "technical_snapshot"]:
                 n_words = N_CORE_WORDS if prompt_name == "core_expertise" else N_TECHNICAL_WORDS
                 kwargs = {
@@ -87,7 +115,7 @@ class ResumeGeneratorController:
                     "base_section": base_section,
                     "n_words": n_words
                     }
-                tasks[prompt_name] = asyncio.create_task(service.send_request(**kwargs))
+                requests[prompt_name] = (prompt_name, kwargs)
 
             elif prompt_name == "professional_summary":
                 kwargs = {
@@ -95,7 +123,7 @@ class ResumeGeneratorController:
                     "professional_data": professional_data,
                     "base_section": base_section
                 }
-                tasks[prompt_name] = asyncio.create_task(service.send_request(**kwargs))
+                requests[prompt_name] = (prompt_name, kwargs)
 
             elif prompt_name == "professional_experience":
                 # iterate over each section in professional experience
@@ -113,14 +141,17 @@ class ResumeGeneratorController:
                         "base_section": exp_section,
                         "n_bullets": n_bullets
                     }
-                    tasks[task_name] = asyncio.create_task(service.send_request(**kwargs))
+                    if self.prompt_layout == "prefix_cached":
+                        # the shared prefix carries the entire professional experience
+                        kwargs["professional_data"] = professional_data
+                    requests[task_name] = (prompt_name, kwargs)
 
             # elif prompt_name == "independent_experience":
             #     kwargs = {
             #         "n_bullets": "2",
             #         "base_section": base_section
             #     }
-            #     tasks[prompt_name] = asyncio.create_task(service.send_request(**kwargs))
+            #     requests[prompt_name] = (prompt_name, kwargs)
 
             else:
                 self.logger.error(
@@ -130,12 +161,145 @@ class ResumeGeneratorController:
                     )
                 raise ValueError("Prompt name %s not found", prompt_name)
 
-            self.logger.info("Creating generation task for %s", prompt_name)
+        return requests
+
+    async def generate_section(self, prompt_name: str, kwargs: dict):
+        """Generate a single section with its own LLM call"""
+        service = ChatGPTRequestService(prompt_name = prompt_name, prompt_layout = self.prompt_layout)
+        return await service.send_request(**kwargs)
+
+    def report_section(self, task_name: str, content: str) -> str:
+        """Forward a generated section to the on_section hook"""
+        if self.on_section is not None:
+            self.on_section(task_name, content)
+        return content
+
+    async def generate_reported_section(self, task_name: str, prompt_name: str, kwargs: dict):
+        """Generate a single section and report it as soon as it is ready"""
+        return self.report_section(task_name, await self.generate_section(prompt_name, kwargs))
+
+    async def generate_fan_out(self, requests: dict):
+        """Generate every section concurrently, one LLM call per section"""
+        tasks = {}
+
+        #start the async generations here
+        for task_name, (prompt_name, kwargs) in requests.items():
+            tasks[task_name] = asyncio.create_task(self.generate_reported_section(task_name, prompt_name, kwargs))
+            self.logger.info("Creating generation task for %s", task_name)
 
         responses = await asyncio.gather(*tasks.values())
         results = {section: result for section, result in zip(tasks.keys(),responses)}
         return results
 
+    def format_batched_sections(self, requests: dict):
+        """Render the per-section variables of every request for the batched prompt"""
+        blocks = []
+        for task_name, (prompt_name, kwargs) in requests.items():
+            lines = [f"### {task_name}", f"- type: {prompt_name}"]
+            if "n_words" in kwargs:
+                lines.append(f"- n_words: {kwargs['n_words']}")
+            if "n_bullets" in kwargs:
+                lines.append(f"- n_bullets: {kwargs['n_bullets']}")
+            lines.append(f"- baseline:\n{kwargs['base_section']}")
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
+
+    def validate_batched_section(self, prompt_name: str, content: str | None):
+        """
+        Validate a section returned by the batched call against the shape ResumeRendererController expects
+
+        Returns:
+            bool: True if the content can be rendered as is
+        """
+        if not content or not content.strip():
+            return False
+        lines = [line.strip() for line in self.cleanse_text(content).split("\n") if line.strip()]
+
+        if prompt_name in self.BATCHED_SECTION_HEADERS:
+            header = self.BATCHED_SECTION_HEADERS[prompt_name]
+            if header not in lines:
+                return False
+            body = lines[lines.index(header) + 1:]
+            if prompt_name == "professional_experience":
+                # a high level sentence followed by at least one bullet point
+                bullets = [line for line in body[1:] if line.startswith(("- ", "* "))]
+                return len(body) >= 2 and not body[0].startswith("#") and len(bullets) >= 1
+            return len(body) >= 1 and not body[0].startswith("#")
+        # the professional summary may or may not echo its header
+        return any(not line.startswith("#") for line in lines)
+
+    async def generate_batched(self, requests: dict):
+        """
+        Generate every section with a single structured LLM call
+
+        Sections that are missing from the response or fail validation fall back on their own
+        fan-out call, so the returned dict always has the same keys (and order) as generate_fan_out
+        """
+        professional_data = next(
+            (kwargs["professional_data"] for _, kwargs in requests.values() if "professional_data" in kwargs), ""
+            )
+        service = ChatGPTRequestService(prompt_name = BATCHED_PROMPT_NAME, prompt_layout = "default")
+        batched = {}
+        try:
+            response = await service.send_structured_request(
+                GeneratedSections,
+                job_data = self.job_data,
+                professional_data = professional_data,
+                sections = self.format_batched_sections(requests),
+                )
+            batched = {section.name.strip(): section.content for section in response.sections}
+        except Exception as e:
+            self.logger.error("Batched generation failed, falling back on individual calls: %s", e)
+
+        results = {}
+        fallback = {}
+        for task_name, (prompt_name, kwargs) in requests.items():
+            content = batched.get(task_name)
+            if self.validate_batched_section(prompt_name, content):
+                results[task_name] = self.report_section(task_name, self.cleanse_text(content))
+            else:
+                self.logger.info("Batched output for %s failed validation - using an individual call", task_name)
+                fallback[task_name] = asyncio.create_task(self.generate_reported_section(task_name, prompt_name, kwargs))
+
+        metrics.increment("generation.batched_sections", len(results))
+        metrics.increment("generation.batched_fallbacks", len(fallback))
+        fallback_responses = await asyncio.gather(*fallback.values())
+        results.update(zip(fallback.keys(), fallback_responses))
+        return {task_name: results[task_name] for task_name in requests}
+
+    @LoggerConfig().log_execution
+    async def generate_content(self):
+        """Execute resume generation process"""
+        requests = self.build_section_requests()
+        if self.generation_mode == "batched":
+            return await self.generate_batched(requests)
+        return await self.generate_fan_out(requests)
+
+    @LoggerConfig().log_execution
+    async def regenerate_sections(self, section_names: list[str]):
+        """
+        Regenerate only the named sections
+
+        Args:
+            section_names (list[str]): Section names or position titles, as keyed by generate_content
+
+        Raises:
+            ValueError: If a section name is not part of the resume
+
+        Returns:
+            dict: The regenerated sections keyed like generate_content
+        """
+        requests = self.build_section_requests()
+        unknown_sections = [name for name in section_names if name not in requests]
+        if unknown_sections:
+            self.logger.error("Unknown section(s) %s - available sections are %s", unknown_sections, list(requests))
+            raise ValueError(f"Unknown section(s) {unknown_sections}. Available sections are: {list(requests)}")
+
+        selected = {name: request for name, request in requests.items() if name in section_names}
+        if self.generation_mode == "batched" and len(selected) > 1:
+            return await self.generate_batched(selected)
+        return await self.generate_fan_out(selected)
+
     # 1: Core Expertise
         # full job_data
         # entire professional experience
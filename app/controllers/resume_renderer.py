@@ -4,50 +4,91 @@ authors: Erin Hwang
 """
 
 from app.utils.logger import LoggerConfig
-from langchain.text_splitter import MarkdownHeaderTextSplitter
+from app.utils.markdown import MarkdownHeaderSplitter, strip_markdown_fence
 from docx import Document
+from app.utils.placeholder_tokenizer import substitute_placeholders
+from app.services.docx_template import KEYWORD_PATTERNS, RENDER_BACKEND, CompiledDocxTemplate, get_compiled_template
 import re
 import json
 import os
+from io import BytesIO
 
 GENERATED_RESUME_PATH = os.getenv("GENERATED_RESUME_PATH")
 
+KEYWORD_SPLITTER = MarkdownHeaderSplitter(headers_to_split_on=[("#", "keywords"),], strip_headers=True)
+CL_KEYWORD_SPLITTER = MarkdownHeaderSplitter(headers_to_split_on=[("#", "header"),], strip_headers=False)
+
 #needs to read in docx file pertaining to UUID in main.py
 
+class ResumeRenderPlan:
+    """
+    Every edit of a resume render, computed from the compiled template before the document is touched
+
+    Paragraph edits (placeholders, summary run, keyword lines) are keyed by template paragraph and applied
+    in document order. Professional experiences are applied afterwards, in order, because every one of
+    them removes paragraphs and shifts the paragraphs after it.
+
+    Args:
+        template (CompiledDocxTemplate): Compiled base resume
+        cl_keywords (dict): Placeholder values returned by ResumeRendererController.align_text
+        cleansed_content (dict): Generated content returned by ResumeRendererController.cleanse_generated_content
+
+    Raises:
+        ValueError: If the template has no line for one of the keyword sections
+    """
+
+    def __init__(self, template: CompiledDocxTemplate, cl_keywords: dict, cleansed_content: dict):
+        self.paragraph_edits = {}
+        for i_par in template.placeholder_paragraphs:
+            self.add_edit(i_par, "placeholders", cl_keywords)
+        if template.summary_run is not None:
+            i_par, i_run = template.summary_run
+            self.add_edit(i_par, "summary", (i_run, cleansed_content["professional_summary"]))
+        for section_name in KEYWORD_PATTERNS:
+            i_par = template.keyword_lines[section_name]
+            if i_par is None:
+                raise ValueError(f"Could not find {section_name} section in the base resume")
+            self.add_edit(i_par, "keywords", (section_name, cleansed_content[section_name]))
+
+        titles = [name for name in cleansed_content if ' ' in name]
+        #TODO: high priority to edit if other people want to use this app
+        next_titles = titles[1:] + ["Education"]
+        self.experiences = [
+            (title, next_title, cleansed_content[title]["upper"], cleansed_content[title]["lower"])
+            for title, next_title in zip(titles, next_titles)
+            ]
+
+    def add_edit(self, i_par: int, kind: str, payload) -> None:
+        """Queue an edit of template paragraph `i_par`"""
+        self.paragraph_edits.setdefault(i_par, []).append((kind, payload))
+
+
 class ResumeRendererController:
-    ALLOWED_SECTIONS = {
-        "core_expertise": r"(Core Expertise: )(.*)",
-        "technical_snapshot": r"(Technical Snapshot: )(.*)",
-        }
-
-    pattern = r"\[[^\[\]]*\]"
-    start_pattern = r"\[(?![^\[\]]*\])[^]]*$"
-    end_pattern = r"^(?!.*?\[[^\[\]]*\]).*?\]"
-    middle_pattern = r"^[^\[\]]*$"
+    ALLOWED_SECTIONS = KEYWORD_PATTERNS
     """
     Render a resume from a template and extracted content
 
     Args:
         resume_path (str): Path to base resume
         extracted_content (str): Generated content from ResumeGeneratorController
+        render_backend (str): "python-docx" or "ooxml", see CompiledDocxTemplate
 
     Returns:
         #TODO: figure this out
     """
 
-    def __init__(self, resume_path: str, generated_content: dict, source_name:str, md_info: str):
+    def __init__(
+            self, resume_path: str, generated_content: dict, source_name:str, md_info: str,
+            render_backend: str = RENDER_BACKEND
+            ):
         self.logger = LoggerConfig().get_logger(__name__)
+        self.render_backend = render_backend
         self.source_name = source_name
         self.data_dir = GENERATED_RESUME_PATH
         self.resume_path = resume_path
         self.generated_content = generated_content
-        self.keyword_splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on=[("#", "keywords"),],
-            strip_headers=True)
-
-        self.cl_keyword_splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on=[("#", "header"),],
-            strip_headers=False)
+        self.keyword_splitter = KEYWORD_SPLITTER
+        self.cl_keyword_splitter = CL_KEYWORD_SPLITTER
 
         self.md_info = md_info
 
@@ -55,10 +96,10 @@ class ResumeRendererController:
         """Cleanse the markdown prefix and suffix text"""
         final = {}
         keys = ["[CompanyName]", "[CityState]", "[PositionName]"]
-        cleansed_text = self.md_info.replace("```markdown", "").replace("```", "").strip()
+        cleansed_text = strip_markdown_fence(self.md_info)
         splits = self.cl_keyword_splitter.split_text(cleansed_text)
         assert len(splits) == 3, "Cover letter md output does not contain 3 headers"
-        keywords = [each.metadata["header"] for each in splits]
+        keywords = [metadata["header"] for _, metadata in splits]
 
         for each in list(zip(keys, keywords)):
             if "Not Available" in each[1]:
@@ -69,34 +110,32 @@ class ResumeRendererController:
 
     def cleanse_text(self, text: str):
         """Cleanse the markdown prefix and suffix text"""
-        cleansed_text = text.replace("```markdown", "").replace("```", "").strip()
+        cleansed_text = strip_markdown_fence(text)
         split_text = self.keyword_splitter.split_text(cleansed_text)
-        return split_text[0].page_content
-
-    def find_placement(self, doc: Document, section_name: str):
-        """Find the index of the specified section in the resume"""
-        curr = 0
-        paragraph_found = False
-        while not paragraph_found:
-            if section_name in doc.paragraphs[curr].text:
-                paragraph_found = True
-            curr += 1
-        return curr
-
-    def render_position_sentence(self, doc: Document, curr: int, new_text: str):
-        for i, run in enumerate(doc.paragraphs[curr].runs):
+        return split_text[0][0]
+
+    def find_placement(self, paragraph_texts: list[str], section_name: str):
+        """Find the index of the paragraph following the specified section in the resume"""
+        for curr, text in enumerate(paragraph_texts):
+            if section_name in text:
+                return curr + 1
+        self.logger.error(f"Could not find {section_name} section in the base resume")
+        raise ValueError(f"Could not find {section_name} section in the base resume")
+
+    def render_position_sentence(self, paragraph, new_text: str):
+        for i, run in enumerate(paragraph.runs):
             if i == 0:
                 run.text = new_text
             else:
                 run.text = ""
 
-    def render_keywords(self, doc: Document, section_name: str, new_text: str):
-        """Render the keywords section of the resume"""
+    def render_keywords(self, paragraphs, section_name: str, new_text: str):
+        """Render the keywords section of the resume in the first of `paragraphs` holding it"""
         if section_name not in self.ALLOWED_SECTIONS:
             self.logger.error(f"Invalid driver: {section_name}")
             raise ValueError(f"Invalid driver: {section_name}")
 
-        for paragraph in doc.paragraphs:
+        for paragraph in paragraphs:
             # create full text of the paragraph
             full_text = "".join([run.text for run in paragraph.runs])
 
@@ -125,23 +164,28 @@ class ResumeRendererController:
         self.logger.error(f"Could not find {section_name} section in the base resume")
         raise ValueError(f"Could not find {section_name} section in the base resume")
 
-    # TODO: find correct type for paragraph
     def return_indices_to_remove(
-            self, placement: int, paragraphs, alignment_indicator: str, next_section_name: str
+            self, placement: int, paragraph_texts: list[str], alignments: list[str], alignment_indicator: str,
+            next_section_name: str
             ):
         """Returns paragraph indices to remove based on alignment type within the job specific section"""
         removal_indices = []
-        for i in range(placement, len(paragraphs)):
-            if next_section_name in paragraphs[i].text:
+        for i in range(placement, len(paragraph_texts)):
+            if next_section_name in paragraph_texts[i]:
                 return removal_indices
-            if paragraphs[i].alignment.__str__() == alignment_indicator:
+            if alignments[i] == alignment_indicator:
                 removal_indices.append(i)
+        self.logger.error(f"Could not find {next_section_name} section in the base resume")
+        raise ValueError(f"Could not find {next_section_name} section in the base resume")
 
     # TODO: find correct type for paragraph
-    def remove_paragraphs(self, paragraphs, removal_indices: list):
+    def remove_paragraphs(self, paragraphs: list, removal_indices: list, *aligned_lists: list):
+        """Remove the paragraphs from the document and the same indices from the lists aligned with `paragraphs`"""
         for idx in reversed(removal_indices):
             p = paragraphs[idx]._element
             p.getparent().remove(p)
+            for values in (paragraphs, *aligned_lists):
+                del values[idx]
 
     #TODO: find correct type for paragraph and reference_run
     def overwrite_runs_with_text(self, paragraph, new_text:str, reference_run):
@@ -209,36 +253,39 @@ class ResumeRendererController:
                 self.logger.info(f"\tSkipping paragraph at index {idx_par}; alignment is None. Not a bullet paragraph.")
 
     def render_professional_experience(
-            self, doc: Document, current_section_name: str, next_section_name: str,
-            upper: str, lower: list
+            self, paragraphs: list, paragraph_texts: list[str], alignments: list[str], current_section_name: str,
+            next_section_name: str, upper: str, lower: list
             ):
-        """Renders a single professional experience using the LLM-generated content"""
+        """
+        Renders a single professional experience using the LLM-generated content
+
+        `paragraphs`, `paragraph_texts` and `alignments` describe the current body and are kept in sync
+        with every removal, so no step has to walk the document again.
+        """
         #1: high level sentence rendering
-        upper_placement = self.find_placement(doc, current_section_name)
-        self.render_position_sentence(doc, upper_placement, upper)
+        upper_placement = self.find_placement(paragraph_texts, current_section_name)
+        self.render_position_sentence(paragraphs[upper_placement], upper)
+        paragraph_texts[upper_placement] = paragraphs[upper_placement].text
         self.logger.info(f"\tRendered high level sentence for position title: {current_section_name}")
 
         #2: bullet point rendering
-        all_paragraphs = doc.paragraphs
         x = len(lower) #number of bullet points paragraphs to overwrite
 
         #2.1 find the indices to remove (strict) then execute removal
         strict_removal_indices = self.return_indices_to_remove(
-            upper_placement + 1, all_paragraphs, "None", next_section_name
+            upper_placement + 1, paragraph_texts, alignments, "None", next_section_name
             )
-        self.remove_paragraphs(all_paragraphs, strict_removal_indices)
-        all_paragraphs = doc.paragraphs
+        self.remove_paragraphs(paragraphs, strict_removal_indices, paragraph_texts, alignments)
 
         #2.2find indices to remove that are bullet points then only keep the first x
         removal_indices = self.return_indices_to_remove(
-            upper_placement + 1, all_paragraphs, "LEFT (0)", next_section_name
+            upper_placement + 1, paragraph_texts, alignments, "LEFT (0)", next_section_name
             )
         keep_count = min(x, len(removal_indices))
         indices_to_keep = removal_indices[:keep_count] #keep the first x from starting upper placement
         indices_to_remove = [idx for idx in removal_indices[keep_count:]] #delete the rest up until the next section
 
-        self.remove_paragraphs(all_paragraphs, indices_to_remove)
-        all_paragraphs = doc.paragraphs
+        self.remove_paragraphs(paragraphs, indices_to_remove, paragraph_texts, alignments)
         self.logger.info(
             "\tSuccessfully removed %s bullet points for position title: %s",
             len(indices_to_remove),
@@ -246,138 +293,93 @@ class ResumeRendererController:
             )
 
         #2.3 now overwrite the runs that were left out from above
-        self.overwrite_entire_section(indices_to_keep, all_paragraphs, lower)
+        self.overwrite_entire_section(indices_to_keep, paragraphs, lower)
+        for idx in indices_to_keep:
+            paragraph_texts[idx] = paragraphs[idx].text
         self.logger.info(
             "\tRendered %s bullet points for position title: %s", str(x), current_section_name
             )
 
     def edit_paragraphs(self, all_paragraphs, i_edit_list: list[int], content_dict: dict):
-        cleansed_content = content_dict
+        """Replace the [Placeholder] values of the listed paragraphs, including the ones split across runs"""
+        # the resume only ever restyled single-run placeholders, the runs of split ones keep their own font
         for i_par_edit in i_edit_list:
-            # print(i_par_edit)
-            par = all_paragraphs[i_par_edit]
-            # print(f"Paragraph {i_par} text:\n{par.text}\n-Here are the runs:")
-
-            full_matches = []
-            start_matches = []
-            end_matches = []
-            middle_matches = []
-
-
-
-            for i_run, run in enumerate(par.runs):
-                # print(run.text)
-                full_match = [(i_run, val) for val in re.findall(self.pattern, run.text)]
-                full_matches.extend(full_match)
-                start_match =  [(i_run, val) for val in re.findall(self.start_pattern, run.text)]
-                start_matches.extend(start_match)
-                end_match =  [(i_run, val) for val in re.findall(self.end_pattern, run.text)]
-                end_matches.extend(end_match)
-                if full_match or start_match:
-                    middle_match = [(i_run, val) for val in re.findall(self.middle_pattern, run.text)]
-                    middle_matches.extend(middle_match)
-
-            if full_matches:
-                # print("here")
-                # print(full_matches)
-                for each_full_match in full_matches:
-                    # print(each_full_match[0])
-                    all_paragraphs[i_par_edit].runs[each_full_match[0]].text = all_paragraphs[i_par_edit].runs[each_full_match[0]].text.replace(each_full_match[1], cleansed_content[each_full_match[1]])
-                    all_paragraphs[i_par_edit].runs[each_full_match[0]].font.name = "Calibri"
-                    all_paragraphs[i_par_edit].runs[each_full_match[0]].font.size = 133350
-
-            if start_matches:
-                assert len(start_matches) == len(end_matches)
-
-                i_curr = 0
-                for start, end in zip(start_matches, end_matches):
-
-                    i_start = start[0]
-                    val_start = start[1]
-
-                    i_end = end[0]
-                    val_end = end[1]
-
-                    curr_middle_match = None if len(middle_matches) == 0 else middle_matches[i_curr]
-
-                    if i_end - i_start >= 2:
-                        assert curr_middle_match is not None
-                        determined_term = val_start + curr_middle_match[1] + val_end
-                        all_paragraphs[i_par_edit].runs[curr_middle_match[0]].text = all_paragraphs[i_par_edit].runs[curr_middle_match[0]].text.replace(curr_middle_match[1], "")
-
-                        all_paragraphs[i_par_edit].runs[curr_middle_match[0]].font.name = "Calibri"
-                        all_paragraphs[i_par_edit].runs[curr_middle_match[0]].font.size = 133350
-                    else:
-                        assert curr_middle_match is None
-                        determined_term = val_start + val_end
-
-                    # for
-                    i_curr += 1
-
-                    #replacing at the run where [ is first found
-                    all_paragraphs[i_par_edit].runs[i_start].text = all_paragraphs[i_par_edit].runs[i_start].text.replace(val_start, cleansed_content[determined_term])
-                    # all_paragraphs[i_par_edit].runs[each_full_match[0]].font.name = "Calibri"
-                    # all_paragraphs[i_par_edit].runs[each_full_match[0]].font.size = 133350
-
-                    #replace at the run where ] is found
-                    all_paragraphs[i_par_edit].runs[i_end].text = all_paragraphs[i_par_edit].runs[i_end].text.replace(val_end, "")
-                    # all_paragraphs[i_par_edit].runs[each_full_match[0]].font.name = "Calibri"
-                    # all_paragraphs[i_par_edit].runs[each_full_match[0]].font.size = 133350
-
-    def render_summary(self, doc: Document, summary_str: str):
-        #find the run that contains the text
-        for i_par, paragraph in enumerate(doc.paragraphs):
-            for i_run, run in enumerate(paragraph.runs):
-                # TODO: must be changed if other want to use it - high priority
-                if run.text.__contains__("As a multitalented Data Scientist"):
-                    #overwrite the run text with summary str
-                    doc.paragraphs[i_par].runs[i_run].text = summary_str
-                    return
-
+            substitute_placeholders(all_paragraphs[i_par_edit].runs, content_dict, style_split_runs=False)
+
+    def render_summary(self, paragraph, i_run: int, summary_str: str):
+        """Overwrite the summary run located by the compiled template"""
+        paragraph.runs[i_run].text = summary_str
+
+    def render(self, doc: Document, template: CompiledDocxTemplate, plan: ResumeRenderPlan):
+        """
+        Apply the render plan to a clone of the template
+
+        The body is walked once: the paragraph edits are dispatched in document order, then every
+        professional experience is located and rewritten on the cached paragraph texts and alignments.
+
+        Args:
+            doc (Document): Clone of the compiled template
+            template (CompiledDocxTemplate): Compiled base resume
+            plan (ResumeRenderPlan): Edits of this render
+        """
+        paragraphs = doc.paragraphs
+        paragraph_texts = list(template.paragraph_texts)
+        alignments = list(template.alignments)
+
+        for i_par in sorted(plan.paragraph_edits):
+            for kind, payload in plan.paragraph_edits[i_par]:
+                if kind == "placeholders":
+                    #replace [Keywords] with the actual keyword
+                    self.edit_paragraphs(paragraphs, [i_par], payload)
+                elif kind == "summary":
+                    self.render_summary(paragraphs[i_par], *payload)
+                else:
+                    self.render_keywords([paragraphs[i_par]], *payload)
+            paragraph_texts[i_par] = paragraphs[i_par].text
+        self.logger.info("Keywords, summary and placeholders have been rendered")
 
-    @LoggerConfig().log_execution
-    def execute(self):
-        """Execute resume rendering process"""
-        cleansed_cl_keywords = self.align_text()
+        self.logger.info("Rendering the professional experience...")
+        for curr_section, next_section, upper, lower in plan.experiences:
+            self.render_professional_experience(
+                paragraphs, paragraph_texts, alignments, curr_section, next_section, upper, lower
+                )
 
-        doc = Document(self.resume_path)
-        #replace [Keywords] with the actual keyword
-        i_pars_to_edit = [i_par for i_par, par in enumerate(doc.paragraphs) if par.text.__contains__("[")]
-        self.edit_paragraphs(doc.paragraphs, i_pars_to_edit, cleansed_cl_keywords)
-        self.logger.info("Keywords have been rendered")
+    def output_path(self) -> str:
+        """Path the rendered resume is saved to"""
+        return f"{self.data_dir}/{self.source_name}.docx" #ERIN
 
+    def render_document(self) -> tuple[CompiledDocxTemplate, Document]:
+        """Render the resume into a clone of the compiled template, returns the template and the clone"""
+        cleansed_cl_keywords = self.align_text()
         cleansed_content = self.cleanse_generated_content()
-        previous_titles = [name for name in list(cleansed_content) if ' ' in name]
-        #add render professional summary here
-        self.render_summary(doc, cleansed_content["professional_summary"])
-        self.render_keywords(doc, "core_expertise", cleansed_content["core_expertise"])
-        self.render_keywords(doc, "technical_snapshot", cleansed_content["technical_snapshot"])
 
-        self.logger.info("Rendering the professional experience...")
+        # the template is parsed and indexed once, every render patches a clone of it
+        template = get_compiled_template(self.resume_path)
+        plan = ResumeRenderPlan(template, cleansed_cl_keywords, cleansed_content)
+        doc = template.clone(self.render_backend)
+        self.render(doc, template, plan)
+        return template, doc
 
-        i_curr = 0
-        while i_curr < len(previous_titles):
-            i_next = i_curr + 1
-            #retrieving section names to set up renderer
-            curr_section = previous_titles[i_curr]
-            #TODO: high priority to edit if other people want to use this app
-            next_section = previous_titles[i_next] if i_next != len(previous_titles) else "Education"
-
-            #retrieve the generated high-level description of job title A
-            upper = cleansed_content[curr_section]["upper"]
-            #retrieve the generated bullet points of job title A
-            lower = cleansed_content[curr_section]["lower"]
-            self.render_professional_experience(doc, curr_section, next_section, upper, lower)
-            i_curr += 1
-
-        # self.render_professional_experience(doc, curr_section, next_section, upper, lower)
-        docx_fp_str = f"{self.data_dir}/{self.source_name}.docx" #ERIN
+    @LoggerConfig().log_execution
+    def execute(self):
+        """Execute resume rendering process"""
+        template, doc = self.render_document()
+        docx_fp_str = self.output_path()
         docx_fp = os.path.abspath(docx_fp_str)
-        doc.save(docx_fp)
+        template.save(doc, docx_fp, self.render_backend)
         self.logger.info(f"Resume rendered successfully at: {docx_fp}")
 
         return docx_fp_str
 
+    @LoggerConfig().log_execution
+    def execute_in_memory(self) -> bytes:
+        """Execute resume rendering process without touching the disk, returns the DOCX content"""
+        template, doc = self.render_document()
+        buffer = BytesIO()
+        template.save(doc, buffer, self.render_backend)
+        self.logger.info(f"Resume rendered successfully in memory ({buffer.tell()} bytes)")
+        return buffer.getvalue()
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""
+This file contains the controller running a queued /scrape job and the warmup shared by the API and worker processes
+authors: Erin Hwang
+"""
+import asyncio
+import os
+
+from app.utils.logger import LoggerConfig
+from app.controllers.scrape_pipeline import ScrapePipelineController, SimilarityThresholdNotMet
+from app.controllers.relevance_gate import ListingNotRelevant, relevance_gate_models
+from app.controllers.threshold_evaluator import SpeculativeGenerationPolicy, similarity_models
+from app.controllers.render_pool import get_render_pool
+from app.services.embedding import get_embedding_executor, get_embedding_service
+from app.services.listing_index import LISTING_INDEX_MODEL, get_listing_index
+
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "true").lower() == "true"
+SCRAPE_JOB = "scrape"
+
+
+def load_stores(model_names: list[str]) -> None:
+    """Read the embedding cache of every model and the listing index from disk (blocking)"""
+    for model_name in model_names:
+        # the embedding service opens the embedding store of its model
+        get_embedding_service(model_name)
+    get_listing_index(LISTING_INDEX_MODEL)
+
+async def warmup_workers() -> None:
+    """Start the render workers, load the on-disk stores, load and warm up the embedding workers of every model the pipeline uses"""
+    logger = LoggerConfig().get_logger(__name__)
+    await asyncio.to_thread(get_render_pool().warmup)
+    # the stores are loaded on first use, which would otherwise block the event loop of the first request
+    await asyncio.to_thread(
+        load_stores, list(dict.fromkeys(similarity_models() + relevance_gate_models() + [LISTING_INDEX_MODEL]))
+        )
+    if EMBEDDING_WARMUP:
+        for model_name in dict.fromkeys(similarity_models() + relevance_gate_models()):
+            try:
+                await asyncio.to_thread(get_embedding_executor(model_name).warmup)
+            except Exception as e:
+                logger.error(f"Embedding model {model_name} warmup failed: {str(e)}")
+
+
+class ScrapeJobController:
+    """
+    Runs the /scrape workflow of a queued job and records its stage progress
+
+    The result has the shape of the /scrape response, plus the run state so the API process can
+    register the run for /regenerate and /render-batch even when another process ran the job.
+
+    Args:
+        payload (dict): The /scrape arguments: url, resumate_uuid, resume_path, company_name, job_title,
+            job_id, cl_path and contact_name
+        progress (dict): Job progress updated in place, stage name -> "started", "completed", "cached" or "failed"
+        speculation_policy (SpeculativeGenerationPolicy, optional): Decides if generation may start before the gate
+    """
+
+    def __init__(self, payload: dict, progress: dict, speculation_policy: SpeculativeGenerationPolicy | None = None):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.payload = payload
+        self.progress = progress
+        self.progress.setdefault("stages", {})
+        self.speculation_policy = speculation_policy
+
+    def on_event(self, event: str, stage_name: str, payload=None) -> None:
+        """Pipeline event hook recording the stage progress"""
+        self.progress["stages"][stage_name] = event.removeprefix("stage_")
+
+    @LoggerConfig().log_execution
+    async def process(self) -> dict:
+        """
+        Execute the queued /scrape job
+
+        Returns:
+            dict: The /scrape response and the run state
+        """
+        payload = self.payload
+        pipeline = ScrapePipelineController(
+            url = payload["url"],
+            resume_path = payload["resume_path"],
+            company_name = payload["company_name"],
+            job_title = payload["job_title"],
+            job_id = payload["job_id"],
+            cl_path = payload["cl_path"],
+            contact_name = payload["contact_name"],
+            speculation_policy = self.speculation_policy,
+            resume_id = payload["resumate_uuid"],
+            on_event = self.on_event,
+            )
+        try:
+            results = await pipeline.process()
+        except ListingNotRelevant as e:
+            return {"status": "Relevance pre-gate threshold NOT met", "url": payload["url"], "relevance": e.relevance}
+        except SimilarityThresholdNotMet:
+            return {"status": "Semantic similarity threshold NOT met", "url": payload["url"]}
+        return {
+            "status": "success",
+            "url": payload["url"],
+            "sections": list(results["resume_content"]),
+            "resume_filepath": results["resume_filepath"],
+            "cover_letter_filepath": results.get("cl_filepath", "No cover letter rendered"),
+            "stage_timings": results["stage_timings"],
+            "run_state": pipeline.run_state(results),
+        }
+
+
+def scrape_job_handlers(speculation_policy: SpeculativeGenerationPolicy | None = None) -> dict:
+    """JobWorker handlers of the queued job kinds"""
+    async def scrape(payload: dict, progress: dict) -> dict:
+        return await ScrapeJobController(payload, progress, speculation_policy).process()
+    return {SCRAPE_JOB: scrape}
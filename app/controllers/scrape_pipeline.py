@@ -0,0 +1,299 @@
+"""
+This file contains the controller running the /scrape workflow as a declarative stage graph
+authors: Erin Hwang
+"""
+import asyncio
+import os
+import re
+
+from app.utils.logger import LoggerConfig
+from app.utils.pipeline import InMemoryStageCache, PipelineExecutor, Stage
+from app.controllers.listing_loader import JobListingLoader
+from app.controllers.resume_loader import ResumeLoader
+from app.controllers.relevance_gate import PRE_GATE_MODE, RelevanceGateController
+from app.controllers.threshold_evaluator import SemanticSimilarityEvaluator, SpeculativeGenerationPolicy
+from app.controllers.resume_generator import ResumeGeneratorController
+from app.controllers.cl_generator import CoverLetterGeneratorController
+from app.controllers.render_pool import get_render_pool
+from app.services.embedding import get_micro_batch_encoder
+from app.services.listing_index import LISTING_INDEX_MODEL, get_listing_index
+
+SOFT_COSINE_THRESHOLD = float(os.getenv("SOFT_COSINE_THRESHOLD"))
+PIPELINE_LLM_RETRIES = int(os.getenv("PIPELINE_LLM_RETRIES", "1"))
+PIPELINE_CACHE_SIZE = int(os.getenv("PIPELINE_CACHE_SIZE", "128"))
+
+stage_cache = InMemoryStageCache(max_entries=PIPELINE_CACHE_SIZE)
+indexing_tasks = set() #listing index appends outliving a cancelled run, referenced until done
+
+
+class SimilarityThresholdNotMet(Exception):
+    """Raised by the similarity gate when the soft cosine score is below the threshold"""
+
+    def __init__(self, semantic_scores: dict):
+        super().__init__(f"Semantic similarity threshold NOT met: {semantic_scores}")
+        self.semantic_scores = semantic_scores
+
+
+class ScrapePipelineController:
+    """
+    Runs the /scrape workflow as a stage graph where every stage starts as soon as its inputs are ready
+
+        listing_pdf ── relevance_gate (raw text, before any listing LLM stage when PRE_GATE_MODE is on)
+        listing_pdf ─┬─ job_data ── job_data_result ─┬─ listing_indexed (off the critical path, even if the gate fails)
+                     │                               ├─ semantic_scores ── similarity_gate
+        resume_data ─┼───────────────────────────────┘
+                     ├─ cl_keyword_md (after similarity_gate unless speculating)
+                     └─ resume_content (after similarity_gate unless speculating)
+        cl_filepath, resume_filepath (after similarity_gate, rendered concurrently on the render pool)
+
+    Stage names double as the keyword arguments of the stage functions.
+
+    Args:
+        url (str): URL of the job listing to scrape
+        resume_path (str): Path to the uploaded base resume
+        company_name (str): Company name of the job listing
+        job_title (str): Job title of the job listing
+        job_id (str): Job ID of the job listing
+        cl_path (str, optional): Path to the uploaded base cover letter, None to skip the cover letter
+        contact_name (str, optional): Contact name used in the cover letter greeting
+        speculation_policy (SpeculativeGenerationPolicy, optional): Decides if generation may start before the gate
+        pre_gate_mode (str): Relevance gate mode on the raw texts ("off", "lexical" or "embedding")
+        resume_id (str, optional): Key of the resume in the speculation score history
+        cache (InMemoryStageCache, optional): Stage result cache
+        on_event (Callable, optional): Stage event hook forwarded to PipelineExecutor
+        on_section (Callable, optional): Generated section hook forwarded to ResumeGeneratorController
+        render_output (str): "file" saves the rendered documents, "memory" keeps them in `documents`
+            (keyed by the path they would be saved to) and leaves persisting them to the caller
+    """
+    ALLOWED_RENDER_OUTPUTS = ("file", "memory")
+
+    def __init__(
+        self,
+        url: str,
+        resume_path: str,
+        company_name: str = "generic",
+        job_title: str = "generic",
+        job_id: str = "generic",
+        cl_path: str | None = None,
+        contact_name: str | None = None,
+        speculation_policy: SpeculativeGenerationPolicy | None = None,
+        pre_gate_mode: str = PRE_GATE_MODE,
+        resume_id: str | None = None,
+        cache: InMemoryStageCache | None = stage_cache,
+        on_event=None,
+        on_section=None,
+        render_output: str = "file",
+    ):
+        if render_output not in self.ALLOWED_RENDER_OUTPUTS:
+            raise ValueError(f"Unknown render output {render_output}, expected one of {self.ALLOWED_RENDER_OUTPUTS}")
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.url = str(url)
+        self.resume_path = resume_path
+        self.cl_path = cl_path
+        self.contact_name = contact_name
+        self.speculation_policy = speculation_policy
+        self.pre_gate_mode = pre_gate_mode
+        self.resume_id = resume_id or resume_path
+        self.cache = cache
+        self.on_event = on_event
+        self.on_section = on_section
+        self.render_output = render_output
+        self.documents = {}
+        self.job_loader = JobListingLoader(
+            **{
+                "company_name": company_name,
+                "job_title": job_title,
+                "job_id": job_id
+                }
+                )
+        self.speculate = False
+
+    async def scrape_listing(self):
+        """Scrape the job listing into a PDF"""
+        return await self.job_loader.scrape(self.url)
+
+    async def extract_listing(self, listing_pdf: str):
+        """Extract the job listing markdown from the scraped PDF"""
+        return await self.job_loader.extract(listing_pdf)
+
+    async def load_resume(self):
+        """Extract the resume markdown from the uploaded resume"""
+        return await ResumeLoader(self.resume_path).process()
+
+    def resume_cache_key(self):
+        """Cache the extracted resume until the uploaded file changes"""
+        return f"{self.resume_path}:{os.path.getmtime(self.resume_path)}"
+
+    async def extract_cl_keywords(self, listing_pdf: str):
+        """Extract the cover letter keywords; only needs the scraped PDF"""
+        return await CoverLetterGeneratorController(listing_pdf).process()
+
+    async def check_relevance(self, listing_pdf: str):
+        """Reject obviously irrelevant listings on the raw texts before any LLM extraction"""
+        return await RelevanceGateController(self.resume_path, mode=self.pre_gate_mode).process(listing_pdf)
+
+    def split_listing(self, job_data: str):
+        """Drop the additional information section before the similarity evaluation"""
+        match = re.search(r"(.*?)# Additional Information", job_data, re.DOTALL)
+        return match.group(1).strip()
+
+    async def evaluate_similarity(self, resume_data: str, job_data_result: str):
+        """Score the semantic similarity between the resume and the job listing"""
+        return await SemanticSimilarityEvaluator().aprocess(resume_data, job_data_result)
+
+    async def index_listing(self, listing_pdf: str, job_data_result: str):
+        """Add the listing to the listing index used by /rank; never fails or holds up the run"""
+        task = asyncio.create_task(self.add_to_index(listing_pdf, job_data_result))
+        indexing_tasks.add(task)
+        task.add_done_callback(indexing_tasks.discard)
+        # a failed similarity gate cancels the stages in flight, the listing is indexed regardless
+        return await asyncio.shield(task)
+
+    async def add_to_index(self, listing_pdf: str, job_data_result: str) -> bool:
+        """Encode the listing and append it to the listing index, returns whether it was indexed"""
+        try:
+            embedding = await get_micro_batch_encoder(LISTING_INDEX_MODEL).encode_documents([job_data_result])
+            metadata = {
+                "url": self.url,
+                "company_name": self.job_loader.company_name,
+                "job_title": self.job_loader.job_title,
+                "job_id": self.job_loader.job_id,
+                "listing_pdf": listing_pdf,
+            }
+            # loading the index and appending to its log are file I/O, kept off the event loop
+            await asyncio.to_thread(lambda: get_listing_index(LISTING_INDEX_MODEL).add(self.url, embedding[0], metadata))
+            return True
+        except Exception as e:
+            self.logger.warning("Could not index listing %s: %s", self.url, e)
+            return False
+
+    def similarity_gate(self, semantic_scores: dict):
+        """Raise SimilarityThresholdNotMet if the soft cosine score is below the threshold"""
+        score = semantic_scores["soft_cosine_similarity"]
+        if self.speculation_policy is not None:
+            self.speculation_policy.record(self.resume_id, score, self.speculate)
+        if score < SOFT_COSINE_THRESHOLD:
+            self.logger.info("Semantic similarity threshold NOT met:\n\t%s", semantic_scores)
+            raise SimilarityThresholdNotMet(semantic_scores)
+        self.logger.info("Semantic similarity threshold met:\n\t%s", semantic_scores)
+        return True
+
+    async def generate_resume(self, resume_data: str, job_data: str):
+        """Generate the tailored resume sections"""
+        return await ResumeGeneratorController(resume_data, job_data, on_section=self.on_section).generate_content()
+
+    async def render_cover_letter(self, cl_keyword_md: str, semantic_scores: dict):
+        """Render the cover letter on the render pool"""
+        kwargs = dict(
+            cl_path = self.cl_path,
+            soft_cos_score= semantic_scores["soft_cosine_similarity"],
+            md_info = cl_keyword_md,
+            contact_name= self.contact_name,
+            source_name = "cl_" + self.job_loader.source_type,
+            )
+        if self.render_output == "memory":
+            return self.keep_document(await get_render_pool().render_cover_letter_in_memory(**kwargs))
+        return await get_render_pool().render_cover_letter(**kwargs)
+
+    async def render_resume(self, resume_content: dict, cl_keyword_md: str):
+        """Render the resume on the render pool"""
+        kwargs = dict(
+            resume_path=self.resume_path,
+            generated_content=resume_content,
+            source_name = self.job_loader.source_type,
+            md_info = cl_keyword_md
+            )
+        if self.render_output == "memory":
+            return self.keep_document(await get_render_pool().render_resume_in_memory(**kwargs))
+        return await get_render_pool().render_resume(**kwargs)
+
+    def keep_document(self, rendered: dict) -> str:
+        """Keep an in-memory rendered document, returns the path it would be saved to"""
+        self.documents[rendered["filepath"]] = rendered["content"]
+        return rendered["filepath"]
+
+    def build_stages(self) -> list[Stage]:
+        """Declare the stage graph of the /scrape workflow"""
+        # every listing LLM stage waits for the relevance gate so a rejected listing costs no listing LLM call;
+        # the resume extraction does not depend on the listing (and is cached), it starts right away
+        llm_after = () if self.pre_gate_mode == "off" else ("relevance_gate",)
+        # generation stages (resume sections, cover letter keywords) wait for the similarity gate unless speculating
+        generation_after = () if self.speculate else ("similarity_gate",)
+        stages = [
+            Stage("listing_pdf", self.scrape_listing),
+            Stage(
+                "job_data", self.extract_listing, inputs=("listing_pdf",), after=llm_after,
+                retries=PIPELINE_LLM_RETRIES
+                ),
+            Stage(
+                "resume_data", self.load_resume, retries=PIPELINE_LLM_RETRIES,
+                cache_key=self.resume_cache_key
+                ),
+            Stage(
+                "cl_keyword_md", self.extract_cl_keywords, inputs=("listing_pdf",),
+                after=llm_after + generation_after, retries=PIPELINE_LLM_RETRIES
+                ),
+            Stage("job_data_result", self.split_listing, inputs=("job_data",)),
+            Stage("listing_indexed", self.index_listing, inputs=("listing_pdf", "job_data_result")),
+            Stage("semantic_scores", self.evaluate_similarity, inputs=("resume_data", "job_data_result")),
+            Stage("similarity_gate", self.similarity_gate, inputs=("semantic_scores",)),
+            Stage(
+                "resume_content", self.generate_resume, inputs=("resume_data", "job_data"),
+                after=generation_after, retries=PIPELINE_LLM_RETRIES
+                ),
+            Stage(
+                "resume_filepath", self.render_resume, inputs=("resume_content", "cl_keyword_md"),
+                after=("similarity_gate",)
+                ),
+        ]
+        if self.cl_path is not None:
+            stages.append(Stage(
+                "cl_filepath", self.render_cover_letter, inputs=("cl_keyword_md", "semantic_scores"),
+                after=("similarity_gate",)
+                ))
+        if self.pre_gate_mode != "off":
+            stages.append(Stage("relevance_gate", self.check_relevance, inputs=("listing_pdf",)))
+        return stages
+
+    def run_state(self, results: dict) -> dict:
+        """
+        Returns what a later incremental regeneration of this run needs
+
+        Args:
+            results (dict): The results returned by process
+
+        Returns:
+            dict: The stored job data, resume sections, generated outputs and rendered file paths
+        """
+        return {
+            "resume_path": self.resume_path,
+            "cl_path": self.cl_path,
+            "contact_name": self.contact_name,
+            "source_name": self.job_loader.source_type,
+            "job_data": results["job_data"],
+            "resume_data": results["resume_data"],
+            "cl_keyword_md": results["cl_keyword_md"],
+            "semantic_scores": results["semantic_scores"],
+            "resume_content": results["resume_content"],
+            "resume_filepath": results["resume_filepath"],
+            "cl_filepath": results.get("cl_filepath", "No cover letter rendered"),
+        }
+
+    @LoggerConfig().log_execution
+    async def process(self) -> dict:
+        """
+        Execute the /scrape workflow
+
+        Raises:
+            ListingNotRelevant: If the raw listing text is not relevant to the raw resume text
+            SimilarityThresholdNotMet: If the resume and job listing are not similar enough
+
+        Returns:
+            dict: The result of every stage keyed by stage name
+        """
+        if self.speculation_policy is not None:
+            self.speculate = self.speculation_policy.should_speculate(self.resume_id)
+        executor = PipelineExecutor(self.build_stages(), cache=self.cache, on_event=self.on_event, name="scrape")
+        results = await executor.run()
+        results["stage_timings"] = executor.timings
+        return results
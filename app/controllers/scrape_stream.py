@@ -0,0 +1,172 @@
+"""
+This file contains the controller streaming the stage progress and partial results of a /scrape run as server-sent events
+authors: Erin Hwang
+"""
+import asyncio
+import os
+import time
+from typing import Callable
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+from app.utils.sse import format_comment, format_event
+from app.controllers.scrape_pipeline import SOFT_COSINE_THRESHOLD, ScrapePipelineController, SimilarityThresholdNotMet
+from app.controllers.relevance_gate import ListingNotRelevant
+from app.controllers.threshold_evaluator import SpeculativeGenerationPolicy
+
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+
+class ScrapeStreamController:
+    """
+    Runs the /scrape workflow and reports every partial result as soon as its stage finishes
+
+    Events, in the order the stages finish (data is JSON):
+        scraped: listing_pdf, the path of the scraped listing
+        relevance: the relevance pre-gate score, mode and threshold
+        listing_extracted: job_data, the extracted job listing markdown
+        resume_ready: resume_data, the extracted resume markdown
+        similarity: the semantic scores, the soft cosine threshold and whether it passed
+        section: name and content of a generated section; sections generated speculatively are held
+            back until the similarity gate passed
+        rendered: document ("resume" or "cover_letter") and filepath
+    and one final event: done (the /scrape response), not_relevant, not_similar or error.
+
+    Closing the stream cancels the run, so a client can stop as soon as it has what it needs.
+
+    Args:
+        payload (dict): The /scrape arguments: url, resumate_uuid, resume_path, company_name, job_title,
+            job_id, cl_path and contact_name
+        register_run (Callable): Called with the run state of a successful run, returns its run ID
+        speculation_policy (SpeculativeGenerationPolicy, optional): Decides if generation may start before the gate
+        keepalive_seconds (float): Idle seconds before a keep-alive comment is sent
+    """
+
+    def __init__(
+        self,
+        payload: dict,
+        register_run: Callable[[dict], str],
+        speculation_policy: SpeculativeGenerationPolicy | None = None,
+        keepalive_seconds: float = SSE_KEEPALIVE_SECONDS,
+    ):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.payload = payload
+        self.register_run = register_run
+        self.keepalive_seconds = keepalive_seconds
+        self.queue = asyncio.Queue()
+        self.gate_passed = False
+        self.held_sections = []
+        self.pipeline = ScrapePipelineController(
+            url = payload["url"],
+            resume_path = payload["resume_path"],
+            company_name = payload["company_name"],
+            job_title = payload["job_title"],
+            job_id = payload["job_id"],
+            cl_path = payload["cl_path"],
+            contact_name = payload["contact_name"],
+            speculation_policy = speculation_policy,
+            resume_id = payload["resumate_uuid"],
+            on_event = self.on_event,
+            on_section = self.on_section,
+            )
+
+    def publish(self, event: str, data: dict) -> None:
+        """Queue an event for the stream"""
+        self.queue.put_nowait((event, data))
+
+    def on_event(self, event: str, stage_name: str, payload=None) -> None:
+        """Pipeline event hook publishing the result of every finished stage a client can act on"""
+        if event not in ("stage_completed", "stage_cached"):
+            return
+        if stage_name == "listing_pdf":
+            self.publish("scraped", {"listing_pdf": payload})
+        elif stage_name == "relevance_gate":
+            self.publish("relevance", payload)
+        elif stage_name == "job_data":
+            self.publish("listing_extracted", {"job_data": payload})
+        elif stage_name == "resume_data":
+            self.publish("resume_ready", {"resume_data": payload})
+        elif stage_name == "semantic_scores":
+            self.publish("similarity", {
+                "semantic_scores": payload,
+                "threshold": SOFT_COSINE_THRESHOLD,
+                "passed": payload["soft_cosine_similarity"] >= SOFT_COSINE_THRESHOLD,
+                })
+        elif stage_name == "similarity_gate":
+            self.gate_passed = True
+            for section in self.held_sections:
+                self.publish("section", section)
+            self.held_sections = []
+        elif stage_name == "resume_filepath":
+            self.publish("rendered", {"document": "resume", "filepath": payload})
+        elif stage_name == "cl_filepath":
+            self.publish("rendered", {"document": "cover_letter", "filepath": payload})
+
+    def on_section(self, section_name: str, content: str) -> None:
+        """Generated section hook, publishes the section once the similarity gate passed"""
+        section = {"name": section_name, "content": content}
+        if self.gate_passed:
+            self.publish("section", section)
+        else:
+            self.held_sections.append(section)
+
+    async def run(self) -> None:
+        """Run the workflow and publish its final event"""
+        url = self.payload["url"]
+        try:
+            results = await self.pipeline.process()
+        except ListingNotRelevant as e:
+            self.publish("not_relevant", {"status": "Relevance pre-gate threshold NOT met", "url": url, "relevance": e.relevance})
+        except SimilarityThresholdNotMet as e:
+            self.publish("not_similar", {
+                "status": "Semantic similarity threshold NOT met", "url": url, "semantic_scores": e.semantic_scores
+                })
+        except Exception as e:
+            self.logger.error("Streamed scrape of %s failed: %s", url, e)
+            self.publish("error", {"status": "error", "url": url, "message": str(e)})
+        else:
+            run_id = self.register_run(self.pipeline.run_state(results))
+            self.publish("done", {
+                "status": "success",
+                "url": url,
+                "run_id": run_id,
+                "sections": list(results["resume_content"]),
+                "resume_filepath": results["resume_filepath"],
+                "cover_letter_filepath": results.get("cl_filepath", "No cover letter rendered"),
+                "stage_timings": results["stage_timings"],
+                })
+        finally:
+            # end of stream marker
+            self.publish(None, None)
+
+    async def events(self):
+        """
+        Run the workflow and yield its events as they are published
+
+        Yields:
+            str: Server-sent event text, or a keep-alive comment when the run is idle
+        """
+        start = time.perf_counter()
+        run = asyncio.create_task(self.run(), name="scrape_stream")
+        event_id = 0
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(self.queue.get(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield format_comment("keep-alive")
+                    continue
+                if event is None:
+                    break
+                event_id += 1
+                if event_id == 1:
+                    metrics.observe("scrape_stream.first_event_seconds", time.perf_counter() - start)
+                yield format_event(event, data, event_id)
+            metrics.increment("scrape_stream.completed")
+        finally:
+            if not run.done():
+                # the client went away: stop the stages still in flight
+                self.logger.info("Stream of %s closed by the client, cancelling the run", self.payload["url"])
+                metrics.increment("scrape_stream.cancelled")
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
@@ -0,0 +1,52 @@
+"""
+This file contains the controller regenerating individual resume sections of a prior /scrape run
+authors: Erin Hwang
+"""
+from app.utils.logger import LoggerConfig
+from app.controllers.resume_generator import ResumeGeneratorController
+from app.controllers.render_pool import get_render_pool
+
+class SectionRegeneratorController:
+    """
+    Regenerates the named sections of a prior run and re-renders the resume
+
+    The stored job data, resume sections and every other generated section are reused, so the
+    cost is one LLM call per regenerated section plus the resume render. The cover letter does
+    not depend on the resume sections and is left untouched.
+
+    Args:
+        run_state (dict): The run state returned by ScrapePipelineController.run_state
+    """
+
+    def __init__(self, run_state: dict):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.run_state = run_state
+
+    @LoggerConfig().log_execution
+    async def process(self, section_names: list[str]) -> dict:
+        """
+        Execute the incremental regeneration
+
+        Args:
+            section_names (list[str]): Section names or position titles to regenerate
+
+        Raises:
+            ValueError: If a section name is not part of the resume
+
+        Returns:
+            dict: The new run state, the given run state is left unchanged
+        """
+        generator = ResumeGeneratorController(self.run_state["resume_data"], self.run_state["job_data"])
+        regenerated = await generator.regenerate_sections(section_names)
+        self.logger.info("Regenerated %s section(s): %s", len(regenerated), list(regenerated))
+
+        # keep the original section order, the renderer walks positions in that order
+        resume_content = {**self.run_state["resume_content"], **regenerated}
+        resume_fp = await get_render_pool().render_resume(
+            resume_path=self.run_state["resume_path"],
+            generated_content=resume_content,
+            source_name = self.run_state["source_name"],
+            md_info = self.run_state["cl_keyword_md"]
+            )
+
+        return {**self.run_state, "resume_content": resume_content, "resume_filepath": resume_fp}
@@ -7,76 +7,180 @@ import argparse
 import json
 import os
 import pprint
+import random
+import threading
+import time
 from pathlib import Path
 import requests
 import warnings
+from collections import defaultdict, deque
 
 from dotenv import load_dotenv
 
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances, manhattan_distances
 from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+from app.services.embedding import EmbeddingModelService, get_embedding_service, get_service_encoder
 
 TRANSFORMER_MODEL = os.getenv("TRANSFORMER_MODEL")
+SOFT_COSINE_THRESHOLD = float(os.getenv("SOFT_COSINE_THRESHOLD"))
+SIMILARITY_MODE = os.getenv("SIMILARITY_MODE", "single")
+CASCADE_FAST_MODEL = os.getenv("CASCADE_FAST_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+CASCADE_BAND = float(os.getenv("CASCADE_BAND", "0.05"))
+CASCADE_FAST_THRESHOLD = os.getenv("CASCADE_FAST_THRESHOLD") or None
+CASCADE_AUDIT_RATE = float(os.getenv("CASCADE_AUDIT_RATE", "0"))
+SIMILARITY_CALIBRATION_LOG = os.getenv("SIMILARITY_CALIBRATION_LOG", "")
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "off")
+SPECULATIVE_MARGIN = float(os.getenv("SPECULATIVE_MARGIN", "0.05"))
+SPECULATIVE_HISTORY_SIZE = int(os.getenv("SPECULATIVE_HISTORY_SIZE", "20"))
 
 def soft_cosine_similarity(embedding1, embedding2):
     """
     Calculate the Soft Cosine Similarity between two embeddings.
 
+    The feature similarity matrix S is the cosine similarity between the d feature vectors
+    f_i = (embedding1[i], embedding2[i]). With U the (d, 2) matrix of the normalized feature
+    vectors, S = U U^T and x^T S y = (U^T x) . (U^T y), so the score is computed in O(d)
+    without ever building the d x d matrix.
+
     Parameters:
         embedding1 (array-like): First sentence embedding.
         embedding2 (array-like): Second sentence embedding.
-        similarity_matrix (2D array, optional): Precomputed feature similarity matrix.
-            If None, default to identity matrix (no feature similarity).
 
     Returns:
         float: Soft Cosine Similarity score.
     """
-    combined_embeddings = np.vstack([embedding1, embedding2])
+    return float(soft_cosine_similarity_batch(embedding1, np.asarray(embedding2).reshape(1, -1))[0])
 
-    feature_vectors = combined_embeddings.T
-    similarity_matrix = cosine_similarity(feature_vectors)
+def soft_cosine_similarity_batch(query_embedding, candidate_embeddings):
+    """
+    Calculate the Soft Cosine Similarity between one embedding and M candidate embeddings.
 
-    # Convert inputs to numpy arrays for matrix operations
-    e1 = np.array(embedding1).flatten()
-    e2 = np.array(embedding2).flatten()
+    For every pair, with n_i = sqrt(q_i^2 + c_i^2) (features where n_i is 0 contribute nothing):
+        A = sum(q_i^2 / n_i), B = sum(q_i c_i / n_i), C = sum(c_i^2 / n_i)
+        U^T q = (A, B) and U^T c = (B, C)
+        score = B (A + C) / sqrt((A^2 + B^2) (B^2 + C^2))
 
-    # Compute the numerator: e1.T * S * e2
-    numerator = np.dot(np.dot(e1, similarity_matrix), e2)
+    Parameters:
+        query_embedding (array-like): Embedding of shape (d,) or (1, d), ie the resume.
+        candidate_embeddings (array-like): Embeddings of shape (M, d), ie the job listings.
 
-    # Compute the denominator: sqrt(e1.T * S * e1) * sqrt(e2.T * S * e2)
-    denominator = (
-        np.sqrt(np.dot(np.dot(e1, similarity_matrix), e1)) *
-        np.sqrt(np.dot(np.dot(e2, similarity_matrix), e2))
-    )
+    Returns:
+        np.ndarray: Soft Cosine Similarity score per candidate, shape (M,).
+    """
+    q = np.asarray(query_embedding, dtype=np.float64).reshape(1, -1)
+    c = np.atleast_2d(np.asarray(candidate_embeddings, dtype=np.float64))
 
+    norms = np.sqrt(q ** 2 + c ** 2)
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms != 0)
+    a = (q ** 2 * inv_norms).sum(axis=1)
+    b = (q * c * inv_norms).sum(axis=1)
+    cc = (c ** 2 * inv_norms).sum(axis=1)
 
+    numerator = b * (a + cc)
+    denominator = np.sqrt(a ** 2 + b ** 2) * np.sqrt(b ** 2 + cc ** 2)
     # Return the similarity score (handle edge case for zero denominator)
-    return numerator / denominator if denominator != 0 else 0
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+def soft_cosine_similarity_matrix(query_embeddings, candidate_embeddings, max_elements: int = 2 ** 24):
+    """
+    Calculate the Soft Cosine Similarity between N query and M candidate embeddings.
+
+    Queries are scored in chunks so the (chunk, M, d) intermediate stays under `max_elements`.
+
+    Parameters:
+        query_embeddings (array-like): Embeddings of shape (N, d), ie resumes.
+        candidate_embeddings (array-like): Embeddings of shape (M, d), ie job listings.
+        max_elements (int): Upper bound on the number of elements of the intermediate arrays.
+
+    Returns:
+        np.ndarray: Soft Cosine Similarity scores of shape (N, M).
+    """
+    queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float64))
+    candidates = np.atleast_2d(np.asarray(candidate_embeddings, dtype=np.float64))
+    n_queries, dim = queries.shape
+    chunk_size = max(1, max_elements // max(1, candidates.shape[0] * dim))
+
+    scores = np.empty((n_queries, candidates.shape[0]), dtype=np.float64)
+    for start in range(0, n_queries, chunk_size):
+        q = queries[start:start + chunk_size, None, :]
+        c = candidates[None, :, :]
+        norms = np.sqrt(q ** 2 + c ** 2)
+        inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms != 0)
+        a = (q ** 2 * inv_norms).sum(axis=2)
+        b = (q * c * inv_norms).sum(axis=2)
+        cc = (c ** 2 * inv_norms).sum(axis=2)
+        numerator = b * (a + cc)
+        denominator = np.sqrt(a ** 2 + b ** 2) * np.sqrt(b ** 2 + cc ** 2)
+        scores[start:start + chunk_size] = np.divide(
+            numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0
+            )
+    return scores
+
+def similarity_models() -> list[str]:
+    """Transformer models used by the similarity evaluator in the configured mode"""
+    if SIMILARITY_MODE == "cascade":
+        return [CASCADE_FAST_MODEL, TRANSFORMER_MODEL]
+    return [TRANSFORMER_MODEL]
+
+_calibration_lock = threading.Lock()
 
 class SemanticSimilarityEvaluator:
-    #TODO: add docstrings
+    """
+    Scores the semantic similarity between a resume and a job listing
+
+    In "cascade" mode the pair is first scored by the small `fast_model`. Only when its soft cosine
+    score is within `band` of `fast_threshold` is the pair re-scored by `transformer_model`, whose
+    scores then decide. Fast tier decisions are shifted by (threshold - fast_threshold) so the gate
+    and the cover letter see scores on the scale of the full model. Whenever both tiers ran, their
+    scores are appended to the calibration log; `audit_rate` re-scores a share of the pairs outside
+    the band purely for calibration.
+
+    Args:
+        transformer_model (str): Sentence transformer model name
+        embedding_service (EmbeddingModelService, optional): Service holding the loaded model;
+            defaults to the process-wide service of `transformer_model` so weights are loaded once;
+            an injected service (its model, store and backend) is used by aprocess as well as process
+        mode (str): "single" or "cascade"
+        fast_model (str): Small sentence transformer model scoring first in cascade mode
+        band (float): Distance to the fast threshold within which the full model re-scores
+        threshold (float): Soft cosine threshold of the similarity gate
+        fast_threshold (float, optional): Threshold on the fast model scale, defaults to `threshold`
+        audit_rate (float): Share of the pairs outside the band also scored by the full model
+        calibration_log (str): JSONL file receiving the scores of both tiers, empty to disable
+    """
+    ALLOWED_MODES = ("single", "cascade")
+
     def __init__(
         self,
         transformer_model: str = TRANSFORMER_MODEL,
-
+        embedding_service: EmbeddingModelService | None = None,
+        mode: str = SIMILARITY_MODE,
+        fast_model: str = CASCADE_FAST_MODEL,
+        band: float = CASCADE_BAND,
+        threshold: float = SOFT_COSINE_THRESHOLD,
+        fast_threshold: float | None = CASCADE_FAST_THRESHOLD,
+        audit_rate: float = CASCADE_AUDIT_RATE,
+        calibration_log: str = SIMILARITY_CALIBRATION_LOG,
     ):
+        if mode not in self.ALLOWED_MODES:
+            raise ValueError(f"Unknown similarity mode {mode}, expected one of {self.ALLOWED_MODES}")
         self.logger = LoggerConfig().get_logger(__name__)
 
-        # load transformer model
-        self.sentence_transformer = SentenceTransformer(transformer_model)
+        # shared transformer model - loaded once per process
+        self.embedding_service = embedding_service or get_embedding_service(transformer_model)
+        self.mode = mode
+        self.band = band
+        self.threshold = threshold
+        self.fast_threshold = float(fast_threshold) if fast_threshold is not None else threshold
+        self.audit_rate = audit_rate
+        self.calibration_log = calibration_log
+        self.fast_service = get_embedding_service(fast_model) if mode == "cascade" else None
 
-
-
-    def semantic_search(self, resume_str:str, job_str:str):
+    def score_embeddings(self, resume_embedding: np.ndarray, job_embedding: np.ndarray):
         """
-        Performs semantic search based on cosine similarity of embeddings.
+        Calculates the similarity scores between a resume and a job embedding of shape (1, d)
         """
-
-        # encode the sql query or NL representation of the query
-        resume_embedding = self.sentence_transformer.encode([resume_str])
-        job_embedding = self.sentence_transformer.encode([job_str])
-
         # calculate cosine sim
         # TODO: possibly explore other similarity metrics (L1, L2, jaccard)
         self.logger.info("Calculating cosine similarity...")
@@ -92,14 +196,167 @@ class SemanticSimilarityEvaluator:
             # "manhattan_norm": normalized_man_score
             }
 
+    def semantic_search(self, resume_str:str, job_str:str, embedding_service: EmbeddingModelService | None = None):
+        """
+        Performs semantic search based on cosine similarity of embeddings.
+        """
+        embedding_service = embedding_service or self.embedding_service
+        # encode the resume and the job listing (or all of their chunks) in a single call
+        embeddings = embedding_service.encode_documents([resume_str, job_str])
+        return self.score_embeddings(embeddings[0:1], embeddings[1:2])
+
+    async def asemantic_search(self, resume_str: str, job_str: str, embedding_service: EmbeddingModelService | None = None):
+        """Awaitable semantic_search - the texts join a cross-request micro-batch off the event loop"""
+        embedding_service = embedding_service or self.embedding_service
+        embeddings = await get_service_encoder(embedding_service).encode_documents([resume_str, job_str])
+        return self.score_embeddings(embeddings[0:1], embeddings[1:2])
+
+    def escalation(self, fast_scores: dict) -> tuple[bool, bool]:
+        """
+        Decide whether the full model has to score the pair
+
+        Returns:
+            tuple[bool, bool]: (escalate, audit) - escalate when the fast score is within the band, audit
+                when the full model only scores the pair for calibration
+        """
+        if abs(fast_scores["soft_cosine_similarity"] - self.fast_threshold) <= self.band:
+            return True, False
+        return False, random.random() < self.audit_rate
+
+    def log_calibration(self, fast_scores: dict, full_scores: dict, escalated: bool) -> None:
+        """Append the scores of both tiers to the calibration log"""
+        record = {
+            "timestamp": time.time(),
+            "fast_model": self.fast_service.model_name,
+            "full_model": self.embedding_service.model_name,
+            "fast_cosine_similarity": float(fast_scores["cosine_similarity"]),
+            "fast_soft_cosine_similarity": float(fast_scores["soft_cosine_similarity"]),
+            "full_cosine_similarity": float(full_scores["cosine_similarity"]),
+            "full_soft_cosine_similarity": float(full_scores["soft_cosine_similarity"]),
+            "fast_threshold": self.fast_threshold,
+            "threshold": self.threshold,
+            "band": self.band,
+            "escalated": escalated,
+        }
+        self.logger.info("Cascade tier scores: %s", record)
+        if not self.calibration_log:
+            return
+        try:
+            Path(self.calibration_log).parent.mkdir(parents=True, exist_ok=True)
+            with _calibration_lock, open(self.calibration_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            self.logger.warning("Could not write the similarity calibration log: %s", e)
+
+    def resolve_cascade(self, fast_scores: dict, full_scores: dict | None, escalated: bool) -> dict:
+        """Combine the tier scores into the scores the similarity gate decides on"""
+        if full_scores is not None:
+            self.log_calibration(fast_scores, full_scores, escalated)
+        else:
+            self.logger.info("Cascade fast tier scores: %s", fast_scores)
+
+        if escalated:
+            metrics.increment("similarity.cascade.escalations")
+            result = {**full_scores, "similarity_tier": "full"}
+        else:
+            metrics.increment("similarity.cascade.fast_decisions")
+            result = {
+                "cosine_similarity": fast_scores["cosine_similarity"],
+                "soft_cosine_similarity": fast_scores["soft_cosine_similarity"] + self.threshold - self.fast_threshold,
+                "similarity_tier": "fast",
+            }
+        result["fast_soft_cosine_similarity"] = fast_scores["soft_cosine_similarity"]
+        return result
+
     def process(self, resume_str: str, job_str: str, ):
         """
         Main method to run the semantic search either using given SQL query or its natural
         language equivalent using granite-code-instruct
         """
         # turn list of CHG descriptions to embeddings
-        ss_response = self.semantic_search(resume_str, job_str)
+        if self.mode == "cascade":
+            fast_scores = self.semantic_search(resume_str, job_str, self.fast_service)
+            escalate, audit = self.escalation(fast_scores)
+            full_scores = self.semantic_search(resume_str, job_str) if escalate or audit else None
+            if audit:
+                metrics.increment("similarity.cascade.audits")
+            ss_response = self.resolve_cascade(fast_scores, full_scores, escalate)
+        else:
+            ss_response = self.semantic_search(resume_str, job_str)
+        self.logger.info("Semantic similarity completed: cosine similarity score is:%s", ss_response)
+        return ss_response
+
+    async def aprocess(self, resume_str: str, job_str: str):
+        """
+        Awaitable equivalent of process - the texts are encoded as part of a cross-request
+        micro-batch off the event loop
+        """
+        if self.mode == "cascade":
+            fast_scores = await self.asemantic_search(resume_str, job_str, self.fast_service)
+            escalate, audit = self.escalation(fast_scores)
+            full_scores = await self.asemantic_search(resume_str, job_str) if escalate or audit else None
+            if audit:
+                metrics.increment("similarity.cascade.audits")
+            ss_response = self.resolve_cascade(fast_scores, full_scores, escalate)
+        else:
+            ss_response = await self.asemantic_search(resume_str, job_str)
         self.logger.info("Semantic similarity completed: cosine similarity score is:%s", ss_response)
         return ss_response
 
 
+class SpeculativeGenerationPolicy:
+    """
+    Decides whether generation should start before the similarity gate has finished
+
+    Keeps a rolling history of soft cosine scores per resume. In "auto" mode generation is started
+    speculatively when the mean of the recent scores is within `margin` of the threshold (or above it);
+    resumes without any history are always speculated on.
+
+    Args:
+        threshold (float): Soft cosine threshold of the similarity gate
+        mode (str): "off", "always" or "auto"
+        margin (float): How far below the threshold the expected score may be to still speculate
+        history_size (int): Number of recent scores kept per resume
+    """
+    ALLOWED_MODES = {"off", "always", "auto"}
+
+    def __init__(
+        self,
+        threshold: float,
+        mode: str = SPECULATIVE_GENERATION,
+        margin: float = SPECULATIVE_MARGIN,
+        history_size: int = SPECULATIVE_HISTORY_SIZE,
+    ):
+        if mode not in self.ALLOWED_MODES:
+            raise ValueError(f"Invalid speculative generation mode: {mode}")
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.threshold = threshold
+        self.mode = mode
+        self.margin = margin
+        self.history = defaultdict(lambda: deque(maxlen=history_size))
+
+    def expected_score(self, resume_id: str) -> float | None:
+        """Returns the mean of the recent scores for the resume, None without history"""
+        scores = self.history[resume_id]
+        return float(np.mean(scores)) if scores else None
+
+    def should_speculate(self, resume_id: str) -> bool:
+        """Returns True if generation should start before the similarity gate finishes"""
+        if self.mode == "off":
+            return False
+        if self.mode == "always":
+            return True
+        expected = self.expected_score(resume_id)
+        speculate = expected is None or expected >= self.threshold - self.margin
+        self.logger.info(
+            "Expected soft cosine score for %s is %s - speculative generation: %s", resume_id, expected, speculate
+            )
+        return speculate
+
+    def record(self, resume_id: str, score: float, speculated: bool) -> None:
+        """Record the gate outcome for the resume and track wasted speculation"""
+        self.history[resume_id].append(float(score))
+        if speculated:
+            metrics.increment("speculation.started")
+            if score < self.threshold:
+                metrics.increment("speculation.cancelled")
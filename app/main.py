@@ -4,29 +4,46 @@ authors: Erin Hwang
 """
 import os
 import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
 from fastapi import FastAPI, Query, HTTPException, File, UploadFile
 from fastapi.openapi.docs import get_swagger_ui_html #remove later
 from fastapi.openapi.utils import get_openapi
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import HttpUrl
 import PyPDF2
 from pathlib import Path
 from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+from app.utils.loop_monitor import EventLoopLagMonitor
+from app.utils.sse import SSE_HEADERS, SSE_MEDIA_TYPE
+from app.utils.document_stream import (
+    ALLOWED_RESPONSE_MODES, multipart_stream, new_boundary, persist_documents, zip_stream
+    )
 from uuid import uuid4
 
-from app.controllers.listing_loader import JobListingLoader
+from app.controllers.threshold_evaluator import SpeculativeGenerationPolicy
+from app.controllers.scrape_pipeline import ScrapePipelineController, SimilarityThresholdNotMet
+from app.controllers.relevance_gate import ListingNotRelevant
+from app.controllers.section_regenerator import SectionRegeneratorController
+from app.controllers.batch_renderer import BatchRendererController
+from app.controllers.listing_ranker import ListingRankerController
 from app.controllers.resume_loader import ResumeLoader
-from app.controllers.threshold_evaluator import SemanticSimilarityEvaluator
-from app.controllers.resume_generator import ResumeGeneratorController
-from app.controllers.resume_renderer import ResumeRendererController
-from app.controllers.cl_generator import CoverLetterGeneratorController
-from app.controllers.cl_renderer import CoverLetterRendererController
-import re
+from app.controllers.render_pool import get_render_pool, shutdown_render_pool
+from app.controllers.scrape_job import EMBEDDING_WARMUP, SCRAPE_JOB, scrape_job_handlers, warmup_workers
+from app.controllers.scrape_stream import ScrapeStreamController
+from app.services.embedding import get_embedding_executor, shutdown_embedding_executors
+from app.services.docx_template import get_compiled_template
+from app.services.job_queue import JobWorker, job_queue
+from app.services.run_store import RunStore
+from app.schemas.render import RenderVariantsRequest
 from typing import Optional
 
 # TODO:tmp storage --> use opensearch later on (close to production)
 resume_storage = {"erin": "/Users/erinhwang/Projects/ResuMate/data/uploaded_resumes/thee_resume_rendrr_newPos.docx"} #key is uuiid, val is filepath
 cl_storage = {"erin": "/Users/erinhwang/Projects/ResuMate/data/uploaded_cls/thee_cover_letter_rendrrr_noSim.docx"}
+run_storage = RunStore() #key is run id, val is the run state needed for incremental regeneration
+resume_text_storage = {} #key is resume uuid, val is the extracted resume content
 
 logger = LoggerConfig().get_logger(__name__)
 
@@ -34,6 +51,10 @@ UPLOADED_RESUME_PATH = os.getenv("UPLOADED_RESUME_PATH")
 UPLOADED_CL_PATH = os.getenv("UPLOADED_CL_PATH")
 COSINE_THRESHOLD = float(os.getenv("COSINE_THRESHOLD")) #TODO: possibly remove
 SOFT_COSINE_THRESHOLD = float(os.getenv("SOFT_COSINE_THRESHOLD"))
+JOB_QUEUE_WORKER = os.getenv("JOB_QUEUE_WORKER", "embedded")
+
+speculation_policy = SpeculativeGenerationPolicy(threshold=SOFT_COSINE_THRESHOLD)
+job_worker = JobWorker(scrape_job_handlers(speculation_policy)) if JOB_QUEUE_WORKER == "embedded" else None
 
 tags_metadata = [
     {
@@ -46,13 +67,29 @@ tags_metadata = [
     }
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the loop lag monitor, the render workers, load and warm up the embedding workers and the job worker before serving requests"""
+    loop_monitor = EventLoopLagMonitor()
+    loop_monitor.start()
+    await warmup_workers()
+    if job_worker is not None:
+        job_worker.start()
+    yield
+    if job_worker is not None:
+        await job_worker.stop()
+    await loop_monitor.stop()
+    shutdown_embedding_executors()
+    shutdown_render_pool()
+
 app = FastAPI(
     title="ResuMate API",
     description="API for job listing scraping and analysis",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_tags=tags_metadata
+    openapi_tags=tags_metadata,
+    lifespan=lifespan
 )
 
 # Custom OpenAPI schema configuration
@@ -106,6 +143,9 @@ async def upload_resume(file: UploadFile):
             f.write(await file.read())
         logger.info(f"Uploaded resume file: {file.filename}")
         resume_storage[_file_uid] = str(file_location)
+        if file_location.suffix.lower() == ".docx":
+            # compile the rendering template now rather than on the first /scrape
+            await asyncio.to_thread(get_compiled_template, str(file_location))
         return JSONResponse(status_code=200, content = {
             "message": "Resume uploaded successfully",
             "resumate_uuid": _file_uid
@@ -149,6 +189,7 @@ async def upload_cover_letter(file: UploadFile):
             f.write(await file.read())
         logger.info(f"Uploaded cover letter file: {file.filename}")
         cl_storage[_file_uid] = str(file_location)
+        await asyncio.to_thread(get_compiled_template, str(file_location))
         return JSONResponse(status_code=200, content = {
             "message": "cover letter uploaded successfully",
             "resumate_uuid": _file_uid
@@ -206,7 +247,15 @@ async def scrape_url(
     ),
     contact_name: str = Query(
         default = None,
-    )
+    ),
+    response_mode: str = Query(
+        default="paths",
+        description="paths returns the saved file paths, zip or multipart stream the rendered documents back",
+    ),
+    persist: bool = Query(
+        default=True,
+        description="With zip or multipart, also save the documents once the response is sent",
+    ),
 ):
     """
     Scrape job listing content from URL
@@ -217,64 +266,35 @@ async def scrape_url(
     Returns:
         ScrapeResponse: Scraped content and status
     """
+    if response_mode not in ALLOWED_RESPONSE_MODES:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"Unknown response mode {response_mode}, expected one of {ALLOWED_RESPONSE_MODES}"}
+        )
     try:
         if resumate_uuid in resume_storage:
-
-
-            job_loader = JobListingLoader(
-                **{
-                    "company_name": company_name,
-                    "job_title": job_title,
-                    "job_id": job_id
-                    }
-                    )
-            job_loader_task = job_loader.process(url)
-            resume_loader_task = ResumeLoader(resume_storage[resumate_uuid]).process()
-
-            job_data, resume_data = await asyncio.gather(job_loader_task, resume_loader_task)
-            match = re.search(r"(.*?)# Additional Information", job_data, re.DOTALL)
-            job_data_result = match.group(1).strip()
-
-            semantic_scores = SemanticSimilarityEvaluator().process(resume_data, job_data_result)
-
-            if semantic_scores["soft_cosine_similarity"] >= SOFT_COSINE_THRESHOLD:
-                logger.info("Semantic similarity threshold met:\n\t%s", semantic_scores)
-                #generate the content for the resume and cover letter
-
+            pipeline = ScrapePipelineController(
+                url = url,
+                resume_path = resume_storage[resumate_uuid],
+                company_name = company_name,
+                job_title = job_title,
+                job_id = job_id,
                 #TODO: figure out the optional cover letter here - how can we determine if the cl should be rendered?
-                resume_generator_task = ResumeGeneratorController(resume_data, job_data).generate_content()
-
-                cl_keyword_extractor_task = CoverLetterGeneratorController(job_loader.file_path).process()
-                resume_content, cl_keyword_md = await asyncio.gather(resume_generator_task, cl_keyword_extractor_task)
-
-                if cl_uuid in cl_storage and cl_uuid is not None:
-                    #then render cover letter as well
-                    cl_renderer = CoverLetterRendererController(
-                        cl_path = cl_storage[cl_uuid],
-                        soft_cos_score= semantic_scores["soft_cosine_similarity"],
-                        md_info = cl_keyword_md,
-                        contact_name= contact_name,
-                        source_name = "cl_" + job_loader.source_type,
-                        )
-
-                    cl_fp = cl_renderer.execute()
-                else:
-                    cl_fp = "No cover letter rendered"
-
-                #TODO: add cl keyword (only position name here)
-                resume_renderer = ResumeRendererController(
-                    resume_path=resume_storage[resumate_uuid],
-                    generated_content=resume_content,
-                    source_name = job_loader.source_type,
-                    md_info = cl_keyword_md
-                    )
-
-                resume_fp =resume_renderer.execute()
-
-
-
-            else:
-                logger.info("Semantic similarity threshold NOT met:\n\t%s", semantic_scores)
+                cl_path = cl_storage[cl_uuid] if cl_uuid in cl_storage and cl_uuid is not None else None,
+                contact_name = contact_name,
+                speculation_policy = speculation_policy,
+                resume_id = resumate_uuid,
+                render_output = "file" if response_mode == "paths" else "memory",
+                )
+            try:
+                results = await pipeline.process()
+            except ListingNotRelevant as e:
+                return {
+                    "status": "Relevance pre-gate threshold NOT met",
+                    "url": str(url),
+                    "relevance": e.relevance,
+                }
+            except SimilarityThresholdNotMet:
                 #TODO: maybe add a response that says "not enough similarity"
                 return {
                     "status": "Semantic similarity threshold NOT met",
@@ -282,11 +302,18 @@ async def scrape_url(
                     # "content": semantic_scores["soft_cosine_similarity"], #figure out how to raise this.. jsondecode error
                     # "semantic_similarity": semantic_scores
                 }
+            resume_text_storage[resumate_uuid] = results["resume_data"]
+            run_id = str(uuid4())
+            run_storage.set(run_id, pipeline.run_state(results))
+            if response_mode != "paths":
+                return stream_documents(pipeline.documents, response_mode, persist, run_id)
             return {
                 "status": "success",
                 "url": str(url),
-                "resume_filepath": resume_fp,
-                "cover_letter_filepath": cl_fp,
+                "run_id": run_id,
+                "sections": list(results["resume_content"]),
+                "resume_filepath": results["resume_filepath"],
+                "cover_letter_filepath": results.get("cl_filepath", "No cover letter rendered"),
             }
         else:
             return JSONResponse(
@@ -305,9 +332,496 @@ async def scrape_url(
             }
         )
 
+@app.post(
+    "/scrape/submit",
+    tags=["scraper"],
+    summary="Queue a job listing scrape",
+    description="Queues the /scrape workflow and returns a job ID right away, poll /scrape/status for its progress and result"
+)
+async def submit_scrape(
+    resumate_uuid: str = Query(
+        ...,
+        description = "ResuMate UUID of the uploaded resume (retrieved using /upload-resume)",
+    ),
+    url: HttpUrl = Query(
+        ...,
+        description="URL of the job listing to scrape",
+        example="https://example.com/job-posting"
+    ),
+    company_name: str = Query(
+        default="generic",
+        description="Type of job listing source",
+        example="linkedin"
+    ),
+    job_title: str = Query(
+        default="generic",
+        description="Job title",
+        example="staff data scientist"
+    ),
+    job_id: str = Query(
+        default="generic",
+        description="Job ID",
+        example="123456"
+    ),
+    cl_uuid = Query(
+        default = None
+    ),
+    contact_name: str = Query(
+        default = None,
+    ),
+):
+    """
+    Queue the /scrape workflow for a worker
+
+    Args:
+        Same as /scrape
+
+    Returns:
+        dict: The job ID to poll
+    """
+    if resumate_uuid not in resume_storage:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "message": "Resume UUID not found. Please upload a resume first."
+            }
+        )
+    payload = {
+        "url": str(url),
+        "resumate_uuid": resumate_uuid,
+        "resume_path": resume_storage[resumate_uuid],
+        "company_name": company_name,
+        "job_title": job_title,
+        "job_id": job_id,
+        "cl_path": cl_storage[cl_uuid] if cl_uuid in cl_storage and cl_uuid is not None else None,
+        "contact_name": contact_name,
+    }
+    try:
+        scrape_job_id = await asyncio.to_thread(job_queue.submit, SCRAPE_JOB, payload)
+        return {"status": "queued", "url": str(url), "job_id": scrape_job_id}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": str(e)
+            }
+        )
+
+@app.get(
+    "/scrape/status",
+    tags=["scraper"],
+    summary="Poll a queued job listing scrape",
+    description="Returns the status and stage progress of a job queued by /scrape/submit, and its result once finished"
+)
+async def scrape_status(
+    job_id: str = Query(
+        ...,
+        description="Job ID returned by /scrape/submit",
+    ),
+):
+    """
+    Report the status of a queued /scrape job; a successful job is registered as a run for /regenerate
+
+    Args:
+        job_id (str): Job ID returned by /scrape/submit
+
+    Returns:
+        dict: The job status (queued, running, succeeded or failed), its stage progress and its result
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "message": "Job ID not found. Please run /scrape/submit first."
+            }
+        )
+    response = {
+        "status": job["status"],
+        "job_id": job_id,
+        "url": job["payload"]["url"],
+        "attempts": job["attempts"],
+        "progress": job["progress"] or {"stages": {}},
+    }
+    if job["status"] == "failed":
+        response["error"] = job["error"]
+    elif job["status"] == "succeeded":
+        result = dict(job["result"])
+        run_state = result.pop("run_state", None)
+        if run_state is not None:
+            # the job ID doubles as the run ID of /regenerate and /render-batch
+            run_storage.setdefault(job_id, run_state)
+            resume_text_storage[job["payload"]["resumate_uuid"]] = run_state["resume_data"]
+            result["run_id"] = job_id
+        response["result"] = result
+    return response
+
+@app.get(
+    "/scrape/stream",
+    tags=["scraper"],
+    summary="Stream the progress of a job listing scrape",
+    description="Runs the /scrape workflow and streams its partial results as server-sent events as soon as each stage finishes"
+)
+async def stream_scrape(
+    resumate_uuid: str = Query(
+        ...,
+        description = "ResuMate UUID of the uploaded resume (retrieved using /upload-resume)",
+    ),
+    url: HttpUrl = Query(
+        ...,
+        description="URL of the job listing to scrape",
+        example="https://example.com/job-posting"
+    ),
+    company_name: str = Query(
+        default="generic",
+        description="Type of job listing source",
+        example="linkedin"
+    ),
+    job_title: str = Query(
+        default="generic",
+        description="Job title",
+        example="staff data scientist"
+    ),
+    job_id: str = Query(
+        default="generic",
+        description="Job ID",
+        example="123456"
+    ),
+    cl_uuid = Query(
+        default = None
+    ),
+    contact_name: str = Query(
+        default = None,
+    ),
+):
+    """
+    Run the /scrape workflow and stream its events: scraped, relevance, listing_extracted, resume_ready,
+    similarity, one section per generated section, one rendered per document, then done (the /scrape
+    response with its run ID), not_relevant, not_similar or error. Closing the stream cancels the run.
+
+    Args:
+        Same as /scrape
+
+    Returns:
+        StreamingResponse: The text/event-stream of the run
+    """
+    if resumate_uuid not in resume_storage:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "message": "Resume UUID not found. Please upload a resume first."
+            }
+        )
+    payload = {
+        "url": str(url),
+        "resumate_uuid": resumate_uuid,
+        "resume_path": resume_storage[resumate_uuid],
+        "company_name": company_name,
+        "job_title": job_title,
+        "job_id": job_id,
+        "cl_path": cl_storage[cl_uuid] if cl_uuid in cl_storage and cl_uuid is not None else None,
+        "contact_name": contact_name,
+    }
+
+    def register_run(run_state: dict) -> str:
+        resume_text_storage[resumate_uuid] = run_state["resume_data"]
+        run_id = str(uuid4())
+        run_storage.set(run_id, run_state)
+        return run_id
+
+    try:
+        controller = ScrapeStreamController(payload, register_run, speculation_policy)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": str(e)
+            }
+        )
+    return StreamingResponse(controller.events(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+def stream_documents(documents: dict[str, bytes], response_mode: str, persist: bool, run_id: str) -> StreamingResponse:
+    """
+    Stream in-memory rendered documents back as a zip bundle or a multipart response
+
+    Args:
+        documents (dict[str, bytes]): Rendered documents keyed by the path they are saved to
+        response_mode (str): "zip" or "multipart"
+        persist (bool): Save the documents in a background task once the response is sent
+        run_id (str): Run ID of the /scrape run, returned in the X-Run-ID header
+
+    Returns:
+        StreamingResponse: The rendered documents, no disk access on the response path
+    """
+    files = {Path(filepath).name: content for filepath, content in documents.items()}
+    background = BackgroundTask(persist_documents, dict(documents)) if persist else None
+    headers = {"X-Run-ID": run_id}
+    if response_mode == "zip":
+        headers["Content-Disposition"] = f"attachment; filename=\"resumate_{run_id}.zip\""
+        return StreamingResponse(zip_stream(files), media_type="application/zip", headers=headers, background=background)
+    boundary = new_boundary()
+    return StreamingResponse(
+        multipart_stream(files, boundary), media_type=f"multipart/mixed; boundary={boundary}", headers=headers,
+        background=background,
+        )
+
+@app.post(
+    "/regenerate",
+    tags=["scraper"],
+    summary="Regenerate sections of a prior run",
+    description="Regenerates only the named resume sections of a prior /scrape run and re-renders the resume"
+)
+async def regenerate_sections(
+    run_id: str = Query(
+        ...,
+        description="Run ID returned by /scrape",
+    ),
+    sections: list[str] = Query(
+        ...,
+        description="Section names or position titles to regenerate (listed as sections by /scrape)",
+        example=["core_expertise"]
+    ),
+):
+    """
+    Regenerate the named sections of a prior run, reusing its job data and other generated sections
+
+    Args:
+        run_id (str): Run ID returned by /scrape
+        sections (list[str]): Section names or position titles to regenerate
+
+    Returns:
+        dict: The regenerated sections and rendered file paths
+    """
+    if run_id not in run_storage:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "message": "Run ID not found. Please run /scrape first."
+            }
+        )
+    try:
+        # one regeneration or re-render of a run at a time, the latest state is read once the lock is held
+        async with run_storage.lock(run_id):
+            run_state = run_storage.get(run_id)
+            if run_state is None:
+                return JSONResponse(status_code=404, content={"message": "Run ID not found. Please run /scrape first."})
+            run_state = await SectionRegeneratorController(run_state).process(sections)
+            run_storage.set(run_id, run_state)
+        return {
+            "status": "success",
+            "run_id": run_id,
+            "regenerated_sections": sections,
+            "resume_filepath": run_state["resume_filepath"],
+            "cover_letter_filepath": run_state["cl_filepath"],
+        }
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": str(e)
+            }
+        )
+
+@app.post(
+    "/render-batch",
+    tags=["scraper"],
+    summary="Re-render the documents of several prior runs",
+    description="Re-renders the resumes (and cover letters) of prior /scrape runs in one batch on the render workers"
+)
+async def render_batch(
+    run_ids: list[str] = Query(
+        ...,
+        description="Run IDs returned by /scrape",
+    ),
+    cover_letters: bool = Query(
+        default=True,
+        description="Whether to also render the cover letters",
+    ),
+):
+    """
+    Re-render the documents of several prior runs, a run failing to render does not fail the others
+
+    Args:
+        run_ids (list[str]): Run IDs returned by /scrape
+        cover_letters (bool): Whether to also render the cover letters
+
+    Returns:
+        dict: The rendered file paths or error messages per run ID
+    """
+    try:
+        async with AsyncExitStack() as stack:
+            # lock the runs in a fixed order so concurrent batches sharing runs cannot deadlock
+            for run_id in sorted(set(run_ids)):
+                if run_id in run_storage:
+                    await stack.enter_async_context(run_storage.lock(run_id))
+            run_states = {run_id: run_storage.get(run_id) for run_id in dict.fromkeys(run_ids)}
+            controller = BatchRendererController(
+                {run_id: run_state for run_id, run_state in run_states.items() if run_state is not None},
+                cover_letters=cover_letters,
+                )
+            results = await controller.process()
+            for run_id, run_state in controller.run_states.items():
+                run_storage.set(run_id, run_state)
+        for run_id, run_state in run_states.items():
+            if run_state is None:
+                results[run_id] = {"status": "error", "errors": ["Run ID not found. Please run /scrape first."]}
+        return {
+            "status": "success",
+            "rendered": sum(result["status"] == "success" for result in results.values()),
+            "failed": sum(result["status"] != "success" for result in results.values()),
+            "runs": results,
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": str(e)
+            }
+        )
+
+@app.post(
+    "/render-variants",
+    tags=["scraper"],
+    summary="Render many variants of one resume template",
+    description="Renders one resume (and cover letter) per generated-content payload from a single uploaded template"
+)
+async def render_variants(request: RenderVariantsRequest):
+    """
+    Render N documents from one template, ie the resumes of one user tailored to N listings; the template
+    is compiled once and a variant failing to render does not fail the others
+
+    Args:
+        request (RenderVariantsRequest): The uploaded resume (and cover letter) UUIDs and the generated
+            content of every variant (resume_content and cl_keyword_md as stored by /scrape)
+
+    Returns:
+        dict: The rendered file paths or error messages per variant ID
+    """
+    if request.resumate_uuid not in resume_storage:
+        return JSONResponse(status_code=404, content={"message": "Resume UUID not found. Please upload a resume first."})
+    if request.cl_uuid is not None and request.cl_uuid not in cl_storage:
+        return JSONResponse(status_code=404, content={"message": "Cover letter UUID not found. Please upload a cover letter first."})
+    resume_path = resume_storage[request.resumate_uuid]
+    cl_path = None if request.cl_uuid is None else cl_storage[request.cl_uuid]
+    try:
+        controller = BatchRendererController.from_template(
+            resume_path, [variant.model_dump() for variant in request.variants], cl_path=cl_path,
+            )
+        # compile the templates up front: a broken template fails the request once, not every variant
+        for path in (resume_path, cl_path):
+            if path is not None:
+                await asyncio.to_thread(get_compiled_template, path)
+        results = await controller.process()
+        return {
+            "status": "success",
+            "rendered": sum(result["status"] == "success" for result in results.values()),
+            "failed": sum(result["status"] != "success" for result in results.values()),
+            "variants": results,
+        }
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": str(e)
+            }
+        )
+
+@app.get(
+    "/rank",
+    tags=["scraper"],
+    summary="Rank indexed job listings against a resume",
+    description="Returns the top-k job listings extracted by /scrape that best match the uploaded resume"
+)
+async def rank_listings(
+    resumate_uuid: str = Query(
+        ...,
+        description = "ResuMate UUID of the uploaded resume (retrieved using /upload-resume)",
+    ),
+    top_k: int = Query(
+        default=10,
+        ge=1,
+        description="Number of listings to return",
+    ),
+    metric: str = Query(
+        default="soft_cosine_similarity",
+        description="Ranking metric (soft_cosine_similarity or cosine_similarity)",
+    ),
+):
+    """
+    Rank every indexed job listing against an uploaded resume
+
+    Args:
+        resumate_uuid (str): ResuMate UUID of the uploaded resume
+        top_k (int): Number of listings to return
+        metric (str): Ranking metric
+
+    Returns:
+        dict: The top-k listings with their cosine and soft cosine similarity
+    """
+    if resumate_uuid not in resume_storage:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "message": "Resume UUID not found. Please upload a resume first."
+            }
+        )
+    try:
+        if resumate_uuid not in resume_text_storage:
+            resume_text_storage[resumate_uuid] = await ResumeLoader(resume_storage[resumate_uuid]).process()
+        # a listing index not loaded at startup is read from disk, off the event loop
+        controller = await asyncio.to_thread(ListingRankerController, resume_text_storage[resumate_uuid])
+        listings = await controller.process(top_k=top_k, metric=metric)
+        return {
+            "status": "success",
+            "resumate_uuid": resumate_uuid,
+            "metric": metric,
+            "listings": listings,
+        }
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": str(e)
+            }
+        )
+
 @app.get("/health", tags=["health"])
 async def health_check():
     """Health check endpoint"""
     return {"status": "online"}
 
+@app.get("/ready", tags=["health"])
+async def readiness_check():
+    """Readiness endpoint - ready once the embedding workers are started and warmed up, right away when the warmup is disabled"""
+    embedding_status = get_embedding_executor().status()
+    # without warmup the model is loaded by the first request, there is nothing to wait for
+    ready = embedding_status["ready"] or not EMBEDDING_WARMUP
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "loading",
+            "embedding_model": embedding_status,
+            "render_pool": get_render_pool().status(),
+            "job_queue": await asyncio.to_thread(job_queue.counts),
+            "job_worker": None if job_worker is None else job_worker.status(),
+            }
+    )
+
+@app.get("/metrics", tags=["health"])
+async def get_metrics():
+    """Returns the in-process metrics (ie LLM token usage, cached prompt token share, embedding model load time and event loop lag)"""
+    return JSONResponse(status_code=200, content=metrics.snapshot())
+
 #TODO: checks if making calls is even worth it? lets not waste ppls time........
@@ -0,0 +1,17 @@
+"""
+This file contains the Pydantic class data models for structured (batched) resume generation
+authors: Erin Hwang
+"""
+
+from pydantic import BaseModel
+
+class GeneratedSection(BaseModel):
+    """A single generated resume section"""
+
+    name: str
+    content: str
+
+class GeneratedSections(BaseModel):
+    """Every generated resume section of a batched request"""
+
+    sections: list[GeneratedSection]
@@ -0,0 +1,23 @@
+"""
+This file contains the Pydantic class data models of the batch render of one template
+authors: Erin Hwang
+"""
+
+from pydantic import BaseModel
+
+class RenderVariant(BaseModel):
+    """Generated content of one document variant, ie the outputs of a /scrape run for one listing"""
+
+    variant_id: str | None = None
+    source_name: str
+    resume_content: dict
+    cl_keyword_md: str
+    soft_cosine_similarity: float | None = None
+    contact_name: str | None = None
+
+class RenderVariantsRequest(BaseModel):
+    """One resume (and cover letter) template and the variants rendered from it"""
+
+    resumate_uuid: str
+    cl_uuid: str | None = None
+    variants: list[RenderVariant]
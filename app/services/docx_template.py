@@ -0,0 +1,166 @@
+"""
+This file contains the registry of compiled DOCX templates patched by the resume and cover letter renderers
+authors: Erin Hwang
+"""
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
+
+from docx import Document
+from docx.document import Document as DocumentObject
+from docx.opc.oxml import serialize_part_xml
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+from app.utils.ooxml import replace_zip_entries
+from app.utils.placeholder_tokenizer import tokenize_placeholders
+
+DOCX_TEMPLATE_CACHE_SIZE = int(os.getenv("DOCX_TEMPLATE_CACHE_SIZE", "32"))
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "python-docx")
+ALLOWED_RENDER_BACKENDS = ("python-docx", "ooxml")
+
+#TODO: must be changed if other want to use it - high priority
+SUMMARY_MARKER = "As a multitalented Data Scientist"
+GREETING_MARKER = "Dear ["
+KEYWORD_PATTERNS = {
+    "core_expertise": r"(Core Expertise: )(.*)",
+    "technical_snapshot": r"(Technical Snapshot: )(.*)",
+    }
+
+
+class CompiledDocxTemplate:
+    """
+    A parsed DOCX template and every location the renderers patch, computed once per template version
+
+    The parsed document is never modified: every render patches a clone. Cloning deep copies the
+    main document part only, the styles, numbering, headers, images and every other part of the
+    package are shared by the clones because rendering never changes them.
+
+    Two backends write the rendered clone: "python-docx" saves the whole package through python-docx,
+    re-serializing every XML part; "ooxml" only serializes the patched document XML and copies every
+    other entry of the template zip as raw compressed bytes. The document XML is the same either way.
+
+    Args:
+        path (str): Path to the DOCX template, ie an uploaded resume or cover letter
+    """
+
+    def __init__(self, path: str):
+        self.path = str(Path(path).resolve())
+        self.mtime = os.path.getmtime(self.path)
+        with open(self.path, "rb") as f:
+            self.source = f.read()
+        self.document = Document(BytesIO(self.source))
+        self.document_part_name = self.document.part.partname.lstrip("/")
+
+        paragraphs = self.document.paragraphs
+        self.paragraph_texts = [paragraph.text for paragraph in paragraphs]
+        self.alignments = [str(paragraph.alignment) for paragraph in paragraphs]
+        self.run_texts = [[run.text for run in paragraph.runs] for paragraph in paragraphs]
+        joined_texts = ["".join(texts) for texts in self.run_texts]
+
+        self.placeholder_paragraphs = [i for i, text in enumerate(self.paragraph_texts) if "[" in text]
+        self.placeholders = {i: tokenize_placeholders(self.run_texts[i]) for i in self.placeholder_paragraphs}
+        self.keyword_lines = {
+            section: next((i for i, text in enumerate(joined_texts) if re.search(pattern, text)), None)
+            for section, pattern in KEYWORD_PATTERNS.items()
+            }
+        self.summary_run = next(
+            ((i_par, i_run) for i_par, texts in enumerate(self.run_texts)
+             for i_run, text in enumerate(texts) if SUMMARY_MARKER in text),
+            None,
+            )
+        self.greeting_paragraph = next((i for i, text in enumerate(joined_texts) if GREETING_MARKER in text), None)
+
+    def __len__(self) -> int:
+        return len(self.paragraph_texts)
+
+    def find_paragraph(self, text: str, start: int = 0) -> int | None:
+        """Index of the first template paragraph from `start` containing `text`, ie a section heading"""
+        return next((i for i in range(start, len(self.paragraph_texts)) if text in self.paragraph_texts[i]), None)
+
+    def clone(self, backend: str = RENDER_BACKEND) -> DocumentObject:
+        """
+        A private copy of the document to render into
+
+        Args:
+            backend (str): "python-docx" or "ooxml", the backend later passed to save
+
+        Returns:
+            Document: With the "ooxml" backend only the document XML is copied and the proxy still
+                points at the template part, so it must be written with save and not Document.save
+        """
+        if backend not in ALLOWED_RENDER_BACKENDS:
+            raise ValueError(f"Unknown render backend {backend}, expected one of {ALLOWED_RENDER_BACKENDS}")
+        document_part = self.document.part
+        if backend == "ooxml":
+            return DocumentObject(copy.deepcopy(document_part.element), document_part)
+        memo = {id(part): part for part in document_part.package.iter_parts() if part is not document_part}
+        # copy the part rather than the Document proxy, whose cached body proxy would not follow the copied tree
+        return copy.deepcopy(document_part, memo).document
+
+    def save(self, doc: DocumentObject, destination: str | BinaryIO, backend: str = RENDER_BACKEND) -> None:
+        """
+        Write a rendered clone as a DOCX package
+
+        Args:
+            doc (Document): Clone returned by clone with the same backend
+            destination (str | BinaryIO): Path or writable binary file
+            backend (str): "python-docx" or "ooxml"
+        """
+        start = time.perf_counter()
+        if backend == "ooxml":
+            replace_zip_entries(self.source, {self.document_part_name: serialize_part_xml(doc.element)}, destination)
+        else:
+            doc.save(destination)
+        metrics.observe(f"render.save_seconds.{backend}", time.perf_counter() - start)
+
+
+class DocxTemplateRegistry:
+    """
+    Compiled templates keyed by path, recompiled when the file changes
+
+    Args:
+        max_entries (int): Number of compiled templates kept, the least recently used is evicted first
+    """
+
+    def __init__(self, max_entries: int = DOCX_TEMPLATE_CACHE_SIZE):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.max_entries = max_entries
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> CompiledDocxTemplate:
+        """Returns the compiled template of the file, compiling it on first use or after a change"""
+        key = str(Path(path).resolve())
+        mtime = os.path.getmtime(key)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None and template.mtime == mtime:
+                self._templates.move_to_end(key)
+                metrics.increment("docx_template.hits")
+                return template
+
+        start = time.perf_counter()
+        template = CompiledDocxTemplate(key)
+        metrics.increment("docx_template.compiles")
+        metrics.observe("docx_template.compile_seconds", time.perf_counter() - start)
+        self.logger.info("Compiled DOCX template %s (%s paragraphs)", key, len(template))
+
+        with self._lock:
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return template
+
+template_registry = DocxTemplateRegistry()
+
+def get_compiled_template(path: str) -> CompiledDocxTemplate:
+    """Returns the process-wide compiled template of the DOCX file"""
+    return template_registry.get(path)
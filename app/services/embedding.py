@@ -0,0 +1,619 @@
+"""
+This file contains the embedding model service shared by every request of the process
+authors: Erin Hwang
+"""
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+from app.services.embedding_store import EmbeddingStore, get_embedding_store
+from app.utils.logger import LoggerConfig
+from app.utils.markdown import split_sections
+from app.utils.metrics import metrics
+
+TRANSFORMER_MODEL = os.getenv("TRANSFORMER_MODEL")
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10"))
+EMBEDDING_EXECUTOR = os.getenv("EMBEDDING_EXECUTOR", "thread")
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_QUANTIZATION_CONFIG = os.getenv("EMBEDDING_QUANTIZATION_CONFIG", "avx2")
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH", "./data/onnx_models")
+EMBEDDING_CHUNKING = os.getenv("EMBEDDING_CHUNKING", "off")
+EMBEDDING_CHUNK_MAX_WORDS = int(os.getenv("EMBEDDING_CHUNK_MAX_WORDS", "200"))
+EMBEDDING_WARMUP_TEXT = "ResuMate embedding model warmup"
+ALLOWED_CHUNKING = ("off", "sections")
+ALLOWED_BACKENDS = ("torch", "onnx", "onnx-int8")
+# encode kwargs that do not change the embeddings, other kwargs bypass the embedding cache
+CACHEABLE_ENCODE_KWARGS = {"batch_size", "show_progress_bar"}
+
+
+def embedding_model_id(model_name: str, backend: str = EMBEDDING_BACKEND) -> str:
+    """Identity of the embeddings produced by a model - exported and quantized backends drift slightly"""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+def export_onnx_model(
+    model_name: str,
+    backend: str = EMBEDDING_BACKEND,
+    quantization_config: str = EMBEDDING_QUANTIZATION_CONFIG,
+    onnx_path: str = EMBEDDING_ONNX_PATH,
+) -> tuple[str, dict]:
+    """
+    Export the model to ONNX (and quantize it to int8) once, reusing the export afterwards
+
+    Args:
+        model_name (str): Name or path of the sentence transformer model
+        backend (str): "onnx" or "onnx-int8"
+        quantization_config (str): onnxruntime dynamic quantization config ("arm64", "avx2", "avx512" or "avx512_vnni")
+        onnx_path (str): Root directory of the exported models
+
+    Returns:
+        tuple[str, dict]: Path of the exported model and the model_kwargs selecting its ONNX file
+    """
+    export_dir = Path(onnx_path) / re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+    if not (export_dir / "onnx" / "model.onnx").exists():
+        # sentence-transformers exports on the fly when the model has no ONNX file
+        SentenceTransformer(model_name, backend="onnx").save(str(export_dir))
+    if backend == "onnx":
+        return str(export_dir), {"file_name": "onnx/model.onnx"}
+
+    file_suffix = f"int8_{quantization_config}"
+    file_name = f"onnx/model_{file_suffix}.onnx"
+    if not (export_dir / file_name).exists():
+        export_dynamic_quantized_onnx_model(
+            SentenceTransformer(str(export_dir), backend="onnx", model_kwargs={"file_name": "onnx/model.onnx"}),
+            quantization_config,
+            str(export_dir),
+            file_suffix=file_suffix,
+            )
+    return str(export_dir), {"file_name": file_name}
+
+def load_sentence_transformer(model_name: str, backend: str = EMBEDDING_BACKEND) -> SentenceTransformer:
+    """
+    Load the model with the given inference backend
+
+    Args:
+        model_name (str): Name or path of the sentence transformer model
+        backend (str): "torch", "onnx" (exported ONNX on onnxruntime) or "onnx-int8" (dynamically quantized ONNX)
+
+    Raises:
+        ValueError: If the backend is unknown
+
+    Returns:
+        SentenceTransformer: The loaded model
+    """
+    if backend not in ALLOWED_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend}, expected one of {ALLOWED_BACKENDS}")
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    model_path, model_kwargs = export_onnx_model(model_name, backend)
+    return SentenceTransformer(model_path, backend="onnx", model_kwargs=model_kwargs)
+
+def merge_cached(cached: list, misses: list[int], embeddings: np.ndarray) -> np.ndarray:
+    """
+    Fill the cache misses with the freshly encoded embeddings
+
+    Args:
+        cached (list): Cached embedding of every text, None on a miss
+        misses (list[int]): Positions of the misses in `cached`
+        embeddings (np.ndarray): Embeddings of the missed texts, in order
+
+    Returns:
+        np.ndarray: One embedding per text
+    """
+    for position, embedding in zip(misses, embeddings):
+        cached[position] = embedding
+    return np.vstack(cached).astype(np.float32, copy=False)
+
+
+def chunk_document(text: str, max_words: int = EMBEDDING_CHUNK_MAX_WORDS) -> list[tuple[str, str, int]]:
+    """
+    Split a markdown document into chunks that fit the transformer's max sequence length
+
+    Every markdown section (up to ##) is one chunk; longer sections are cut into windows of
+    `max_words` words, every window after the first prefixed with the section path for context.
+
+    Args:
+        text (str): Markdown document
+        max_words (int): Maximum number of words per chunk
+
+    Returns:
+        list[tuple[str, str, int]]: (section path, chunk text, number of words) in document order
+    """
+    chunks = []
+    for path, section_text in split_sections(text):
+        words = section_text.split()
+        for start in range(0, len(words), max_words):
+            window = words[start:start + max_words]
+            chunk_text = " ".join(window)
+            if start > 0 and path:
+                chunk_text = f"{path}: {chunk_text}"
+            chunks.append((path, chunk_text, len(window)))
+    return chunks or [("", text, 1)]
+
+def pool_chunks(embeddings: np.ndarray, weights: list[int]) -> np.ndarray:
+    """
+    Pool chunk embeddings into one vector, weighting every chunk by its number of words
+
+    The pooled vector keeps the weighted mean norm of the chunks so documents that fit in one chunk
+    and chunked documents produce vectors on the same scale (a single chunk is returned unchanged).
+
+    Args:
+        embeddings (np.ndarray): Chunk embeddings of shape (n_chunks, d)
+        weights (list[int]): Weight of every chunk
+
+    Returns:
+        np.ndarray: Pooled embedding of shape (d,)
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.shape[0] == 1:
+        return embeddings[0]
+    weights = np.asarray(weights, dtype=np.float32) / np.sum(weights)
+    pooled = weights @ embeddings
+    norm = np.linalg.norm(pooled)
+    target_norm = weights @ np.linalg.norm(embeddings, axis=1)
+    return pooled * (target_norm / norm) if norm > 0 else pooled
+
+def plan_documents(texts: list[str], max_words: int = EMBEDDING_CHUNK_MAX_WORDS) -> tuple[list[str], list[list]]:
+    """Chunk every document; returns the flat list of chunk texts and the chunks of every document"""
+    documents = [chunk_document(text, max_words) for text in texts]
+    flat_texts = [chunk_text for chunks in documents for _, chunk_text, _ in chunks]
+    metrics.observe("embedding.chunks_per_document", len(flat_texts) / max(1, len(texts)))
+    return flat_texts, documents
+
+def pool_documents(embeddings: np.ndarray, documents: list[list], return_sections: bool = False):
+    """
+    Pool the flat chunk embeddings back into one vector per document
+
+    Args:
+        embeddings (np.ndarray): Embedding of every chunk, in the order of plan_documents
+        documents (list[list]): The chunks of every document returned by plan_documents
+        return_sections (bool): Also return the pooled vector of every section
+
+    Returns:
+        np.ndarray | tuple[np.ndarray, list[dict]]: Document embeddings of shape (n_documents, d), and
+            with `return_sections` a {section path: embedding} dict per document
+    """
+    vectors, sections, offset = [], [], 0
+    for chunks in documents:
+        chunk_embeddings = embeddings[offset:offset + len(chunks)]
+        offset += len(chunks)
+        vectors.append(pool_chunks(chunk_embeddings, [weight for _, _, weight in chunks]))
+        if return_sections:
+            rows = {}
+            for row, (path, _, _) in enumerate(chunks):
+                rows.setdefault(path, []).append(row)
+            sections.append({
+                path: pool_chunks(chunk_embeddings[section_rows], [chunks[row][2] for row in section_rows])
+                for path, section_rows in rows.items()
+                })
+    document_embeddings = np.vstack(vectors)
+    return (document_embeddings, sections) if return_sections else document_embeddings
+
+
+class EmbeddingModelService:
+    """
+    Loads a SentenceTransformer model once and shares it across requests
+
+    Loading is lazy and thread-safe; the FastAPI lifespan calls warmup() at startup so the
+    first request does not pay for loading the weights or the first (slow) forward pass.
+    Texts found in the embedding store are not encoded again.
+
+    Args:
+        model_name (str): Name or path of the sentence transformer model
+        store (EmbeddingStore, optional): Embedding cache, defaults to the process-wide store of the model
+        backend (str): Inference backend, "torch", "onnx" or "onnx-int8"
+    """
+
+    def __init__(
+        self,
+        model_name: str = TRANSFORMER_MODEL,
+        store: EmbeddingStore | None = None,
+        backend: str = EMBEDDING_BACKEND,
+    ):
+        if backend not in ALLOWED_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend}, expected one of {ALLOWED_BACKENDS}")
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.model_name = model_name
+        self.backend = backend
+        self.model_id = embedding_model_id(model_name, backend)
+        self.store = store if store is not None else get_embedding_store(self.model_id)
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready = False
+        self.error = None
+        # micro-batch encoder of a service outside the process-wide registry, see get_service_encoder
+        self.encoder = None
+
+    @property
+    def model(self) -> SentenceTransformer:
+        """The loaded model, loading it on first access"""
+        if self._model is None:
+            self.load()
+        return self._model
+
+    def load(self) -> SentenceTransformer:
+        """Load the model weights once"""
+        with self._lock:
+            if self._model is None:
+                self.logger.info("Loading sentence transformer %s (%s backend)...", self.model_name, self.backend)
+                start = time.perf_counter()
+                try:
+                    self._model = load_sentence_transformer(self.model_name, self.backend)
+                except Exception as e:
+                    self.error = str(e)
+                    self.logger.error("Could not load sentence transformer %s: %s", self.model_name, e)
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                # a model loaded on first use (no warmup, or after a failed warmup) serves requests as well
+                self.ready = True
+                self.error = None
+                metrics.set_gauge(f"embedding.{self.model_id}.load_seconds", self.load_seconds)
+                self.logger.info("Loaded sentence transformer %s in %.2fs", self.model_name, self.load_seconds)
+        return self._model
+
+    def warmup(self) -> None:
+        """Load the model and run a first encode so it is ready to serve requests"""
+        model = self.load()
+        start = time.perf_counter()
+        model.encode([EMBEDDING_WARMUP_TEXT])
+        self.warmup_seconds = time.perf_counter() - start
+        self.ready = True
+        metrics.set_gauge(f"embedding.{self.model_id}.warmup_seconds", self.warmup_seconds)
+        self.logger.info("Warmed up sentence transformer %s in %.2fs", self.model_name, self.warmup_seconds)
+
+    def encode(self, texts: list[str], **kwargs) -> np.ndarray:
+        """
+        Encode the texts with the shared model, skipping the texts found in the embedding store
+
+        Args:
+            texts (list[str]): Texts to encode
+            **kwargs: Forwarded to SentenceTransformer.encode
+
+        Returns:
+            np.ndarray: One embedding per text
+        """
+        if self.store is None or not texts or set(kwargs) - CACHEABLE_ENCODE_KWARGS:
+            return self.encode_uncached(texts, **kwargs)
+        cached = self.store.get_many(texts)
+        misses = [i for i, vector in enumerate(cached) if vector is None]
+        embeddings = []
+        if misses:
+            miss_texts = [texts[i] for i in misses]
+            embeddings = self.encode_uncached(miss_texts, **kwargs)
+            self.store.put_many(miss_texts, embeddings)
+        return merge_cached(cached, misses, embeddings)
+
+    def encode_documents(self, texts: list[str], chunking: str = EMBEDDING_CHUNKING, return_sections: bool = False):
+        """
+        Encode whole documents, chunked along their markdown sections when chunking is "sections"
+
+        Every chunk of every document is encoded in a single batch, so the cost grows linearly with
+        the document length instead of the tail of long documents being truncated.
+
+        Args:
+            texts (list[str]): Markdown documents
+            chunking (str): "off" encodes every document as one (truncated) text, "sections" chunks it
+            return_sections (bool): Also return the pooled vector of every section (chunking only)
+
+        Returns:
+            np.ndarray | tuple[np.ndarray, list[dict]]: See pool_documents
+        """
+        if chunking not in ALLOWED_CHUNKING:
+            raise ValueError(f"Unknown embedding chunking {chunking}, expected one of {ALLOWED_CHUNKING}")
+        if chunking == "off":
+            embeddings = self.encode(texts)
+            return (embeddings, [{} for _ in texts]) if return_sections else embeddings
+        flat_texts, documents = plan_documents(texts)
+        return pool_documents(self.encode(flat_texts), documents, return_sections)
+
+    def encode_uncached(self, texts: list[str], **kwargs) -> np.ndarray:
+        """Encode the texts with the shared model"""
+        start = time.perf_counter()
+        embeddings = self.model.encode(texts, **kwargs)
+        metrics.increment("embedding.encode_calls")
+        metrics.increment("embedding.encoded_texts", len(texts))
+        metrics.observe("embedding.encode_seconds", time.perf_counter() - start)
+        return embeddings
+
+    def status(self) -> dict:
+        """Readiness and load-time information of the model"""
+        return {
+            "model_name": self.model_name,
+            "backend": self.backend,
+            "loaded": self._model is not None,
+            "ready": self.ready,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+
+# model of the current embedding worker process, loaded by init_embedding_worker
+_worker_model = None
+
+def init_embedding_worker(model_name: str, backend: str) -> None:
+    """Process pool initializer - loads and warms up the model once per worker process"""
+    global _worker_model
+    _worker_model = load_sentence_transformer(model_name, backend)
+    _worker_model.encode([EMBEDDING_WARMUP_TEXT])
+
+def encode_in_worker(texts: list[str], kwargs: dict) -> np.ndarray:
+    """Encode the texts with the model of the current worker process"""
+    return _worker_model.encode(texts, **kwargs)
+
+def ping_worker() -> int:
+    """Returns the worker pid, used to make sure every worker process has started"""
+    return os.getpid()
+
+
+class EmbeddingExecutor:
+    """
+    Dedicated executor running the embedding model off the event loop
+
+    With the "thread" kind the workers share the process-wide EmbeddingModelService; PyTorch releases
+    the GIL while encoding so the event loop keeps serving requests. With the "process" kind every
+    worker process loads its own copy of the model through init_embedding_worker.
+
+    Args:
+        service (EmbeddingModelService): Service holding the model of this process
+        kind (str): "thread" or "process"
+        workers (int): Number of worker threads or processes
+    """
+    ALLOWED_KINDS = ("thread", "process")
+
+    def __init__(self, service: EmbeddingModelService, kind: str = EMBEDDING_EXECUTOR, workers: int = EMBEDDING_WORKERS):
+        if kind not in self.ALLOWED_KINDS:
+            raise ValueError(f"Unknown embedding executor {kind}, expected one of {self.ALLOWED_KINDS}")
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.service = service
+        self.kind = kind
+        self.workers = max(1, workers)
+        self._pool = None
+        self._lock = threading.Lock()
+        self.ready = False
+
+    @property
+    def pool(self):
+        """The worker pool, created on first access"""
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    if self.service.backend != "torch":
+                        # export once here so the workers do not race to export the same model
+                        export_onnx_model(self.service.model_name, self.service.backend)
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=init_embedding_worker,
+                        initargs=(self.service.model_name, self.service.backend),
+                        )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding")
+                self.logger.info("Started %s embedding %s worker(s)", self.workers, self.kind)
+        return self._pool
+
+    def warmup(self) -> None:
+        """Start every worker and load its model (blocking)"""
+        if self.kind == "process":
+            start = time.perf_counter()
+            futures = [self.pool.submit(ping_worker) for _ in range(self.workers)]
+            pids = {future.result() for future in futures}
+            metrics.set_gauge(f"embedding.{self.service.model_id}.warmup_seconds", time.perf_counter() - start)
+            self.logger.info("Embedding worker processes ready: %s", sorted(pids))
+        else:
+            self.service.warmup()
+        self.ready = True
+
+    async def encode(self, texts: list[str], **kwargs) -> np.ndarray:
+        """
+        Encode the texts on a worker without blocking the event loop
+
+        Args:
+            texts (list[str]): Texts to encode
+            **kwargs: Forwarded to SentenceTransformer.encode
+
+        Returns:
+            np.ndarray: One embedding per text
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        if self.kind == "process":
+            embeddings = await loop.run_in_executor(self.pool, encode_in_worker, list(texts), kwargs)
+        else:
+            embeddings = await loop.run_in_executor(self.pool, lambda: self.service.encode_uncached(texts, **kwargs))
+        # the workers loaded their model on first use when the warmup was skipped or failed
+        self.ready = True
+        metrics.observe("embedding.executor_seconds", time.perf_counter() - start)
+        return embeddings
+
+    def shutdown(self) -> None:
+        """Stop the worker pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+        self.ready = False
+
+    def status(self) -> dict:
+        """Readiness information of the executor and its model"""
+        return {
+            **self.service.status(),
+            "executor": self.kind,
+            "workers": self.workers,
+            "ready": self.ready or (self.kind == "thread" and self.service.ready),
+        }
+
+
+class MicroBatchEncoder:
+    """
+    Coalesces encode requests from concurrent requests into micro-batches
+
+    The first request of a batch opens a time window; every request arriving within the window
+    is encoded in the same SentenceTransformer.encode call. A batch is flushed early once it
+    holds `max_batch_size` texts. The encode itself runs on the EmbeddingExecutor; texts found in
+    the embedding store never join a batch.
+
+    Args:
+        executor (EmbeddingExecutor): Executor running the model
+        max_batch_size (int): Number of texts that triggers an immediate flush
+        window_ms (float): How long the first request of a batch waits for others to join
+    """
+
+    def __init__(
+        self,
+        executor: EmbeddingExecutor,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+    ):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_ms / 1000
+        self._pending = []
+        self._pending_texts = 0
+        self._timer = None
+        self._batch_tasks = set()
+
+    async def encode(self, texts: list[str]) -> np.ndarray:
+        """
+        Encode the texts as part of the next micro-batch
+
+        Args:
+            texts (list[str]): Texts to encode
+
+        Returns:
+            np.ndarray: One embedding per text
+        """
+        store = self.executor.service.store
+        if store is None or not texts:
+            return await self.enqueue(list(texts))
+        # memmap reads and file appends stay off the event loop
+        cached = await asyncio.to_thread(store.get_many, texts)
+        misses = [i for i, vector in enumerate(cached) if vector is None]
+        embeddings = []
+        if misses:
+            miss_texts = [texts[i] for i in misses]
+            embeddings = await self.enqueue(miss_texts)
+            await asyncio.to_thread(store.put_many, miss_texts, embeddings)
+        return merge_cached(cached, misses, embeddings)
+
+    async def encode_documents(self, texts: list[str], chunking: str = EMBEDDING_CHUNKING, return_sections: bool = False):
+        """Awaitable EmbeddingModelService.encode_documents - every chunk joins the same micro-batch"""
+        if chunking not in ALLOWED_CHUNKING:
+            raise ValueError(f"Unknown embedding chunking {chunking}, expected one of {ALLOWED_CHUNKING}")
+        if chunking == "off":
+            embeddings = await self.encode(texts)
+            return (embeddings, [{} for _ in texts]) if return_sections else embeddings
+        flat_texts, documents = plan_documents(texts)
+        return pool_documents(await self.encode(flat_texts), documents, return_sections)
+
+    async def enqueue(self, texts: list[str]) -> np.ndarray:
+        """Add the texts to the next micro-batch and wait for their embeddings"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_texts += len(texts)
+
+        if self._pending_texts >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Send every pending request to the model as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_texts = self._pending, [], 0
+        task = asyncio.get_running_loop().create_task(self.run_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def run_batch(self, batch: list) -> None:
+        """Encode a batch and resolve the future of every request in it"""
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        metrics.increment("embedding.batches")
+        metrics.increment("embedding.batched_requests", len(batch))
+        metrics.observe("embedding.batch_size", len(texts))
+        metrics.observe("embedding.batch_fill", min(1.0, len(texts) / self.max_batch_size))
+        self.logger.debug("Encoding micro-batch of %s texts from %s requests", len(texts), len(batch))
+        try:
+            embeddings = await self.executor.encode(texts, batch_size=self.max_batch_size)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, future in batch:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+
+_services = {}
+_executors = {}
+_encoders = {}
+_services_lock = threading.Lock()
+
+def get_embedding_service(model_name: str = TRANSFORMER_MODEL) -> EmbeddingModelService:
+    """Returns the process-wide EmbeddingModelService of the given model"""
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingModelService(model_name)
+        return _services[model_name]
+
+def get_embedding_executor(model_name: str = TRANSFORMER_MODEL) -> EmbeddingExecutor:
+    """Returns the process-wide EmbeddingExecutor of the given model"""
+    service = get_embedding_service(model_name)
+    with _services_lock:
+        if model_name not in _executors:
+            _executors[model_name] = EmbeddingExecutor(service)
+        return _executors[model_name]
+
+def get_micro_batch_encoder(model_name: str = TRANSFORMER_MODEL) -> MicroBatchEncoder:
+    """Returns the process-wide MicroBatchEncoder of the given model"""
+    executor = get_embedding_executor(model_name)
+    with _services_lock:
+        if model_name not in _encoders:
+            _encoders[model_name] = MicroBatchEncoder(executor)
+        return _encoders[model_name]
+
+def get_service_encoder(service: EmbeddingModelService) -> MicroBatchEncoder:
+    """
+    Returns the MicroBatchEncoder encoding with the given service
+
+    The process-wide service of a model uses the process-wide encoder. Any other service (ie one
+    injected with its own store or backend) gets an encoder of its own on a thread executor, so its
+    model, store and backend are the ones used.
+    """
+    with _services_lock:
+        shared = _services.get(service.model_name) is service
+    if shared:
+        return get_micro_batch_encoder(service.model_name)
+    with _services_lock:
+        if service.encoder is None:
+            service.encoder = MicroBatchEncoder(EmbeddingExecutor(service, kind="thread"))
+        return service.encoder
+
+def shutdown_embedding_executors() -> None:
+    """Stop the worker pool of every embedding executor"""
+    with _services_lock:
+        executors = list(_executors.values())
+    for executor in executors:
+        executor.shutdown()
@@ -0,0 +1,220 @@
+"""
+This file contains the persistent embedding cache keyed by text hash and transformer model
+authors: Erin Hwang
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from app.utils.file_lock import file_lock
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache")
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+EMBEDDING_CACHE_HOT_SIZE = int(os.getenv("EMBEDDING_CACHE_HOT_SIZE", "1024"))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so formatting-only differences share one embedding"""
+    return " ".join(text.split())
+
+def text_key(text: str) -> str:
+    """sha256 of the normalized text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Embedding cache of one transformer model, kept on disk and partially in memory
+
+    The vectors are appended to a raw matrix file read back through np.memmap and their text hashes
+    to a key file, one per line, so line i holds the key of row i. Recently used vectors are kept in an in-memory LRU hot set so repeated
+    lookups do not touch the disk.
+
+    Several processes (the API and the job workers) may share the store: appends hold a file lock
+    and first read the rows the other processes appended, so every process numbers the rows alike,
+    and lookups pick up the new rows of the other processes before reporting a miss.
+
+    Args:
+        model_name (str): Transformer model the embeddings belong to
+        path (str): Root directory of the cache, one sub directory per model
+        dtype (str): "float32" or "float16" (half the size on disk, ~1e-3 score drift)
+        hot_size (int): Number of vectors kept in the in-memory hot set
+    """
+    ALLOWED_DTYPES = ("float32", "float16")
+
+    def __init__(
+        self,
+        model_name: str,
+        path: str = EMBEDDING_CACHE_PATH,
+        dtype: str = EMBEDDING_CACHE_DTYPE,
+        hot_size: int = EMBEDDING_CACHE_HOT_SIZE,
+    ):
+        if dtype not in self.ALLOWED_DTYPES:
+            raise ValueError(f"Unknown embedding cache dtype {dtype}, expected one of {self.ALLOWED_DTYPES}")
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.hot_size = hot_size
+        self.directory = Path(path) / re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+        self.matrix_path = self.directory / f"vectors.{dtype}.bin"
+        self.keys_path = self.directory / f"keys.{dtype}.txt"
+        self.meta_path = self.directory / "meta.json"
+        self.lock_path = self.directory / ".lock"
+        self._lock = threading.RLock()
+        self._hot = OrderedDict()
+        self._matrix = None
+        self._keys_offset = 0
+        self.dim = None
+        self.n_rows = 0
+        self.rows = {}
+        self.load_index()
+
+    def load_index(self) -> None:
+        """Read the hash to row index from disk, dropping rows a crashed write left incomplete"""
+        if not self.meta_path.exists():
+            return
+        with self._lock, file_lock(self.lock_path):
+            self.refresh()
+            self.repair()
+        self.logger.info("Loaded %s cached embeddings of %s", len(self.rows), self.model_name)
+
+    def refresh(self) -> None:
+        """Read the rows appended to the key file since the last read, by this process or another one"""
+        if self.dim is None:
+            if not self.meta_path.exists():
+                return
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if not self.keys_path.exists() or self.keys_path.stat().st_size <= self._keys_offset:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            appended = f.read()
+        # a line without its newline is still being written (or was cut by a crash)
+        appended = appended[:appended.rfind(b"\n") + 1]
+        for key in appended.decode("utf-8").splitlines():
+            # vectors are written before their keys, so every complete key line has its vector
+            self.rows.setdefault(key, self.n_rows)
+            self.n_rows += 1
+        self._keys_offset += len(appended)
+
+    def repair(self) -> None:
+        """Cut both files after the last complete row, dropping what a crashed write left (file lock held)"""
+        if self.keys_path.exists() and self.keys_path.stat().st_size > self._keys_offset:
+            os.truncate(self.keys_path, self._keys_offset)
+        matrix_bytes = self.n_rows * self.dim * self.dtype.itemsize
+        if self.matrix_path.exists() and self.matrix_path.stat().st_size > matrix_bytes:
+            os.truncate(self.matrix_path, matrix_bytes)
+
+    def matrix(self) -> np.ndarray:
+        """Memory map of every stored vector, re-opened after appends"""
+        if self._matrix is None or self._matrix.shape[0] != self.n_rows:
+            self._matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=(self.n_rows, self.dim))
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def remember(self, key: str, vector: np.ndarray) -> None:
+        """Put a vector in the hot set, evicting the least recently used one"""
+        self._hot[key] = vector
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def get_many(self, texts: list[str]) -> list[np.ndarray | None]:
+        """
+        Look up the embedding of every text
+
+        Args:
+            texts (list[str]): Texts to look up
+
+        Returns:
+            list[np.ndarray | None]: The float32 embedding of every text, None on a miss
+        """
+        results = []
+        hits = 0
+        with self._lock:
+            self.refresh()
+            for text in texts:
+                key = text_key(text)
+                vector = self._hot.get(key)
+                if vector is not None:
+                    self._hot.move_to_end(key)
+                elif key in self.rows:
+                    vector = np.array(self.matrix()[self.rows[key]], dtype=np.float32)
+                    self.remember(key, vector)
+                    metrics.increment("embedding_cache.disk_reads")
+                hits += vector is not None
+                results.append(vector)
+        metrics.increment("embedding_cache.lookups", len(texts))
+        metrics.increment("embedding_cache.hits", hits)
+        metrics.set_gauge("embedding_cache.hit_rate", metrics.ratio("embedding_cache.hits", "embedding_cache.lookups"))
+        return results
+
+    def put_many(self, texts: list[str], embeddings: np.ndarray) -> None:
+        """
+        Store the embedding of every text not stored yet
+
+        Args:
+            texts (list[str]): Encoded texts
+            embeddings (np.ndarray): One embedding per text
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, embeddings):
+                self.remember(key, vector)
+            if all(key in self.rows for key in keys):
+                return
+            with file_lock(self.lock_path):
+                # catch up with the other processes first, they may have stored some of these texts
+                self.refresh()
+                new_rows = {}
+                vectors = []
+                for key, vector in zip(keys, embeddings):
+                    if key not in self.rows and key not in new_rows:
+                        new_rows[key] = self.n_rows + len(new_rows)
+                        vectors.append(vector)
+                if not vectors:
+                    return
+                if self.dim is None:
+                    self.dim = embeddings.shape[1]
+                    with open(self.meta_path, "w", encoding="utf-8") as f:
+                        json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+                elif embeddings.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the store ({self.dim})")
+                self.repair()
+
+                # vectors first: a key is only visible once its vector is complete, repair drops a vector left without its key
+                with open(self.matrix_path, "ab") as f:
+                    f.write(np.asarray(vectors, dtype=self.dtype).tobytes())
+                appended = "".join(f"{key}\n" for key in new_rows).encode("utf-8")
+                with open(self.keys_path, "ab") as f:
+                    f.write(appended)
+                self.rows.update(new_rows)
+                self.n_rows += len(new_rows)
+                self._keys_offset += len(appended)
+        metrics.set_gauge(f"embedding_cache.{self.model_name}.size", len(self.rows))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(model_name: str) -> EmbeddingStore | None:
+    """Returns the process-wide EmbeddingStore of the given model, None if the cache is disabled"""
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _stores_lock:
+        if model_name not in _stores:
+            _stores[model_name] = EmbeddingStore(model_name)
+        return _stores[model_name]
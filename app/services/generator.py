@@ -7,15 +7,70 @@ import os
 from app.utils.logger import LoggerConfig
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, SystemMessage
 
+from app.utils.metrics import metrics
 from app.utils.prompt_loader import initialize_prompt
 
 CHAT_MODEL = os.getenv("CHAT_MODEL")
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "default")
+SHARED_PREFIX_PROMPT_NAME = os.getenv("SHARED_PREFIX_PROMPT_NAME", "section_shared_prefix")
+STRUCTURED_OUTPUT_METHOD = os.getenv("STRUCTURED_OUTPUT_METHOD", "auto")
+
+# chat models accepting response_format=json_schema (OpenAI structured outputs); older models such as
+# gpt-4, gpt-4-turbo and gpt-3.5-turbo reject it but support function calling
+JSON_SCHEMA_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-4.5", "gpt-5", "o1", "o3", "o4")
+JSON_SCHEMA_UNSUPPORTED_MODELS = ("gpt-4o-2024-05-13",)
+ALLOWED_STRUCTURED_OUTPUT_METHODS = ("auto", "json_schema", "function_calling")
+
+
+def structured_output_method(model_name: str | None, method: str = STRUCTURED_OUTPUT_METHOD) -> str:
+    """
+    Structured output method of with_structured_output for a chat model
+
+    Args:
+        model_name (str): Chat model name, ie "gpt-4o-mini"
+        method (str): "json_schema", "function_calling" or "auto" to pick json_schema only for the
+            models supporting it
+
+    Returns:
+        str: "json_schema" or "function_calling"
+    """
+    if method not in ALLOWED_STRUCTURED_OUTPUT_METHODS:
+        raise ValueError(f"Invalid structured output method: {method}, expected one of {ALLOWED_STRUCTURED_OUTPUT_METHODS}")
+    if method != "auto":
+        return method
+    model_name = (model_name or "").lower()
+    if model_name.startswith(JSON_SCHEMA_MODEL_PREFIXES) and model_name not in JSON_SCHEMA_UNSUPPORTED_MODELS:
+        return "json_schema"
+    return "function_calling"
 
 class ChatGPTRequestService:
-    def __init__(self, prompt_name: str, model_name: str = CHAT_MODEL):
+    """
+    Sends section generation requests to OpenAI's ChatGPT suite
+
+    Args:
+        prompt_name (str): Name of the prompt in the config file
+        model_name (str): Chat model used for generation
+        prompt_layout (str): "default" sends the prompt as written in the config file;
+            "prefix_cached" sends the shared prefix prompt (static instructions, job_data and
+            professional_data) first and the "<prompt_name>_cached" prompt with the per-section
+            variables last, so the provider can cache the byte-identical prefix across sections
+        structured_method (str): Structured output method of send_structured_request, see structured_output_method
+    """
+    ALLOWED_LAYOUTS = {"default", "prefix_cached"}
+    SHARED_PREFIX_PARAMETERS = ("job_data", "professional_data")
+
+    def __init__(
+            self, prompt_name: str, model_name: str = CHAT_MODEL, prompt_layout: str = PROMPT_LAYOUT,
+            structured_method: str = STRUCTURED_OUTPUT_METHOD
+            ):
         self.logger = LoggerConfig().get_logger(__name__)
         self.prompt_name = prompt_name
+        if prompt_layout not in self.ALLOWED_LAYOUTS:
+            raise ValueError(f"Invalid prompt layout: {prompt_layout}")
+        self.prompt_layout = prompt_layout
+        self.structured_method = structured_output_method(model_name, structured_method)
         load_dotenv()
 
         api_key = os.getenv("OPENAI_API_KEY")
@@ -26,10 +81,55 @@ class ChatGPTRequestService:
         self.model_name = model_name
         self.model = ChatOpenAI(model = self.model_name, api_key=api_key)
 
+    def record_token_usage(self, gpt_json: dict) -> None:
+        """
+        Track prompt, cached prompt and completion tokens reported in the response metadata
+
+        Args:
+            gpt_json (dict): The dumped AIMessage returned by the model
+        """
+        usage = gpt_json.get("usage_metadata") or {}
+        input_tokens = usage.get("input_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        if not usage:
+            # fall back on the raw OpenAI token usage block
+            token_usage = gpt_json["response_metadata"].get("token_usage") or {}
+            input_tokens = token_usage.get("prompt_tokens", 0)
+            cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+            usage = {"output_tokens": token_usage.get("completion_tokens", 0)}
+
+        metrics.increment("llm.requests")
+        metrics.increment("llm.input_tokens", input_tokens)
+        metrics.increment("llm.cached_input_tokens", cached_tokens)
+        metrics.increment("llm.output_tokens", usage.get("output_tokens", 0))
+        metrics.set_gauge("llm.cached_token_share", metrics.ratio("llm.cached_input_tokens", "llm.input_tokens"))
+        self.logger.info(
+            "%s used %s prompt tokens (%s cached, %.1f%%) for %s",
+            self.model_name,
+            input_tokens,
+            cached_tokens,
+            100 * cached_tokens / input_tokens if input_tokens else 0.0,
+            self.prompt_name
+            )
+
+    def parse_response(self, gpt_response) -> str:
+        """Log the finish reason, track token usage and return the generated content"""
+        gpt_json = gpt_response.model_dump()
+        if gpt_json["response_metadata"]["finish_reason"] == "stop":
+            self.logger.info(
+                "%s completed it's response naturally without hitting any limits such as max tokens or stop sequence", self.model_name)
+        else:
+            self.logger.info(
+                "%s completed it's response due to hitting a limit such as max tokens or stop sequence", self.model_name)
+        self.record_token_usage(gpt_json)
+        return gpt_json["content"]
+
     async def send_request(self, **kwargs):
         """
         Send a request to the ChatGPT model with the input data
         """
+        if self.prompt_layout == "prefix_cached":
+            return await self.send_prefix_cached_request(**kwargs)
         try:
             prompt = (initialize_prompt(self.prompt_name))[self.prompt_name]
 
@@ -45,14 +145,50 @@ class ChatGPTRequestService:
                 inputs = prompt.get_all_inputs() #investigate this during testing
                 self.logger.debug("LLM prompt %s \n input(s): \n %s", prompt.value, inputs)
                 gpt_response = await chain.ainvoke(inputs)
-                gpt_json = gpt_response.model_dump()
-                if gpt_json["response_metadata"]["finish_reason"] == "stop":
-                    self.logger.info(
-                        "%s completed it's response naturally without hitting any limits such as max tokens or stop sequence", self.model_name)
-                else:
-                    self.logger.info(
-                        "%s completed it's response due to hitting a limit such as max tokens or stop sequence", self.model_name)
-                return gpt_json["content"]
+                return self.parse_response(gpt_response)
+
+            unmapped_params = [
+                parameter for parameter, value in prompt.get_all_inputs().items() if value is None
+                ]
+            self.logger.error(f"There is an unmapped parameter(s): {unmapped_params}")
+            raise ValueError(f"There is an unmapped parameter(s): {unmapped_params}")
+
+        except Exception as e:
+            self.logger.error(f"Error extracting job details: {e}")
+            raise
+
+    async def send_structured_request(self, schema, **kwargs):
+        """
+        Send a request to the ChatGPT model and parse the response against a JSON schema
+
+        The schema is sent as a json_schema response format to the models supporting it, as a function
+        (tool) otherwise, so the default gpt-4 model does not fail every structured request
+
+        Args:
+            schema (type[BaseModel]): Pydantic model describing the expected response
+
+        Returns:
+            BaseModel: The parsed response
+        """
+        try:
+            prompt = (initialize_prompt(self.prompt_name))[self.prompt_name]
+
+            for key, value in kwargs.items():
+                prompt.map_value(key, value)
+            self.logger.info(prompt.description)
+
+            if prompt.is_usable():
+                self.logger.info("Starting structured generation job for %s", prompt.prompt_name)
+                template = prompt.get_template()
+                structured_model = self.model.with_structured_output(
+                    schema, method=self.structured_method, include_raw=True
+                    )
+                chain = template | structured_model
+                response = await chain.ainvoke(prompt.get_all_inputs())
+                self.parse_response(response["raw"])
+                if response["parsing_error"] is not None:
+                    raise response["parsing_error"]
+                return response["parsed"]
 
             unmapped_params = [
                 parameter for parameter, value in prompt.get_all_inputs().items() if value is None
@@ -64,6 +200,55 @@ class ChatGPTRequestService:
             self.logger.error(f"Error extracting job details: {e}")
             raise
 
+    def build_prefix_cached_messages(self, **kwargs) -> list:
+        """
+        Assemble the prompt as static instructions, then the shared job and professional data,
+        then the per-section variables
+
+        The shared prefix only depends on job_data and professional_data, so it is byte-identical
+        for every section of a request (and across requests for the same listing and resume)
+
+        Returns:
+            list: The system (shared prefix) and human (per-section) messages
+        """
+        section_prompt_name = f"{self.prompt_name}_cached"
+        shared_prompt = (initialize_prompt(SHARED_PREFIX_PROMPT_NAME))[SHARED_PREFIX_PROMPT_NAME]
+        section_prompt = (initialize_prompt(section_prompt_name))[section_prompt_name]
+
+        for key, value in kwargs.items():
+            if key in self.SHARED_PREFIX_PARAMETERS:
+                shared_prompt.map_value(key, value)
+            else:
+                section_prompt.map_value(key, value)
+
+        unmapped_params = [
+            parameter
+            for prompt in (shared_prompt, section_prompt)
+            for parameter, value in prompt.get_all_inputs().items() if value is None
+            ]
+        if unmapped_params:
+            self.logger.error(f"There is an unmapped parameter(s): {unmapped_params}")
+            raise ValueError(f"There is an unmapped parameter(s): {unmapped_params}")
+
+        self.logger.info(section_prompt.description)
+        shared_prefix = shared_prompt.get_template().format(**shared_prompt.get_all_inputs())
+        section_suffix = section_prompt.get_template().format(**section_prompt.get_all_inputs())
+        return [SystemMessage(content=shared_prefix), HumanMessage(content=section_suffix)]
+
+    async def send_prefix_cached_request(self, **kwargs):
+        """
+        Send a request to the ChatGPT model using the prefix-cached prompt layout
+        """
+        try:
+            messages = self.build_prefix_cached_messages(**kwargs)
+            self.logger.info("Starting prefix-cached generation job for %s", self.prompt_name)
+            gpt_response = await self.model.ainvoke(messages)
+            return self.parse_response(gpt_response)
+
+        except Exception as e:
+            self.logger.error(f"Error extracting job details: {e}")
+            raise
+
 async def test_main():
     test_job_data = "roses are red violets are blue"
     test_resume_data = ["depressing", "violent", "boisterous"]
@@ -0,0 +1,339 @@
+"""
+This file contains the persistent job queue and the bounded worker running queued /scrape jobs
+authors: Erin Hwang
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Callable
+from uuid import uuid4
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "./data/job_queue.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+def to_json(value: Any) -> str:
+    """JSON text of a job payload, progress or result; numpy scalars are stored as numbers"""
+    return json.dumps(value, default=lambda obj: obj.item() if hasattr(obj, "item") else str(obj))
+
+
+class JobQueue:
+    """
+    Jobs persisted in a local SQLite database, shared by the API and worker processes of one host
+
+    Every method opens its own short-lived connection, so the queue can be used from any thread.
+    A running job holds a lease renewed by its worker; a job whose lease expired (ie its worker
+    died) is claimed again, up to `max_attempts` times, then failed.
+
+    Args:
+        path (str): Path to the SQLite database, created on first use
+        lease_seconds (float): Time a worker may go without renewing the lease of a running job
+        max_attempts (int): Number of times a job is claimed before it is failed
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        """A new autocommit connection, creating the database and its schema on first use"""
+        with self._lock:
+            if not self._initialized:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+                # WAL lets the API read job status while a worker writes
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                connection.close()
+                self._initialized = True
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def submit(self, kind: str, payload: dict) -> str:
+        """
+        Queue a job
+
+        Args:
+            kind (str): Job kind, selects the handler of the worker, ie "scrape"
+            payload (dict): JSON-serializable handler arguments
+
+        Returns:
+            str: The job ID
+        """
+        job_id = str(uuid4())
+        with closing(self.connect()) as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, kind, to_json(payload), time.time()),
+                )
+        metrics.increment("job_queue.submitted")
+        return job_id
+
+    def claim(self, worker: str) -> dict | None:
+        """
+        Take the oldest queued job, or a running job whose lease expired
+
+        Args:
+            worker (str): Worker identifier stored on the job
+
+        Returns:
+            dict | None: The claimed job, None when there is nothing to run
+        """
+        now = time.time()
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker lost', worker = NULL, lease_until = NULL, "
+                "finished_at = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+                )
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,),
+                ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_until = ?, "
+                "started_at = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row["id"]),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        job = self.to_dict(row)
+        job.update(status="running", worker=worker, attempts=row["attempts"] + 1, started_at=now)
+        return job
+
+    # every update of a claimed job is conditioned on its worker and on the job still running: once a
+    # lease expired and another worker claimed or failed the job, the updates of the previous worker
+    # are ignored
+
+    def heartbeat(self, job_id: str, worker: str, progress: dict) -> bool:
+        """Store the progress of a running job and renew its lease, returns False if the worker lost the job"""
+        with closing(self.connect()) as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET progress = ?, lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (to_json(progress), time.time() + self.lease_seconds, job_id, worker),
+                )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: str, worker: str, result: dict, progress: dict | None = None) -> bool:
+        """Mark a job succeeded with its result, returns False if the worker lost the job"""
+        with closing(self.connect()) as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, progress = COALESCE(?, progress), "
+                "finished_at = ?, lease_until = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+                (to_json(result), None if progress is None else to_json(progress), time.time(), job_id, worker),
+                )
+        return cursor.rowcount > 0
+
+    def fail(self, job_id: str, worker: str, error: str, progress: dict | None = None) -> bool:
+        """Mark a job failed with its error message, returns False if the worker lost the job"""
+        with closing(self.connect()) as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, progress = COALESCE(?, progress), "
+                "finished_at = ?, lease_until = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+                (error, None if progress is None else to_json(progress), time.time(), job_id, worker),
+                )
+        return cursor.rowcount > 0
+
+    def release(self, job_id: str, worker: str) -> None:
+        """Put a running job back in the queue, ie when its worker shuts down"""
+        with closing(self.connect()) as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts - 1 "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (job_id, worker),
+                )
+
+    def get(self, job_id: str) -> dict | None:
+        """The job with its status, progress and result, None if unknown"""
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self.to_dict(row)
+
+    def counts(self) -> dict:
+        """Number of jobs per status"""
+        with closing(self.connect()) as connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in JOB_STATUSES} | {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def to_dict(row: sqlite3.Row) -> dict:
+        """A job row with its JSON columns decoded"""
+        job = dict(row)
+        for column in ("payload", "progress", "result"):
+            job[column] = None if job[column] is None else json.loads(job[column])
+        return job
+
+job_queue = JobQueue()
+
+
+class JobWorker:
+    """
+    Runs queued jobs with at most `concurrency` jobs at a time
+
+    Every handler is called as `await handler(payload, progress)` where `progress` is a dict the
+    handler updates in place (ie from a pipeline on_event hook); it is stored with every lease
+    renewal, so pollers see the stage progress without a database write per event.
+
+    Args:
+        handlers (dict[str, Callable]): Async handler per job kind, returning a JSON-serializable result
+        queue (JobQueue, optional): Job queue, defaults to the process-wide queue
+        concurrency (int): Maximum number of jobs run at the same time
+        poll_interval (float): Seconds between two claims when the queue is empty
+    """
+
+    def __init__(
+        self,
+        handlers: dict[str, Callable],
+        queue: JobQueue | None = None,
+        concurrency: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+    ):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.handlers = handlers
+        self.queue = queue or job_queue
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = 0
+        self._slots = []
+
+    async def run_job(self, job: dict) -> None:
+        """Run a claimed job, renewing its lease while it runs"""
+        progress = {"stages": {}}
+        handler = self.handlers.get(job["kind"])
+
+        async def keep_lease():
+            while True:
+                await asyncio.sleep(min(self.poll_interval, self.queue.lease_seconds / 3))
+                # a failed renewal is retried on the next beat, the lease outlives several beats
+                try:
+                    if not await asyncio.to_thread(self.queue.heartbeat, job["id"], job["worker"], progress):
+                        self.logger.warning("Job %s was claimed by another worker after its lease expired", job["id"])
+                        metrics.increment("job_queue.leases_lost")
+                        return
+                except sqlite3.Error as e:
+                    self.logger.error("Lease renewal of job %s failed: %s", job["id"], e)
+
+        metrics.observe("job_queue.wait_seconds", job["started_at"] - job["created_at"])
+        start = time.perf_counter()
+        lease = asyncio.create_task(keep_lease())
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind {job['kind']}")
+            result = await handler(job["payload"], progress)
+        except asyncio.CancelledError:
+            self.logger.info("Job %s interrupted, back in the queue", job["id"])
+            try:
+                # off the event loop: on shutdown the release may wait on the sqlite busy timeout
+                await asyncio.to_thread(self.queue.release, job["id"], job["worker"])
+            except sqlite3.Error as e:
+                self.logger.error("Could not release job %s, it is claimed again once its lease expires: %s", job["id"], e)
+            raise
+        except Exception as e:
+            self.logger.error("Job %s failed: %s", job["id"], e)
+            metrics.increment("job_queue.failed")
+            await self.finish(job, self.queue.fail, str(e), progress)
+        else:
+            metrics.increment("job_queue.succeeded")
+            await self.finish(job, self.queue.complete, result, progress)
+        finally:
+            lease.cancel()
+            metrics.observe("job_queue.run_seconds", time.perf_counter() - start)
+
+    async def finish(self, job: dict, mark: Callable, outcome: Any, progress: dict) -> None:
+        """Store the outcome of a job with queue.complete or queue.fail"""
+        try:
+            if not await asyncio.to_thread(mark, job["id"], job["worker"], outcome, progress):
+                self.logger.warning("Job %s finished after another worker claimed it, its outcome is dropped", job["id"])
+        except sqlite3.Error as e:
+            # the job stays running until its lease expires, then it is claimed again
+            self.logger.error("Could not store the outcome of job %s: %s", job["id"], e)
+            metrics.increment("job_queue.store_errors")
+
+    async def slot(self, i_slot: int) -> None:
+        """Claim and run jobs one after the other until cancelled"""
+        worker = f"{self.name}:{i_slot}"
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim, worker)
+            except sqlite3.Error as e:
+                self.logger.error("Job claim failed: %s", e)
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            self.logger.info("Worker %s running job %s (%s)", worker, job["id"], job["kind"])
+            self.running += 1
+            metrics.set_gauge("job_queue.running", self.running)
+            try:
+                await self.run_job(job)
+            except Exception as e:
+                # never let one job take the slot down with it
+                self.logger.error("Worker %s could not run job %s: %s", worker, job["id"], e)
+            finally:
+                self.running -= 1
+                metrics.set_gauge("job_queue.running", self.running)
+
+    def start(self) -> None:
+        """Start the worker slots on the running event loop"""
+        self._slots = [asyncio.create_task(self.slot(i), name=f"job_worker.{i}") for i in range(self.concurrency)]
+        self.logger.info("Started job worker %s with %s slot(s) on %s", self.name, self.concurrency, self.queue.path)
+
+    async def stop(self) -> None:
+        """Cancel the worker slots; jobs cut short are claimed again once their lease expires"""
+        for task in self._slots:
+            task.cancel()
+        await asyncio.gather(*self._slots, return_exceptions=True)
+        self._slots = []
+
+    def status(self) -> dict:
+        """Configuration and load of the worker"""
+        return {"worker": self.name, "slots": self.concurrency, "running": self.running}
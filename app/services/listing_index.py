@@ -0,0 +1,205 @@
+"""
+This file contains the embedding index of every job listing extracted by ResuMate
+authors: Erin Hwang
+"""
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services.embedding import EMBEDDING_CHUNKING, embedding_model_id
+from app.utils.file_lock import file_lock
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+
+TRANSFORMER_MODEL = os.getenv("TRANSFORMER_MODEL")
+LISTING_INDEX_PATH = os.getenv("LISTING_INDEX_PATH", "./data/listing_index")
+LISTING_INDEX_MODEL = os.getenv("LISTING_INDEX_MODEL") or TRANSFORMER_MODEL
+
+
+class ListingEmbeddingIndex:
+    """
+    In-memory matrix of listing embeddings with incremental inserts, persisted as an append-only log
+
+    Rows live in a preallocated matrix that doubles its capacity when full, so an insert does not
+    copy every stored embedding. Re-inserting a listing ID replaces its row. Every insert appends its
+    vector to embeddings.float32.bin and its metadata to listings.jsonl (line i describes vector i), so
+    persisting an insert costs one row however large the index is; the log is replayed in order and
+    the last entry of a listing ID wins.
+
+    The API and the job worker processes share the index: appends hold a file lock and first replay
+    the entries the other processes appended, and snapshot (used by /rank) replays them as well, so
+    every process sees the listings indexed by the others.
+
+    Args:
+        model_name (str): Transformer model of the embeddings
+        path (str): Root directory of the index, one sub directory per model
+    """
+
+    def __init__(self, model_name: str = LISTING_INDEX_MODEL, path: str = LISTING_INDEX_PATH):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.model_name = model_name
+        # pooled chunk vectors and truncated single-text vectors must not share an index
+        index_id = embedding_model_id(model_name) + ("" if EMBEDDING_CHUNKING == "off" else f"@{EMBEDDING_CHUNKING}")
+        self.directory = Path(path) / re.sub(r"[^A-Za-z0-9_.-]+", "__", index_id)
+        self.vectors_path = self.directory / "embeddings.float32.bin"
+        self.log_path = self.directory / "listings.jsonl"
+        self.meta_path = self.directory / "meta.json"
+        self.lock_path = self.directory / ".lock"
+        # index saved as a whole by previous versions, converted to the log on load
+        self.legacy_embeddings_path = self.directory / "embeddings.npy"
+        self.legacy_listings_path = self.directory / "listings.json"
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._log_offset = 0
+        self.dim = None
+        self.n_entries = 0
+        self.listings = []
+        self.rows = {}
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def load(self) -> None:
+        """Replay the persisted log, dropping entries a crashed write left incomplete"""
+        if not self.directory.exists():
+            return
+        with self._lock, file_lock(self.lock_path):
+            if not self.log_path.exists() and self.legacy_embeddings_path.exists() and self.legacy_listings_path.exists():
+                self.convert_legacy()
+            self.refresh()
+            self.repair()
+        self.logger.info("Loaded %s indexed listings of %s", len(self.listings), self.model_name)
+
+    def refresh(self) -> None:
+        """Replay the entries appended to the log since the last read, by this process or another one"""
+        if self.dim is None:
+            if not self.meta_path.exists():
+                return
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if not self.log_path.exists() or self.log_path.stat().st_size <= self._log_offset:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            appended = f.read()
+        # a line without its newline is still being written (or was cut by a crash)
+        appended = appended[:appended.rfind(b"\n") + 1]
+        entries = [json.loads(line) for line in appended.decode("utf-8").splitlines()]
+        # vectors are written before their log line, so every complete line has its vector
+        vectors = np.fromfile(
+            self.vectors_path, dtype=np.float32, count=len(entries) * self.dim, offset=self.n_entries * self.row_bytes
+            ).reshape(-1, self.dim)
+        for listing, vector in zip(entries, vectors):
+            self.insert(listing, vector)
+        self.n_entries += len(entries)
+        self._log_offset += len(appended)
+        metrics.set_gauge("listing_index.size", len(self.listings))
+
+    def repair(self) -> None:
+        """Cut both log files after the last complete entry, dropping what a crashed write left (file lock held)"""
+        if self.log_path.exists() and self.log_path.stat().st_size > self._log_offset:
+            os.truncate(self.log_path, self._log_offset)
+        if self.dim is not None and self.vectors_path.exists() and self.vectors_path.stat().st_size > self.n_entries * self.row_bytes:
+            os.truncate(self.vectors_path, self.n_entries * self.row_bytes)
+
+    @property
+    def row_bytes(self) -> int:
+        """Size of one vector in embeddings.float32.bin"""
+        return self.dim * np.dtype(np.float32).itemsize
+
+    def convert_legacy(self) -> None:
+        """Write an index saved as embeddings.npy and listings.json to the log (file lock held)"""
+        with open(self.legacy_listings_path, "r", encoding="utf-8") as f:
+            listings = json.load(f)
+        embeddings = np.load(self.legacy_embeddings_path).astype(np.float32)
+        for listing, vector in zip(listings, embeddings):
+            self.append(listing, vector)
+        self.logger.info("Converted %s indexed listings of %s to the append-only log", len(listings), self.model_name)
+
+    def append(self, listing: dict, embedding: np.ndarray) -> None:
+        """Persist one entry at the end of the log (file lock held)"""
+        if self.dim is None:
+            self.dim = embedding.shape[0]
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+        # vector first: a log line is only visible once its vector is complete
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.asarray(embedding, dtype=np.float32).tobytes())
+        with open(self.log_path, "ab") as f:
+            f.write((json.dumps(listing) + "\n").encode("utf-8"))
+
+    def embeddings(self) -> np.ndarray:
+        """The (n_listings, d) embedding matrix"""
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:len(self.listings)]
+
+    def insert(self, listing: dict, embedding: np.ndarray) -> int:
+        """Insert or replace a listing in memory, returns its row"""
+        if self._matrix is None:
+            self._matrix = np.empty((16, embedding.shape[0]), dtype=np.float32)
+        elif embedding.shape[0] != self._matrix.shape[1]:
+            raise ValueError(f"Embedding dimension {embedding.shape[0]} does not match the index ({self._matrix.shape[1]})")
+
+        row = self.rows.get(listing["listing_id"])
+        if row is None:
+            row = len(self.listings)
+            if row == self._matrix.shape[0]:
+                grown = np.empty((max(16, 2 * row), self._matrix.shape[1]), dtype=np.float32)
+                grown[:row] = self._matrix
+                self._matrix = grown
+            self.listings.append(listing)
+            self.rows[listing["listing_id"]] = row
+        else:
+            self.listings[row] = listing
+        self._matrix[row] = embedding
+        return row
+
+    def add(self, listing_id: str, embedding: np.ndarray, metadata: dict | None = None) -> int:
+        """
+        Insert or replace a listing and append it to the persisted log (blocking file I/O)
+
+        Args:
+            listing_id (str): Unique listing ID, ie the listing URL
+            embedding (np.ndarray): Listing embedding of shape (d,) or (1, d)
+            metadata (dict, optional): Listing metadata returned with the search results
+
+        Returns:
+            int: Row of the listing in the index
+        """
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        listing = {**(metadata or {}), "listing_id": listing_id, "indexed_at": time.time()}
+        with self._lock, file_lock(self.lock_path):
+            self.refresh()
+            if self.dim is not None and embedding.shape[0] != self.dim:
+                raise ValueError(f"Embedding dimension {embedding.shape[0]} does not match the index ({self.dim})")
+            self.repair()
+            self.append(listing, embedding)
+            row = self.insert(listing, embedding)
+            self.n_entries += 1
+            self._log_offset = self.log_path.stat().st_size
+        metrics.set_gauge("listing_index.size", len(self.listings))
+        return row
+
+    def snapshot(self) -> tuple[np.ndarray, list[dict]]:
+        """Consistent copy of the embedding matrix and listing metadata, including the listings of other processes"""
+        with self._lock:
+            self.refresh()
+            return self.embeddings().copy(), list(self.listings)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_listing_index(model_name: str = LISTING_INDEX_MODEL) -> ListingEmbeddingIndex:
+    """Returns the process-wide ListingEmbeddingIndex of the given model"""
+    with _indexes_lock:
+        if model_name not in _indexes:
+            _indexes[model_name] = ListingEmbeddingIndex(model_name)
+        return _indexes[model_name]
@@ -0,0 +1,86 @@
+"""
+This file contains the bounded in-memory store of the run states used by /regenerate and /render-batch
+authors: Erin Hwang
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from app.utils.metrics import metrics
+
+RUN_STORE_MAX_RUNS = int(os.getenv("RUN_STORE_MAX_RUNS", "256"))
+RUN_STORE_TTL_SECONDS = float(os.getenv("RUN_STORE_TTL_SECONDS", "86400"))
+
+
+class RunStore:
+    """
+    Run states of prior /scrape runs, keyed by run ID, bounded in number and age
+
+    The least recently used run is evicted beyond `max_runs` runs, and a run left unused for
+    `ttl_seconds` expires. Run states are replaced, never changed in place, so a request always reads
+    a whole state; `lock(run_id)` serializes the requests that regenerate or re-render the same run.
+
+    Args:
+        max_runs (int): Maximum number of runs kept
+        ttl_seconds (float): Seconds a run is kept after its last use
+    """
+
+    def __init__(self, max_runs: int = RUN_STORE_MAX_RUNS, ttl_seconds: float = RUN_STORE_TTL_SECONDS):
+        self.max_runs = max(1, max_runs)
+        self.ttl_seconds = ttl_seconds
+        self._runs = OrderedDict() #key is run id, val is (run state, last use)
+        self._locks = {}
+
+    def evict(self) -> None:
+        """Drop the expired runs, then the least recently used runs beyond max_runs"""
+        now = time.monotonic()
+        # runs are ordered by last use, so the expired ones come first
+        while self._runs and now - next(iter(self._runs.values()))[1] > self.ttl_seconds:
+            self.drop(next(iter(self._runs)))
+            metrics.increment("run_store.expired")
+        while len(self._runs) > self.max_runs:
+            self.drop(next(iter(self._runs)))
+            metrics.increment("run_store.evicted")
+        metrics.set_gauge("run_store.runs", len(self._runs))
+
+    def drop(self, run_id: str) -> None:
+        """Forget a run and its lock"""
+        self._runs.pop(run_id, None)
+        self._locks.pop(run_id, None)
+
+    def get(self, run_id: str) -> dict | None:
+        """The run state, None if unknown or expired; marks the run as used"""
+        self.evict()
+        if run_id not in self._runs:
+            return None
+        run_state, _ = self._runs[run_id]
+        self._runs[run_id] = (run_state, time.monotonic())
+        self._runs.move_to_end(run_id)
+        return run_state
+
+    def set(self, run_id: str, run_state: dict) -> None:
+        """Store a run state, replacing the previous state of the run"""
+        self._runs[run_id] = (run_state, time.monotonic())
+        self._runs.move_to_end(run_id)
+        self.evict()
+
+    def setdefault(self, run_id: str, run_state: dict) -> dict:
+        """Store a run state unless the run is known, returns the stored state"""
+        stored = self.get(run_id)
+        if stored is None:
+            self.set(run_id, run_state)
+            stored = run_state
+        return stored
+
+    def lock(self, run_id: str) -> asyncio.Lock:
+        """The lock held while a request regenerates or re-renders the run"""
+        return self._locks.setdefault(run_id, asyncio.Lock())
+
+    def __contains__(self, run_id: str) -> bool:
+        self.evict()
+        return run_id in self._runs
+
+    def __len__(self) -> int:
+        self.evict()
+        return len(self._runs)
@@ -0,0 +1,112 @@
+"""
+This file contains the helpers streaming rendered documents back to the client and persisting them off the response path
+authors: Erin Hwang
+"""
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterator
+from uuid import uuid4
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+ALLOWED_RESPONSE_MODES = ("paths", "zip", "multipart")
+
+logger = LoggerConfig().get_logger(__name__)
+
+
+class ChunkSink:
+    """Write-only file collecting what zipfile writes, drained chunk by chunk while the archive is built"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        """Everything written since the last drain"""
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def zip_stream(documents: dict[str, bytes]) -> Iterator[bytes]:
+    """
+    Stream a zip bundle of in-memory documents, one chunk per document and one for the central directory
+
+    The sink has no tell or seek, so zipfile writes data descriptors instead of seeking back and the
+    bundle is never held in memory as a whole.
+
+    Args:
+        documents (dict[str, bytes]): Content keyed by file name inside the bundle, ie "resume.docx"
+
+    Yields:
+        bytes: The next chunk of the zip bundle
+    """
+    sink = ChunkSink()
+    # DOCX packages are already deflated, storing them is as small and costs no CPU
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as bundle:
+        for name, content in documents.items():
+            bundle.writestr(zipfile.ZipInfo(name, date_time=time.localtime()[:6]), content)
+            yield sink.drain()
+    yield sink.drain()
+
+def multipart_stream(documents: dict[str, bytes], boundary: str, media_type: str = DOCX_MEDIA_TYPE) -> Iterator[bytes]:
+    """
+    Stream in-memory documents as the body of a multipart/mixed response, one attachment part per document
+
+    Args:
+        documents (dict[str, bytes]): Content keyed by attachment file name
+        boundary (str): Multipart boundary, also set in the Content-Type header of the response
+        media_type (str): Content type of every part
+
+    Yields:
+        bytes: The next part of the multipart body
+    """
+    for name, content in documents.items():
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Disposition: attachment; filename=\"{name}\"\r\n"
+            f"Content-Length: {len(content)}\r\n\r\n"
+            ).encode()
+        yield content
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+def new_boundary() -> str:
+    """A multipart boundary that cannot appear in the streamed documents"""
+    return f"resumate-{uuid4().hex}"
+
+def persist_documents(documents: dict[str, bytes]) -> None:
+    """
+    Write in-memory documents to disk, meant to run as a background task after the response is sent
+
+    Every file is written next to its destination and renamed into place, so a reader never sees
+    a partially written document.
+
+    Args:
+        documents (dict[str, bytes]): Content keyed by destination path
+    """
+    start = time.perf_counter()
+    for filepath, content in documents.items():
+        path = Path(filepath)
+        tmp_path = path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, path)
+            metrics.increment("render.persisted_documents")
+        except OSError as e:
+            tmp_path.unlink(missing_ok=True)
+            metrics.increment("render.persist_errors")
+            logger.error("Failed to persist %s: %s", filepath, e)
+    metrics.observe("render.persist_seconds", time.perf_counter() - start)
@@ -0,0 +1,28 @@
+"""
+This file contains the file lock serializing the writes of the processes sharing an on-disk store
+authors: Erin Hwang
+"""
+import fcntl
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Hold an exclusive advisory lock (flock) on `path` for the duration of the block
+
+    The API and the worker processes of one host share the embedding cache and the listing index;
+    every append takes this lock so their writes never interleave. The lock is released by the OS
+    if the process dies while holding it.
+
+    Args:
+        path (Path): Lock file, created if missing
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,59 @@
+"""
+This file contains the event loop lag monitor
+authors: Erin Hwang
+"""
+import asyncio
+import os
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+
+EVENT_LOOP_LAG_INTERVAL_MS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_MS", "100"))
+EVENT_LOOP_LAG_WARN_MS = float(os.getenv("EVENT_LOOP_LAG_WARN_MS", "200"))
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a sleeping task
+
+    Every interval the monitor sleeps and compares the actual wake up time with the expected one;
+    the difference is time the loop spent blocked by synchronous work (ie a CPU-heavy encode).
+
+    Args:
+        interval_ms (float): Sampling interval in milliseconds
+        warn_ms (float): Lag in milliseconds above which a stall is counted and logged
+    """
+
+    def __init__(self, interval_ms: float = EVENT_LOOP_LAG_INTERVAL_MS, warn_ms: float = EVENT_LOOP_LAG_WARN_MS):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.interval = interval_ms / 1000
+        self.warn = warn_ms / 1000
+        self._task = None
+
+    async def run(self) -> None:
+        """Sample the loop lag until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            metrics.observe("event_loop.lag_seconds", lag)
+            metrics.set_gauge("event_loop.last_lag_seconds", lag)
+            if lag > self.warn:
+                metrics.increment("event_loop.stalls")
+                self.logger.warning("Event loop blocked for %.0fms", lag * 1000)
+
+    def start(self) -> None:
+        """Start sampling on the running loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run(), name="event_loop_lag_monitor")
+
+    async def stop(self) -> None:
+        """Stop sampling"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
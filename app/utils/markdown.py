@@ -0,0 +1,166 @@
+"""
+This file contains the markdown helpers shared by the embedding, generation and rendering code
+authors: Erin Hwang
+"""
+import re
+
+HEADER_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+WRAPPER_FENCE_PATTERN = re.compile(r"^\s*```\s*(markdown|md)\s*$", re.IGNORECASE)
+MARKDOWN_FENCE = "```markdown"
+
+
+def split_sections(text: str, max_level: int = 2) -> list[tuple[str, str]]:
+    """
+    Split markdown text at its headers up to `max_level`, ignoring headers inside code fences
+
+    The ```markdown fence the LLM wraps its answers in is not a code fence: it is dropped first,
+    along with its closing fence when there is one (split_listing cuts it off the job listing).
+
+    Args:
+        text (str): Markdown text, ie an extracted resume or job listing
+        max_level (int): Deepest header level that starts a new section
+
+    Returns:
+        list[tuple[str, str]]: (header path, section text including its header line) of every
+            non-empty section in document order; text before the first header has an empty path
+    """
+    sections = []
+    headers = {}
+    current_path, current_lines = "", []
+    in_fence = False
+
+    def close_section():
+        section_text = "\n".join(current_lines).strip()
+        if section_text:
+            sections.append((current_path, section_text))
+
+    for line in unwrap_markdown_fence(text).splitlines():
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else HEADER_PATTERN.match(line)
+        if match and len(match.group(1)) <= max_level:
+            close_section()
+            level = len(match.group(1))
+            headers = {lvl: title for lvl, title in headers.items() if lvl < level}
+            headers[level] = match.group(2)
+            current_path = " > ".join(headers[lvl] for lvl in sorted(headers))
+            current_lines = [line]
+        else:
+            current_lines.append(line)
+    close_section()
+    return sections
+
+
+def unwrap_markdown_fence(text: str) -> str:
+    """Remove the outer ```markdown fence of an LLM answer, keeping the code fences inside it"""
+    lines = text.strip().splitlines()
+    if not lines or not WRAPPER_FENCE_PATTERN.match(lines[0]):
+        return text
+    lines = lines[1:]
+    if lines and lines[-1].strip() == "```":
+        lines = lines[:-1]
+    return "\n".join(lines)
+
+def strip_markdown_fence(text: str) -> str:
+    """Remove the ```markdown fences the LLM wraps its answers in"""
+    return text.replace(MARKDOWN_FENCE, "").replace("```", "").strip()
+
+
+class MarkdownHeaderSplitter:
+    """
+    Split markdown text into chunks at the given headers, tracking the header values as metadata
+
+    Same chunks as langchain's MarkdownHeaderTextSplitter (with return_each_line=False): lines are
+    stripped of whitespace and non-printable characters, code blocks are kept whole, blank lines
+    break chunks and consecutive chunks with the same metadata are joined with "  \\n". The header
+    separators are matched with one compiled regex and no Document object is built.
+
+    Args:
+        headers_to_split_on (list[tuple[str, str]]): (separator, metadata name) pairs, ie ("##", "Professional Experience");
+            when a separator is listed twice the first name wins
+        strip_headers (bool): Leave the header lines out of the chunk content
+    """
+
+    def __init__(self, headers_to_split_on: list[tuple[str, str]], strip_headers: bool = True):
+        self.strip_headers = strip_headers
+        self.names = {}
+        # longest separator first, so "##" is not read as a "#" header
+        for sep, name in sorted(headers_to_split_on, key=lambda header: len(header[0]), reverse=True):
+            self.names.setdefault(sep, name)
+        self.header_pattern = re.compile(
+            "^(" + "|".join(re.escape(sep) for sep in self.names) + ")(?= |$)"
+            )
+
+    def split_lines(self, text: str) -> list[tuple[str, dict]]:
+        """(content, metadata) of every run of lines between headers and blank lines"""
+        lines_with_metadata = []
+        current_content, current_metadata, metadata = [], {}, {}
+        header_stack = []
+        in_code_block, opening_fence = False, ""
+
+        for line in text.split("\n"):
+            stripped_line = line.strip()
+            if not stripped_line.isprintable():
+                stripped_line = "".join(filter(str.isprintable, stripped_line))
+            if not in_code_block:
+                if stripped_line.startswith("```") and stripped_line.count("```") == 1:
+                    in_code_block, opening_fence = True, "```"
+                elif stripped_line.startswith("~~~"):
+                    in_code_block, opening_fence = True, "~~~"
+            elif stripped_line.startswith(opening_fence):
+                in_code_block, opening_fence = False, ""
+            if in_code_block:
+                current_content.append(stripped_line)
+                continue
+
+            match = self.header_pattern.match(stripped_line)
+            if match:
+                sep = match.group(1)
+                name = self.names[sep]
+                if name is not None:
+                    level = sep.count("#")
+                    while header_stack and header_stack[-1][0] >= level:
+                        metadata.pop(header_stack.pop()[1], None)
+                    header_stack.append((level, name))
+                    metadata[name] = stripped_line[len(sep):].strip()
+                if current_content:
+                    lines_with_metadata.append(("\n".join(current_content), current_metadata.copy()))
+                    current_content.clear()
+                if not self.strip_headers:
+                    current_content.append(stripped_line)
+            elif stripped_line:
+                current_content.append(stripped_line)
+            elif current_content:
+                lines_with_metadata.append(("\n".join(current_content), current_metadata.copy()))
+                current_content.clear()
+            current_metadata = metadata.copy()
+
+        if current_content:
+            lines_with_metadata.append(("\n".join(current_content), current_metadata))
+        return lines_with_metadata
+
+    def split_text(self, text: str) -> list[tuple[str, dict]]:
+        """
+        Split markdown text into header chunks
+
+        Args:
+            text (str): Markdown text, ie an LLM answer
+
+        Returns:
+            list[tuple[str, dict]]: (chunk content, header metadata) of every chunk in document order
+        """
+        chunks = []
+        for content, metadata in self.split_lines(text):
+            if chunks and chunks[-1][1] == metadata:
+                chunks[-1][0] += "  \n" + content
+            elif (
+                chunks and not self.strip_headers and len(chunks[-1][1]) < len(metadata)
+                and chunks[-1][0].split("\n")[-1][0] == "#"
+                ):
+                # a header line directly followed by a deeper header keeps the deeper metadata
+                chunks[-1][0] += "  \n" + content
+                chunks[-1][1] = metadata
+            else:
+                chunks.append([content, metadata])
+        return [(content, metadata) for content, metadata in chunks]
@@ -0,0 +1,81 @@
+"""
+This file contains the in-process metrics registry shared across the application
+authors: Erin Hwang
+"""
+import threading
+from collections import defaultdict
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of counters, gauges and timing summaries
+
+    Counters only ever go up, gauges hold the latest value and observations keep a running
+    count/total/min/max summary so no raw samples are retained.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._observations = {}
+
+    def increment(self, name: str, value: float = 1.0) -> None:
+        """Increment the counter `name` by `value`"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Set the gauge `name` to `value`"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record an observation (ie a duration in seconds) under `name`"""
+        with self._lock:
+            summary = self._observations.get(name)
+            if summary is None:
+                self._observations[name] = {"count": 1, "total": value, "min": value, "max": value}
+            else:
+                summary["count"] += 1
+                summary["total"] += value
+                summary["min"] = min(summary["min"], value)
+                summary["max"] = max(summary["max"], value)
+
+    def get_counter(self, name: str) -> float:
+        """Return the current value of the counter `name`"""
+        with self._lock:
+            return self._counters.get(name, 0.0)
+
+    def get_gauge(self, name: str, default=None):
+        """Return the current value of the gauge `name`"""
+        with self._lock:
+            return self._gauges.get(name, default)
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        """Return the ratio of two counters, 0 when the denominator is empty"""
+        with self._lock:
+            total = self._counters.get(denominator, 0.0)
+            return self._counters.get(numerator, 0.0) / total if total else 0.0
+
+    def snapshot(self) -> dict:
+        """Return a JSON serializable copy of every metric"""
+        with self._lock:
+            observations = {}
+            for name, summary in self._observations.items():
+                observations[name] = {**summary, "mean": summary["total"] / summary["count"]}
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "observations": observations,
+            }
+
+    def reset(self) -> None:
+        """Drop every metric"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._observations.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,121 @@
+"""
+This file contains the zip helpers patching OOXML packages (DOCX) without re-encoding their untouched parts
+authors: Erin Hwang
+"""
+import struct
+import zipfile
+import zlib
+from io import BytesIO
+from typing import BinaryIO
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+END_SIGNATURE = b"PK\x05\x06"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+DATA_DESCRIPTOR_FLAG = 0x08
+UTF8_FLAG = 0x800
+ZIP64_LIMIT = 0xFFFFFFFF
+
+
+def dos_datetime(date_time: tuple) -> tuple[int, int]:
+    """(time, date) MS-DOS fields of a ZipInfo.date_time"""
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+def read_entry(source: BinaryIO, info: zipfile.ZipInfo) -> tuple[bytes, bytes]:
+    """The raw local header (with name and extra field) and the compressed data of an entry, data descriptor included"""
+    source.seek(info.header_offset)
+    header = source.read(LOCAL_HEADER.size)
+    fields = LOCAL_HEADER.unpack(header)
+    if fields[0] != LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header of {info.filename}")
+    header += source.read(fields[-2] + fields[-1])
+    data = source.read(info.compress_size)
+    if info.flag_bits & DATA_DESCRIPTOR_FLAG:
+        descriptor = source.read(4)
+        descriptor += source.read(12 if descriptor == DESCRIPTOR_SIGNATURE else 8)
+        data += descriptor
+    return header, data
+
+def replace_zip_entries(source: bytes, replacements: dict[str, bytes], destination: str | BinaryIO) -> None:
+    """
+    Write a copy of a zip archive with the content of some entries replaced
+
+    Every other entry is copied as raw compressed bytes (local header, data and data descriptor)
+    without being decompressed or recompressed; the replaced entries are deflated. The entry order,
+    names, timestamps and attributes are kept, so the output only differs in the replaced entries.
+
+    Args:
+        source (bytes): Source archive, ie a DOCX template
+        replacements (dict[str, bytes]): New uncompressed content keyed by entry name, ie "word/document.xml"
+        destination (str | BinaryIO): Path or writable binary file of the new archive
+
+    Raises:
+        KeyError: If a replaced entry is not part of the archive
+        zipfile.LargeZipFile: If the archive needs ZIP64 extensions
+    """
+    source_file = BytesIO(source)
+    with zipfile.ZipFile(BytesIO(source)) as archive:
+        infos, archive_comment = archive.infolist(), archive.comment
+    missing = set(replacements) - {info.filename for info in infos}
+    if missing:
+        raise KeyError(f"Entries not found in the archive: {sorted(missing)}")
+
+    # buffered so a failure never leaves a truncated archive in `destination`
+    out = BytesIO()
+    central_directory = []
+    for info in infos:
+        offset = out.tell()
+        flags, method = info.flag_bits, info.compress_type
+        crc, compress_size, file_size = info.CRC, info.compress_size, info.file_size
+        if info.filename in replacements:
+            content = replacements[info.filename]
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            data = compressor.compress(content) + compressor.flush()
+            flags, method = flags & ~DATA_DESCRIPTOR_FLAG, zipfile.ZIP_DEFLATED
+            crc, compress_size, file_size = zlib.crc32(content), len(data), len(content)
+            if max(compress_size, file_size) >= ZIP64_LIMIT:
+                raise zipfile.LargeZipFile(f"{info.filename} needs ZIP64 extensions")
+            name = info.filename.encode("utf-8" if flags & UTF8_FLAG else "cp437")
+            dos_time, dos_date = dos_datetime(info.date_time)
+            out.write(LOCAL_HEADER.pack(
+                LOCAL_SIGNATURE, info.extract_version, flags, method, dos_time, dos_date,
+                crc, compress_size, file_size, len(name), 0,
+                ))
+            out.write(name)
+            out.write(data)
+        else:
+            header, data = read_entry(source_file, info)
+            out.write(header)
+            out.write(data)
+        central_directory.append((info, offset, flags, method, crc, compress_size, file_size))
+
+    directory_offset = out.tell()
+    for info, offset, flags, method, crc, compress_size, file_size in central_directory:
+        if offset >= ZIP64_LIMIT or info.file_size >= ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f"{info.filename} needs ZIP64 extensions")
+        name = info.filename.encode("utf-8" if flags & UTF8_FLAG else "cp437")
+        dos_time, dos_date = dos_datetime(info.date_time)
+        extra = info.extra if info.filename not in replacements else b""
+        out.write(CENTRAL_HEADER.pack(
+            CENTRAL_SIGNATURE, info.create_version | (info.create_system << 8), info.extract_version, flags,
+            method, dos_time, dos_date, crc, compress_size, file_size, len(name), len(extra), len(info.comment),
+            0, info.internal_attr, info.external_attr, offset,
+            ))
+        out.write(name)
+        out.write(extra)
+        out.write(info.comment)
+    directory_size = out.tell() - directory_offset
+    out.write(END_RECORD.pack(
+        END_SIGNATURE, 0, 0, len(infos), len(infos), directory_size, directory_offset, len(archive_comment)
+        ))
+    out.write(archive_comment)
+
+    if isinstance(destination, str):
+        with open(destination, "wb") as f:
+            f.write(out.getbuffer())
+    else:
+        destination.write(out.getbuffer())
@@ -0,0 +1,225 @@
+"""
+This file contains the declarative stage graph and the async executor used to run application workflows
+authors: Erin Hwang
+"""
+import asyncio
+import inspect
+import time
+from typing import Any, Callable
+
+from app.utils.logger import LoggerConfig
+from app.utils.metrics import metrics
+
+
+class Stage:
+    """
+    A single node of a pipeline graph
+
+    The stage function is called with one keyword argument per name in `inputs`, holding the result
+    of that upstream stage (or the initial value passed to PipelineExecutor.run).
+
+    Args:
+        name (str): Unique stage name
+        func (Callable): Async or sync function producing the stage result
+        inputs (tuple[str]): Upstream stages whose results are passed to `func`
+        after (tuple[str]): Upstream stages that must finish first without passing their result
+        retries (int): Number of retries when `func` raises one of `retry_on`
+        retry_delay (float): Delay in seconds before the first retry, doubled on every retry
+        retry_on (tuple[type[Exception]]): Exceptions that trigger a retry
+        cache_key (Callable, optional): Builds the cache key from the stage inputs; None disables caching
+        run_in_thread (bool): Run a sync `func` in a worker thread instead of on the event loop
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        inputs: tuple = (),
+        after: tuple = (),
+        retries: int = 0,
+        retry_delay: float = 0.5,
+        retry_on: tuple = (Exception,),
+        cache_key: Callable | None = None,
+        run_in_thread: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.after = tuple(after)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.retry_on = retry_on
+        self.cache_key = cache_key
+        self.run_in_thread = run_in_thread
+
+    @property
+    def dependencies(self) -> tuple:
+        """Every upstream stage of this stage"""
+        return self.inputs + tuple(dep for dep in self.after if dep not in self.inputs)
+
+
+class InMemoryStageCache:
+    """
+    Stage result cache kept in process memory
+
+    Args:
+        max_entries (int): Maximum number of cached results, the oldest entry is dropped first
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._store = {}
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        """Returns (hit, value) for the given key"""
+        if key in self._store:
+            return True, self._store[key]
+        return False, None
+
+    def set(self, key: str, value: Any) -> None:
+        """Stores the value under the given key"""
+        if key not in self._store and len(self._store) >= self.max_entries:
+            self._store.pop(next(iter(self._store)))
+        self._store[key] = value
+
+
+class PipelineExecutor:
+    """
+    Runs a graph of stages, starting every stage as soon as its dependencies have finished
+
+    The first failing stage cancels every stage still in flight and its exception is re-raised.
+
+    Args:
+        stages (list[Stage]): The stages of the graph
+        cache (InMemoryStageCache, optional): Cache consulted by stages that define a cache key
+        on_event (Callable, optional): Called as on_event(event, stage_name, payload) with the events
+            "stage_started", "stage_completed", "stage_cached" and "stage_failed"
+        name (str): Pipeline name used as metric prefix
+    """
+
+    def __init__(self, stages: list[Stage], cache=None, on_event: Callable | None = None, name: str = "pipeline"):
+        self.logger = LoggerConfig().get_logger(__name__)
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name: {stage.name}")
+            self.stages[stage.name] = stage
+        self.cache = cache
+        self.on_event = on_event
+        self.name = name
+        self.timings = {}
+
+    def validate(self, initial: dict) -> None:
+        """Ensure every dependency exists and the graph has no cycle"""
+        for stage in self.stages.values():
+            for dep in stage.dependencies:
+                if dep not in self.stages and dep not in initial:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited or name in initial:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline {self.name} has a cycle through stage {name}")
+            visiting.add(name)
+            for dep in self.stages[name].dependencies:
+                visit(dep)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def emit(self, event: str, stage_name: str, payload: Any = None) -> None:
+        """Forward a stage event to the on_event hook"""
+        if self.on_event is not None:
+            self.on_event(event, stage_name, payload)
+
+    async def call_stage(self, stage: Stage, kwargs: dict) -> Any:
+        """Call the stage function once"""
+        if stage.run_in_thread:
+            return await asyncio.to_thread(stage.func, **kwargs)
+        result = stage.func(**kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def run_stage(self, stage: Stage, tasks: dict) -> Any:
+        """Wait for the stage dependencies, then run it with retries and caching"""
+        kwargs = {dep: await tasks[dep] for dep in stage.inputs}
+        for dep in stage.after:
+            await tasks[dep]
+
+        cache_key = None
+        if self.cache is not None and stage.cache_key is not None:
+            cache_key = stage.cache_key(**kwargs)
+        if cache_key is not None:
+            hit, value = self.cache.get(f"{stage.name}:{cache_key}")
+            if hit:
+                metrics.increment(f"{self.name}.{stage.name}.cache_hits")
+                self.emit("stage_cached", stage.name, value)
+                return value
+
+        self.emit("stage_started", stage.name)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                result = await self.call_stage(stage, kwargs)
+                break
+            except stage.retry_on as e:
+                if attempt >= stage.retries:
+                    self.emit("stage_failed", stage.name, e)
+                    raise
+                delay = stage.retry_delay * 2 ** attempt
+                attempt += 1
+                metrics.increment(f"{self.name}.{stage.name}.retries")
+                self.logger.warning("Stage %s failed (%s) - retry %s in %.1fs", stage.name, e, attempt, delay)
+                await asyncio.sleep(delay)
+            except Exception as e:
+                self.emit("stage_failed", stage.name, e)
+                raise
+
+        duration = time.perf_counter() - start
+        self.timings[stage.name] = duration
+        metrics.observe(f"{self.name}.{stage.name}.seconds", duration)
+        self.logger.info("Stage %s completed in %.2fs", stage.name, duration)
+
+        if cache_key is not None:
+            self.cache.set(f"{stage.name}:{cache_key}", result)
+        self.emit("stage_completed", stage.name, result)
+        return result
+
+    async def run(self, **initial) -> dict:
+        """
+        Run every stage of the graph
+
+        Args:
+            **initial: Values made available to the stages as if they were stage results
+
+        Returns:
+            dict: The initial values and the result of every stage, keyed by name
+        """
+        self.validate(initial)
+        tasks = {}
+        for name, value in initial.items():
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            tasks[name] = future
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.create_task(self.run_stage(stage, tasks), name=f"{self.name}.{name}")
+
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(tasks[name] for name in self.stages))
+        except BaseException:
+            for name in self.stages:
+                tasks[name].cancel()
+            await asyncio.gather(*(tasks[name] for name in self.stages), return_exceptions=True)
+            raise
+        finally:
+            metrics.observe(f"{self.name}.seconds", time.perf_counter() - start)
+
+        return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,148 @@
+"""
+This file contains the tokenizer locating [Placeholder] values across the runs of a DOCX paragraph, shared by the renderers
+authors: Erin Hwang
+"""
+import re
+from copy import deepcopy
+
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.text.run import Run
+
+FONT_NAME = "Calibri"
+FONT_SIZE = 133350 #10.5pt in EMU
+
+BRACKET_PATTERN = re.compile(r"[\[\]]")
+# characters python-docx writes as w:tab or w:br elements rather than w:t text
+RUN_BREAK_PATTERN = re.compile(r"[\t\r\n]")
+TEXT_TAG = qn("w:t")
+RPR_TAG = qn("w:rPr")
+XML_SPACE = qn("xml:space")
+
+
+def tokenize_placeholders(run_texts: list[str]) -> list[tuple[str, int, int, int, int]]:
+    """
+    Locate every [Placeholder] of a paragraph in one pass over its runs, including the ones split across runs
+
+    A two-state machine driven by the brackets only: "[" opens a placeholder (re-opening it when one
+    is already open, so the innermost brackets win as in r"\\[[^\\[\\]]*\\]"), "]" closes the open
+    placeholder and is ignored otherwise.
+
+    Args:
+        run_texts (list[str]): Text of every run of the paragraph
+
+    Returns:
+        list[tuple[str, int, int, int, int]]: (placeholder, first run, offset of "[" in the first run,
+            last run, offset after "]" in the last run) of every placeholder, in document order
+    """
+    tokens = []
+    open_run = open_offset = None
+    parts = []
+    for i_run, text in enumerate(run_texts):
+        if open_run is not None:
+            parts.append(text)
+        for match in BRACKET_PATTERN.finditer(text):
+            offset = match.start()
+            if match.group() == "[":
+                open_run, open_offset, parts = i_run, offset, [text[offset:]]
+            elif open_run is not None:
+                if open_run == i_run:
+                    placeholder = text[open_offset:offset + 1]
+                else:
+                    parts[-1] = text[:offset + 1]
+                    placeholder = "".join(parts)
+                tokens.append((placeholder, open_run, open_offset, i_run, offset + 1))
+                open_run = None
+    return tokens
+
+def style_run(run) -> None:
+    """Set the font of a rendered placeholder"""
+    if run._r.rPr is None:
+        # an unformatted run gets a copy of the properties the setters below would build
+        run._r.insert(0, deepcopy(STYLED_RPR))
+        return
+    run.font.name = FONT_NAME
+    run.font.size = FONT_SIZE
+
+def styled_run_properties():
+    """The w:rPr element of an unformatted run styled by the Run.font setters"""
+    run = Run(OxmlElement("w:r"), None)
+    run.font.name = FONT_NAME
+    run.font.size = FONT_SIZE
+    return run._r.rPr
+
+STYLED_RPR = styled_run_properties()
+
+def set_run_text(run, text: str) -> None:
+    """
+    Set the text of a run as Run.text does, editing its w:t element in place when it holds the whole text
+
+    The Run.text setter drops the content of the run and rebuilds it character by character; a run
+    holding a single w:t, set to text without tabs or line breaks, yields the same XML by editing it.
+    """
+    r = run._r
+    content = [child for child in r if child.tag != RPR_TAG]
+    if len(content) != 1 or content[0].tag != TEXT_TAG or RUN_BREAK_PATTERN.search(text):
+        run.text = text
+        return
+    t = content[0]
+    if not text:
+        r.remove(t)
+        return
+    t.text = text
+    if len(text.strip()) < len(text):
+        t.set(XML_SPACE, "preserve")
+    elif XML_SPACE in t.attrib:
+        del t.attrib[XML_SPACE]
+
+def substitute_placeholders(runs, content_dict: dict, style_split_runs: bool = True) -> int:
+    """
+    Replace every [Placeholder] of a paragraph by its value, keeping the formatting of the runs
+
+    A placeholder within one run is replaced in place. A placeholder split across runs is replaced in
+    its first run, its middle runs are emptied and its tail is cut from its last run. The text of every
+    touched run is assigned once, after all of its placeholders are substituted, and only if it changed.
+
+    Args:
+        runs (list): Runs of the paragraph (docx.text.run.Run)
+        content_dict (dict): Values keyed by placeholder, brackets included, ie "[CompanyName]"
+        style_split_runs (bool): Whether the runs of split placeholders also get the placeholder font,
+            single-run placeholders always do
+
+    Raises:
+        KeyError: If a placeholder has no value in `content_dict`
+
+    Returns:
+        int: Number of substituted placeholders
+    """
+    run_texts = [run.text for run in runs]
+    tokens = tokenize_placeholders(run_texts)
+    if not tokens:
+        return 0
+
+    # pieces of the new text of every touched run, the untouched slices are kept as is
+    new_texts, cursors, styled = {}, {}, set()
+    def keep_until(i_run: int, offset: int) -> None:
+        new_texts.setdefault(i_run, []).append(run_texts[i_run][cursors.get(i_run, 0):offset])
+        cursors[i_run] = offset
+
+    for placeholder, first_run, start, last_run, end in tokens:
+        keep_until(first_run, start)
+        new_texts[first_run].append(content_dict[placeholder])
+        for i_run in range(first_run + 1, last_run + 1):
+            new_texts.setdefault(i_run, [])
+        cursors[first_run] = len(run_texts[first_run])
+        for i_run in range(first_run + 1, last_run):
+            cursors[i_run] = len(run_texts[i_run])
+        cursors[last_run] = end
+        if first_run == last_run or style_split_runs:
+            styled.update(range(first_run, last_run + 1))
+
+    for i_run, pieces in new_texts.items():
+        pieces.append(run_texts[i_run][cursors.get(i_run, 0):])
+        text = "".join(pieces)
+        if text != run_texts[i_run]:
+            set_run_text(runs[i_run], text)
+        if i_run in styled:
+            style_run(runs[i_run])
+    return len(tokens)
@@ -0,0 +1,33 @@
+"""
+This file contains the helpers formatting server-sent events (text/event-stream)
+authors: Erin Hwang
+"""
+import json
+from typing import Any
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# keep proxies from caching or buffering the stream, every event must reach the client right away
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_event(event: str, data: Any, event_id: int | None = None) -> str:
+    """
+    Format a server-sent event
+
+    Args:
+        event (str): Event name, the EventSource listener type
+        data (Any): JSON-serializable event data; numpy scalars are sent as numbers
+        event_id (int, optional): Event ID, sent back by reconnecting clients as Last-Event-ID
+
+    Returns:
+        str: The event text, terminated by a blank line
+    """
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines.append(f"event: {event}")
+    payload = json.dumps(data, default=lambda obj: obj.item() if hasattr(obj, "item") else str(obj))
+    lines.extend(f"data: {line}" for line in payload.splitlines())
+    return "\n".join(lines) + "\n\n"
+
+def format_comment(text: str) -> str:
+    """A comment line, ignored by clients, that keeps an idle connection open"""
+    return f": {text}\n\n"
@@ -0,0 +1,46 @@
+"""
+This file contains the standalone worker process running the /scrape jobs queued by the API
+authors: Erin Hwang
+
+Scale the workers separately from the API by running one or more worker processes on the host of the
+job queue (set JOB_QUEUE_WORKER="external" on the API so it only queues the jobs):
+
+usage (from the repository root):
+    python -m app.worker
+"""
+import asyncio
+import signal
+
+from app.utils.logger import LoggerConfig
+from app.utils.loop_monitor import EventLoopLagMonitor
+from app.controllers.render_pool import shutdown_render_pool
+from app.controllers.scrape_job import scrape_job_handlers, warmup_workers
+from app.controllers.threshold_evaluator import SOFT_COSINE_THRESHOLD, SpeculativeGenerationPolicy
+from app.services.embedding import shutdown_embedding_executors
+from app.services.job_queue import JobWorker
+
+logger = LoggerConfig().get_logger(__name__)
+
+
+async def main():
+    """Run the job worker until SIGINT or SIGTERM, jobs in flight are put back in the queue"""
+    loop_monitor = EventLoopLagMonitor()
+    loop_monitor.start()
+    await warmup_workers()
+    worker = JobWorker(scrape_job_handlers(SpeculativeGenerationPolicy(threshold=SOFT_COSINE_THRESHOLD)))
+    worker.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Stopping job worker %s", worker.name)
+    await worker.stop()
+    await loop_monitor.stop()
+    shutdown_embedding_executors()
+    shutdown_render_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+This file contains the accuracy-drift check and benchmark of the embedding inference backends
+authors: Erin Hwang
+
+Loads TRANSFORMER_MODEL with every backend ("torch", "onnx", "onnx-int8"), each in a fresh process
+so the resident memory is not shared, and reports the load time, resident memory, single-text latency
+and batch throughput. The soft cosine scores of resume/listing pairs are compared with the torch
+scores: the maximum absolute drift and the number of gate decisions flipped at SOFT_COSINE_THRESHOLD.
+
+usage (from the repository root):
+    python -m benchmarks.bench_embedding_backends --backends torch onnx-int8 --pairs 200
+"""
+import os
+
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+import argparse
+import multiprocessing
+import random
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.controllers.threshold_evaluator import SOFT_COSINE_THRESHOLD, TRANSFORMER_MODEL, soft_cosine_similarity_batch
+from app.services.embedding import ALLOWED_BACKENDS, load_sentence_transformer
+from benchmarks.bench_similarity_cascade import synthetic_pairs
+
+def resident_memory_mb() -> float:
+    """Current resident memory of this process in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_backend(model_name: str, backend: str, texts: list[str], repeat: int, batch_size: int) -> dict:
+    """Load the model with the backend and time it - runs in its own process"""
+    rss_before = resident_memory_mb()
+    start = time.perf_counter()
+    model = load_sentence_transformer(model_name, backend)
+    model.encode(texts[:1])
+    load_seconds = time.perf_counter() - start
+    rss_loaded = resident_memory_mb()
+
+    latencies = []
+    for text in texts[:repeat]:
+        start = time.perf_counter()
+        model.encode([text])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size)
+    throughput = len(texts) / (time.perf_counter() - start)
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "model_rss_mb": rss_loaded - rss_before,
+        "peak_rss_mb": resident_memory_mb(),
+        "p50_latency_ms": 1000 * statistics.median(latencies),
+        "throughput_texts_s": throughput,
+        "embeddings": embeddings,
+    }
+
+def pair_scores(embeddings: np.ndarray, n_pairs: int) -> np.ndarray:
+    """Soft cosine score of every pair, the resume of pair i at row 2i and the listing at row 2i+1"""
+    return np.array([
+        soft_cosine_similarity_batch(embeddings[2 * i], embeddings[2 * i + 1:2 * i + 2])[0] for i in range(n_pairs)
+        ])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=TRANSFORMER_MODEL)
+    parser.add_argument("--backends", nargs="+", default=list(ALLOWED_BACKENDS), choices=ALLOWED_BACKENDS)
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threshold", type=float, default=SOFT_COSINE_THRESHOLD)
+    args = parser.parse_args()
+
+    pairs = synthetic_pairs(args.pairs, random.Random(0))
+    texts = [text for pair in pairs for text in pair]
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+
+    results = []
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.append(
+                pool.submit(run_backend, args.model, backend, texts, args.repeat, args.batch_size).result()
+                )
+
+    reference = pair_scores(results[0]["embeddings"], len(pairs))
+    print(f"{args.model} | {len(texts)} texts | batch size {args.batch_size} | threshold {args.threshold}")
+    print(f"{'backend':<10} {'load s':>7} {'model MB':>9} {'peak MB':>8} {'p50 ms':>7} {'texts/s':>8} {'max drift':>10} {'flips':>6}")
+    for result in results:
+        scores = pair_scores(result["embeddings"], len(pairs))
+        drift = np.abs(scores - reference).max()
+        flips = int(((scores >= args.threshold) != (reference >= args.threshold)).sum())
+        print(
+            f"{result['backend']:<10} {result['load_seconds']:>7.2f} {result['model_rss_mb']:>9.0f} "
+            f"{result['peak_rss_mb']:>8.0f} {result['p50_latency_ms']:>7.2f} {result['throughput_texts_s']:>8.0f} "
+            f"{drift:>10.2e} {flips:>6}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+This file contains the benchmark comparing fan-out and batched resume section generation
+authors: Erin Hwang
+
+Runs ResumeGeneratorController.generate_content against live OpenAI calls in both generation
+modes and reports the wall time and token usage per run (tracked by the metrics registry).
+
+usage (from the repository root):
+    python -m benchmarks.bench_generation_modes <resume_md_path> <job_md_path> --runs 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.controllers.resume_generator import ResumeGeneratorController
+from app.utils.metrics import metrics
+
+COUNTERS = [
+    "llm.requests",
+    "llm.input_tokens",
+    "llm.cached_input_tokens",
+    "llm.output_tokens",
+    "generation.batched_fallbacks",
+    ]
+
+async def run_mode(mode: str, resume_data: str, job_data: str, runs: int) -> dict:
+    """Generate every section `runs` times with the given generation mode"""
+    before = {counter: metrics.get_counter(counter) for counter in COUNTERS}
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await ResumeGeneratorController(resume_data, job_data, generation_mode=mode).generate_content()
+        latencies.append(time.perf_counter() - start)
+
+    result = {
+        "mode": mode,
+        "mean_latency_s": statistics.mean(latencies),
+        "min_latency_s": min(latencies),
+        }
+    for counter in COUNTERS:
+        result[counter] = (metrics.get_counter(counter) - before[counter]) / runs
+    return result
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("resume_md_path", help="markdown output of the resume_extractor prompt")
+    parser.add_argument("job_md_path", help="markdown output of the job_listing_extractor prompt")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.resume_md_path, "r", encoding="utf-8") as f:
+        resume_data = f.read()
+    with open(args.job_md_path, "r", encoding="utf-8") as f:
+        job_data = f.read()
+
+    results = [await run_mode(mode, resume_data, job_data, args.runs) for mode in ("fan_out", "batched")]
+
+    columns = ["mode", "mean_latency_s", "min_latency_s"] + COUNTERS
+    print(" | ".join(columns))
+    for result in results:
+        print(" | ".join(
+            f"{result[column]:.2f}" if isinstance(result[column], float) else str(result[column])
+            for column in columns
+            ))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""
+This file contains the equivalence check and benchmark of the markdown header splitter against langchain's
+authors: Erin Hwang
+
+Splits LLM-shaped markdown (extracted resumes, generated keyword sections, cover letter keyword
+headers) and random markdown (nested headers, code fences, blank lines, non-printable characters,
+"#" without a space) with MarkdownHeaderSplitter and with langchain's MarkdownHeaderTextSplitter,
+for every splitter configuration of the generator and the renderers. The chunks must be identical.
+split_sections, which chunks the documents to embed, must find the headers of the same fenced
+extractor output, with and without the closing fence split_listing cuts off the job listing.
+Then reports the time to split, including building the splitter per call as the renderers used to,
+and the import time of langchain.text_splitter that leaves the request path.
+
+usage (from the repository root):
+    python -m benchmarks.bench_markdown --trials 5000 --repeat 2000
+"""
+import argparse
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from langchain.text_splitter import MarkdownHeaderTextSplitter
+
+from app.utils.markdown import MarkdownHeaderSplitter, split_sections, strip_markdown_fence
+
+CONFIGURATIONS = {
+    "resume_sections": ([("#", "Core Expertise"), ("#", "Technical Snapshot"), ("##", "Professional Experience")], False),
+    "keywords": ([("#", "keywords")], True),
+    "cl_keywords": ([("#", "header")], False),
+    }
+SAMPLES = {
+    "resume_sections": """```markdown
+# Professional Summary
+Data scientist with a decade of experience in forecasting and experimentation.
+
+# Core Expertise
+causal inference, forecasting, experimentation
+
+# Technical Snapshot
+python, sql, spark, pytorch
+
+# Professional Experience
+## Staff Data Scientist, Acme Corp
+Led the forecasting platform.
+- Built demand models
+- Shipped an experimentation framework
+
+## Senior Data Scientist, Globex
+- Cut churn by 12%
+```""",
+    "keywords": "```markdown\n# Core Expertise\ncausal inference, experimentation, forecasting\n```",
+    "cl_keywords": "```markdown\n# Acme Corp\n# Not Available\n# Staff Data Scientist\n```",
+    }
+LISTING_SAMPLE = """```markdown
+# Job Title
+- Staff Data Scientist
+
+# Responsibilities
+- Design and analyze experiments
+- Build forecasting models
+
+# Qualifications
+- Mastery of SQL and Python
+
+# Additional Information
+- Hybrid, twice a week in the office
+```"""
+SECTION_PATHS = {
+    "resume": [
+        "Professional Summary", "Core Expertise", "Technical Snapshot", "Professional Experience",
+        "Professional Experience > Staff Data Scientist, Acme Corp", "Professional Experience > Senior Data Scientist, Globex",
+        ],
+    "listing": ["Job Title", "Responsibilities", "Qualifications", "Additional Information"],
+    # ScrapePipelineController.split_listing drops the additional information and the closing fence
+    "split_listing": ["Job Title", "Responsibilities", "Qualifications"],
+    }
+LINES = [
+    "# Core Expertise", "## Staff Data Scientist, Acme", "### Details", "#NoSpace", "#", "##", "  # Indented header  ",
+    "- bullet point", "plain sentence with words", "", "   ", "```python", "```", "~~~", "inline ``` fence ``` here",
+    "text with a\ttab", "zero\u200bwidth", "\x0bvertical tab", "# Header with trailing ##", "1. numbered item",
+    ]
+
+
+def langchain_chunks(text: str, headers: list, strip_headers: bool) -> list[tuple[str, dict]]:
+    """(content, metadata) chunks of langchain's MarkdownHeaderTextSplitter"""
+    splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers, strip_headers=strip_headers)
+    return [(document.page_content, document.metadata) for document in splitter.split_text(text)]
+
+def random_markdown(rng: random.Random) -> str:
+    """Random markdown of header, list, fence and blank lines"""
+    return "\n".join(rng.choice(LINES) for _ in range(rng.randint(0, 30)))
+
+def split_or_error(split, *args):
+    """The chunks, or the exception type when splitting fails"""
+    try:
+        return split(*args)
+    except Exception as e:
+        return type(e).__name__
+
+def check(trials: int, seed: int) -> bool:
+    """Compare both splitters on the samples and random markdown, returns whether every text matched"""
+    rng = random.Random(seed)
+    texts = [strip_markdown_fence(sample) for sample in SAMPLES.values()] + list(SAMPLES.values())
+    texts += [random_markdown(rng) for _ in range(trials)]
+    ok = True
+    for name, (headers, strip_headers) in CONFIGURATIONS.items():
+        splitter = MarkdownHeaderSplitter(headers, strip_headers=strip_headers)
+        mismatched = 0
+        for text in texts:
+            expected = split_or_error(langchain_chunks, text, headers, strip_headers)
+            actual = split_or_error(splitter.split_text, text)
+            if actual != expected:
+                mismatched += 1
+                if mismatched <= 3:
+                    print(f"  {name} differs for {text!r}:\n    {expected!r}\n    {actual!r}")
+        print(f"{name:>16}: {len(texts) - mismatched}/{len(texts)} identical")
+        ok = ok and not mismatched
+    return ok
+
+def check_sections() -> bool:
+    """Compare the section paths split_sections finds in fenced extractor output, returns whether all matched"""
+    texts = {
+        "resume": SAMPLES["resume_sections"],
+        "listing": LISTING_SAMPLE,
+        "split_listing": re.search(r"(.*?)# Additional Information", LISTING_SAMPLE, re.DOTALL).group(1).strip(),
+        }
+    ok = True
+    for name, text in texts.items():
+        paths = [path for path, _ in split_sections(text)]
+        matched = paths == SECTION_PATHS[name]
+        print(f"{name:>16}: {'sections found' if matched else f'expected {SECTION_PATHS[name]}, got {paths}'}")
+        ok = ok and matched
+    return ok
+
+def timed(func, repeat: int) -> float:
+    """Median microseconds of a call over `repeat` calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(1e6 * (time.perf_counter() - start))
+    return statistics.median(timings)
+
+def import_seconds(module: str) -> float:
+    """Import time of a module in a fresh interpreter"""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+
+def benchmark(repeat: int) -> None:
+    """Time both splitters on the LLM-shaped samples"""
+    print(f"\n{'sample':>16} {'langchain us':>12} {'splitter us':>11} {'reused us':>9}")
+    for name, (headers, strip_headers) in CONFIGURATIONS.items():
+        text = strip_markdown_fence(SAMPLES[name])
+        splitter = MarkdownHeaderSplitter(headers, strip_headers=strip_headers)
+        langchain_us = timed(lambda: langchain_chunks(text, headers, strip_headers), repeat)
+        splitter_us = timed(lambda: MarkdownHeaderSplitter(headers, strip_headers=strip_headers).split_text(text), repeat)
+        reused_us = timed(lambda: splitter.split_text(text), repeat)
+        print(f"{name:>16} {langchain_us:>12.1f} {splitter_us:>11.1f} {reused_us:>9.1f}")
+    print(f"\nimport langchain.text_splitter: {1000 * import_seconds('langchain.text_splitter'):.0f} ms")
+    print(f"import app.utils.markdown: {1000 * import_seconds('app.utils.markdown'):.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = check(args.trials, args.seed)
+    ok = check_sections() and ok
+    benchmark(args.repeat)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
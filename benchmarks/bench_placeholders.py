@@ -0,0 +1,216 @@
+"""
+This file contains the equivalence fuzz and micro-benchmark of the placeholder tokenizer shared by the renderers
+authors: Erin Hwang
+
+Builds random paragraphs of filler text and [Placeholder] values split at random run boundaries and
+renders them with the tokenizer (substitute_placeholders) and with the previous edit_paragraphs of the
+resume and cover letter renderers (four regexes per run, reproduced below). Where the previous
+implementation succeeds, the paragraph XML must be identical; where it fails (a placeholder split
+across three runs or more, a split placeholder next to a bracket-free run in the cover letter), the
+tokenizer must still produce the fully substituted text. Then times both on placeholder-dense
+paragraphs: the scan alone (locating the placeholders), the whole edit, and end to end through the
+resume renderer's edit_paragraphs; exits non-zero if the end-to-end edit is slower than before.
+
+usage (from the repository root):
+    python -m benchmarks.bench_placeholders --trials 2000 --paragraphs 200 --placeholders 8 --repeat 5
+"""
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from io import BytesIO
+
+from docx import Document
+from lxml import etree
+
+from app.controllers.resume_renderer import ResumeRendererController
+from app.utils.placeholder_tokenizer import substitute_placeholders, tokenize_placeholders
+
+VARIANTS = {"resume": False, "cover_letter": True}
+CONTENT = {
+    "[CompanyName]": "Acme Corp",
+    "[CityState]": "Austin, TX",
+    "[PositionName]": "Staff Data Scientist",
+    "[ContactName]": "Jordan Lee",
+    "[Date]": "October 19, 2026",
+    "[SoftCosineSimilarityScore]": "0.73",
+    }
+FILLERS = ["Applying to ", " in ", " as ", ", ", "Dear ", "the role of ", " ", "", "Sincerely"]
+
+PATTERN = r"\[[^\[\]]*\]"
+START_PATTERN = r"\[(?![^\[\]]*\])[^]]*$"
+END_PATTERN = r"^(?!.*?\[[^\[\]]*\]).*?\]"
+MIDDLE_PATTERN = r"^[^\[\]]*$"
+
+
+def legacy_scan(run_texts: list[str], variant: str) -> tuple[list, list, list, list]:
+    """Full, start, end and middle matches of the previous edit_paragraphs"""
+    full_matches, start_matches, end_matches, middle_matches = [], [], [], []
+    for i_run, text in enumerate(run_texts):
+        full_match = [(i_run, val) for val in re.findall(PATTERN, text)]
+        full_matches.extend(full_match)
+        start_match = [(i_run, val) for val in re.findall(START_PATTERN, text)]
+        start_matches.extend(start_match)
+        end_matches.extend((i_run, val) for val in re.findall(END_PATTERN, text))
+        # the resume only looked for middle runs among the runs holding a full or start match
+        if variant == "cover_letter" or full_match or start_match:
+            middle_matches.extend((i_run, val) for val in re.findall(MIDDLE_PATTERN, text))
+    return full_matches, start_matches, end_matches, middle_matches
+
+def legacy_edit_paragraph(paragraph, content_dict: dict, variant: str) -> None:
+    """The previous edit_paragraphs of the resume ("resume") or cover letter ("cover_letter") renderer"""
+    runs = paragraph.runs
+    full_matches, start_matches, end_matches, middle_matches = legacy_scan([run.text for run in runs], variant)
+    style_split_runs = VARIANTS[variant]
+
+    def style(run):
+        run.font.name = "Calibri"
+        run.font.size = 133350
+
+    for i_run, val in full_matches:
+        runs[i_run].text = runs[i_run].text.replace(val, content_dict[val])
+        style(runs[i_run])
+    if start_matches:
+        assert len(start_matches) == len(end_matches)
+        for i_curr, ((i_start, val_start), (i_end, val_end)) in enumerate(zip(start_matches, end_matches)):
+            curr_middle_match = None if len(middle_matches) == 0 else middle_matches[i_curr]
+            if i_end - i_start >= 2:
+                assert curr_middle_match is not None
+                determined_term = val_start + curr_middle_match[1] + val_end
+                runs[curr_middle_match[0]].text = runs[curr_middle_match[0]].text.replace(curr_middle_match[1], "")
+                style(runs[curr_middle_match[0]])
+            else:
+                assert curr_middle_match is None
+                determined_term = val_start + val_end
+            runs[i_start].text = runs[i_start].text.replace(val_start, content_dict[determined_term])
+            if style_split_runs:
+                style(runs[i_start])
+            runs[i_end].text = runs[i_end].text.replace(val_end, "")
+            if style_split_runs:
+                style(runs[i_end])
+
+def random_runs(rng: random.Random, n_placeholders: int, max_split: int) -> tuple[list[str], str]:
+    """Run texts of a random paragraph and its expected text once substituted"""
+    segments = []
+    for _ in range(n_placeholders):
+        segments.append(("text", rng.choice(FILLERS)))
+        segments.append(("placeholder", rng.choice(list(CONTENT))))
+    segments.append(("text", rng.choice(FILLERS)))
+
+    runs, expected = [], []
+    for kind, text in segments:
+        expected.append(CONTENT[text] if kind == "placeholder" else text)
+        n_pieces = rng.randint(1, max_split) if kind == "placeholder" and len(text) > 2 else 1
+        cuts = sorted(rng.sample(range(1, len(text)), n_pieces - 1)) if n_pieces > 1 else []
+        pieces = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        # glue the first piece to the current run half of the time, like Word does
+        if runs and rng.random() < 0.5:
+            runs[-1] += pieces[0]
+            pieces = pieces[1:]
+        runs.extend(pieces)
+    return runs, "".join(expected)
+
+def build_document(paragraph_runs: list[list[str]]) -> bytes:
+    """A DOCX with one paragraph per list of run texts"""
+    doc = Document()
+    for run_texts in paragraph_runs:
+        paragraph = doc.add_paragraph()
+        for text in run_texts:
+            paragraph.add_run(text)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def fuzz(trials: int, seed: int) -> bool:
+    """Compare the tokenizer with the previous implementation, returns whether every trial passed"""
+    rng = random.Random(seed)
+    cases = [random_runs(rng, rng.randint(1, 4), 3) for _ in range(trials)]
+    source = build_document([runs for runs, _ in cases])
+    ok = True
+    for variant, style_split_runs in VARIANTS.items():
+        legacy_doc, new_doc = Document(BytesIO(source)), Document(BytesIO(source))
+        identical = fixed = mismatched = 0
+        for (runs, expected), legacy_paragraph, new_paragraph in zip(cases, legacy_doc.paragraphs, new_doc.paragraphs):
+            substitute_placeholders(new_paragraph.runs, CONTENT, style_split_runs=style_split_runs)
+            try:
+                legacy_edit_paragraph(legacy_paragraph, CONTENT, variant)
+            except (AssertionError, KeyError, IndexError):
+                if new_paragraph.text == expected:
+                    fixed += 1
+                else:
+                    mismatched += 1
+                    print(f"  {variant} wrong text for {runs}: {new_paragraph.text!r}")
+                continue
+            if etree.tostring(legacy_paragraph._p) == etree.tostring(new_paragraph._p) and new_paragraph.text == expected:
+                identical += 1
+            else:
+                mismatched += 1
+                print(f"  {variant} differs for {runs}: {legacy_paragraph.text!r} != {new_paragraph.text!r}")
+        print(f"{variant:>12}: {identical} identical, {fixed} failing before and correct now, {mismatched} mismatched")
+        ok = ok and not mismatched
+    return ok
+
+def timed(func, repeat: int) -> float:
+    """Median milliseconds of `repeat` calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(1000 * (time.perf_counter() - start))
+    return statistics.median(timings)
+
+def benchmark(n_paragraphs: int, n_placeholders: int, repeat: int, seed: int) -> bool:
+    """Time the scan and the whole edit of placeholder-dense paragraphs, returns whether the edit is not slower than before"""
+    rng = random.Random(seed)
+    # only paragraphs the resume variant of the previous implementation renders, so both do the same work
+    paragraph_runs = []
+    while len(paragraph_runs) < n_paragraphs:
+        candidates = [random_runs(rng, n_placeholders, 2)[0] for _ in range(n_paragraphs)]
+        for runs, paragraph in zip(candidates, Document(BytesIO(build_document(candidates))).paragraphs):
+            try:
+                legacy_edit_paragraph(paragraph, CONTENT, "resume")
+                paragraph_runs.append(runs)
+            except (AssertionError, KeyError, IndexError):
+                pass
+    paragraph_runs = paragraph_runs[:n_paragraphs]
+    source = build_document(paragraph_runs)
+    n_runs = sum(len(runs) for runs in paragraph_runs)
+    print(f"\n{n_paragraphs} paragraphs, {n_placeholders} placeholders and {n_runs / n_paragraphs:.1f} runs per paragraph")
+    # the cover letter variant of the previous implementation fails next to bracket-free runs, it is timed as the resume one
+    docs = iter([Document(BytesIO(source)) for _ in range(3 * repeat)])
+    renderer = ResumeRendererController(resume_path="", generated_content={}, source_name="", md_info="")
+    i_pars = list(range(n_paragraphs))
+    legacy_scan_ms = timed(lambda: [legacy_scan(runs, "resume") for runs in paragraph_runs], repeat)
+    scan_ms = timed(lambda: [tokenize_placeholders(runs) for runs in paragraph_runs], repeat)
+    legacy_edit_ms = timed(
+        lambda: [legacy_edit_paragraph(paragraph, CONTENT, "resume") for paragraph in next(docs).paragraphs], repeat
+        )
+    edit_ms = timed(
+        lambda: [substitute_placeholders(paragraph.runs, CONTENT, False) for paragraph in next(docs).paragraphs], repeat
+        )
+    # end to end: the resume renderer's edit_paragraphs, paragraph lookup, scan, substitution and styling
+    render_ms = timed(lambda: renderer.edit_paragraphs(next(docs).paragraphs, i_pars, CONTENT), repeat)
+    print(f"{'':>16} {'scan ms':>8} {'edit ms':>8}")
+    print(f"{'legacy':>16} {legacy_scan_ms:>8.2f} {legacy_edit_ms:>8.1f}")
+    print(f"{'tokenizer':>16} {scan_ms:>8.2f} {edit_ms:>8.1f}")
+    print(f"{'edit_paragraphs':>16} {'':>8} {render_ms:>8.1f}")
+    print(f"end to end: {render_ms:.1f} ms vs {legacy_edit_ms:.1f} ms legacy ({legacy_edit_ms / render_ms:.2f}x)")
+    return render_ms <= legacy_edit_ms
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=2000)
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--placeholders", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = fuzz(args.trials, args.seed)
+    ok = benchmark(args.paragraphs, args.placeholders, args.repeat, args.seed) and ok
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
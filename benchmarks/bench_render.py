@@ -0,0 +1,145 @@
+"""
+This file contains the benchmark of resume rendering against the size of the DOCX template
+authors: Erin Hwang
+
+Builds synthetic resume templates with a growing number of positions (a heading, a position sentence,
+LEFT aligned bullets and unaligned spacers each) and reports, per template size and render backend,
+the python-docx load time, the one-off template compile time and the cost of every render: cloning
+the compiled template, applying the single-pass render plan and saving the DOCX. --images embeds
+incompressible pictures to mimic template-heavy resumes, where the "ooxml" backend copies the
+untouched package parts instead of re-writing them.
+
+usage (from the repository root):
+    python -m benchmarks.bench_render --positions 5 20 60 --bullets 8 --repeat 5
+    python -m benchmarks.bench_render --positions 20 --images 4 --image-kb 512 --backends python-docx ooxml
+"""
+import argparse
+import os
+import statistics
+import struct
+import tempfile
+import time
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from app.controllers.resume_renderer import ResumeRendererController, ResumeRenderPlan
+from app.services.docx_template import ALLOWED_RENDER_BACKENDS, CompiledDocxTemplate
+
+CL_KEYWORD_MD = "```markdown\n# Acme Corp\n# Not Available\n# Staff Data Scientist\n```"
+
+def noise_png(size_kb: int) -> bytes:
+    """A grayscale PNG of random pixels of about `size_kb` KB"""
+    width = 256
+    height = max(1, size_kb * 4)
+    raw = b"".join(b"\x00" + os.urandom(width) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">2I5B", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+def build_resume_template(path: str, n_positions: int, n_bullets: int, n_images: int = 0, image_kb: int = 256) -> str:
+    """Write a resume template with every location the resume renderer patches"""
+    doc = Document()
+    for _ in range(n_images):
+        doc.add_picture(BytesIO(noise_png(image_kb)))
+    paragraph = doc.add_paragraph()
+    for text in ("Applying to ", "[Company", "Name]", " in [CityState] as [Position", "Name]"):
+        paragraph.add_run(text)
+    doc.add_paragraph("As a multitalented Data Scientist with a decade of experience.")
+    paragraph = doc.add_paragraph()
+    for text in ("Core Expertise: ", " ", "statistics, forecasting"):
+        paragraph.add_run(text)
+    paragraph = doc.add_paragraph()
+    for text in ("Technical Snapshot: ", "python, sql"):
+        paragraph.add_run(text)
+    for i_position in range(n_positions):
+        doc.add_paragraph(f"Position {i_position}, Company {i_position}").alignment = WD_ALIGN_PARAGRAPH.CENTER
+        doc.add_paragraph(f"Base position sentence {i_position}")
+        for i_bullet in range(n_bullets):
+            doc.add_paragraph(f"Base bullet {i_position}.{i_bullet}").alignment = WD_ALIGN_PARAGRAPH.LEFT
+            if i_bullet % 3 == 2:
+                doc.add_paragraph("")
+    doc.add_paragraph("Education")
+    doc.add_paragraph("B.S. Statistics")
+    doc.save(path)
+    return path
+
+def generated_content(n_positions: int, n_bullets: int) -> dict:
+    """Generated content shaped like the output of ResumeGeneratorController"""
+    content = {
+        "professional_summary": "# Professional Summary\nGenerated summary",
+        "core_expertise": "```markdown\n# Core Expertise\ncausal inference, experimentation\n```",
+        "technical_snapshot": "# Technical Snapshot\npython, spark, pytorch",
+    }
+    for i_position in range(n_positions):
+        bullets = "\n".join(f"- Generated bullet {i_position}.{i_bullet}" for i_bullet in range(n_bullets))
+        content[f"Position {i_position}, Company {i_position}"] = (
+            f"## Position {i_position}\nGenerated position sentence {i_position}\n{bullets}"
+            )
+    return content
+
+def timed(func, repeat: int) -> tuple[float, object]:
+    """Median milliseconds of `repeat` calls and the result of the last call"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(1000 * (time.perf_counter() - start))
+    return statistics.median(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--positions", type=int, nargs="+", default=[5, 20, 60])
+    parser.add_argument("--bullets", type=int, default=8)
+    parser.add_argument("--generated-bullets", type=int, default=4)
+    parser.add_argument("--images", type=int, default=0)
+    parser.add_argument("--image-kb", type=int, default=256)
+    parser.add_argument("--backends", nargs="+", default=list(ALLOWED_RENDER_BACKENDS), choices=ALLOWED_RENDER_BACKENDS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'positions':>9} {'paragraphs':>10} {'size KB':>8} {'backend':>11} {'load ms':>8} {'compile ms':>10} "
+        f"{'clone ms':>8} {'render ms':>9} {'save ms':>8} {'execute ms':>10}"
+        )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_positions in args.positions:
+            path = build_resume_template(
+                str(Path(tmp_dir) / f"resume_{n_positions}.docx"), n_positions, args.bullets, args.images, args.image_kb
+                )
+            load_ms, _ = timed(lambda: Document(path), args.repeat)
+            compile_ms, template = timed(lambda: CompiledDocxTemplate(path), args.repeat)
+
+            for backend in args.backends:
+                renderer = ResumeRendererController(
+                    resume_path=path,
+                    generated_content=generated_content(n_positions, args.generated_bullets),
+                    source_name=f"rendered_{n_positions}_{backend}",
+                    md_info=CL_KEYWORD_MD,
+                    render_backend=backend,
+                    )
+                renderer.data_dir = tmp_dir
+                cl_keywords, cleansed_content = renderer.align_text(), renderer.cleanse_generated_content()
+                clone_ms, _ = timed(lambda: template.clone(backend), args.repeat)
+
+                def render():
+                    doc = template.clone(backend)
+                    renderer.render(doc, template, ResumeRenderPlan(template, cl_keywords, cleansed_content))
+                    return doc
+                render_ms, doc = timed(render, args.repeat)
+                render_ms -= clone_ms
+                save_ms, _ = timed(lambda: template.save(doc, str(Path(tmp_dir) / "saved.docx"), backend), args.repeat)
+                execute_ms, _ = timed(renderer.execute, args.repeat)
+                print(
+                    f"{n_positions:>9} {len(template):>10} {len(template.source) // 1024:>8} {backend:>11} "
+                    f"{load_ms:>8.1f} {compile_ms:>10.1f} {clone_ms:>8.2f} {render_ms:>9.1f} {save_ms:>8.1f} "
+                    f"{execute_ms:>10.1f}"
+                    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+This file contains the benchmark comparing single-model and cascade similarity evaluation
+authors: Erin Hwang
+
+Scores the same resume/listing pairs with SIMILARITY_MODE=single (TRANSFORMER_MODEL only) and
+SIMILARITY_MODE=cascade (CASCADE_FAST_MODEL first, TRANSFORMER_MODEL within the band) and reports
+the process CPU time, the share of escalated pairs and how often both modes agree on the gate.
+The embedding cache is disabled so every pair pays for inference.
+
+Pairs are read from a JSONL file of {"resume": ..., "job": ...} objects, or generated from a skill
+vocabulary with a varying overlap when no file is given.
+
+usage (from the repository root):
+    python -m benchmarks.bench_similarity_cascade --pairs 200 --band 0.05
+    python -m benchmarks.bench_similarity_cascade --pairs-file data/pairs.jsonl --fast-threshold 0.6
+"""
+import os
+
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+import argparse
+import json
+import random
+import time
+
+from app.controllers.threshold_evaluator import (
+    CASCADE_FAST_MODEL,
+    SOFT_COSINE_THRESHOLD,
+    TRANSFORMER_MODEL,
+    SemanticSimilarityEvaluator,
+)
+from app.services.embedding import get_embedding_service
+from app.utils.metrics import metrics
+
+SKILLS = [
+    "python", "sql", "spark", "pytorch", "tensorflow", "scikit-learn", "a/b testing", "causal inference",
+    "time series forecasting", "recommendation systems", "nlp", "computer vision", "llm fine-tuning",
+    "airflow", "dbt", "snowflake", "aws", "gcp", "kubernetes", "docker", "react", "typescript", "node.js",
+    "graphql", "java", "spring boot", "go", "rust", "c++", "embedded firmware", "fpga", "sales forecasting",
+    "financial modeling", "excel", "tableau", "stakeholder management", "product analytics", "bayesian statistics",
+    "experiment design", "mlops", "feature stores", "data governance", "etl pipelines", "kafka", "redis",
+    ]
+
+def synthetic_pairs(n_pairs: int, rng: random.Random) -> list[tuple[str, str]]:
+    """Resume/listing pairs sharing a random share of their skills"""
+    resume_skills = rng.sample(SKILLS, 15)
+    resume = "Experienced professional skilled in " + ", ".join(resume_skills) + "."
+    pairs = []
+    for _ in range(n_pairs):
+        overlap = rng.randint(0, 10)
+        others = [skill for skill in SKILLS if skill not in resume_skills]
+        skills = rng.sample(resume_skills, overlap) + rng.sample(others, 10 - overlap)
+        rng.shuffle(skills)
+        pairs.append((resume, "We are hiring. Requirements: " + ", ".join(skills) + "."))
+    return pairs
+
+def load_pairs(path: str) -> list[tuple[str, str]]:
+    """Resume/listing pairs of a JSONL file"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [(record["resume"], record["job"]) for record in map(json.loads, f) if record]
+
+def run_mode(evaluator: SemanticSimilarityEvaluator, pairs: list[tuple[str, str]]) -> tuple[list[dict], float]:
+    """Score every pair, returns the scores and the CPU seconds spent"""
+    start = time.process_time()
+    scores = [evaluator.process(resume, job) for resume, job in pairs]
+    return scores, time.process_time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=200)
+    parser.add_argument("--pairs-file", default=None)
+    parser.add_argument("--full-model", default=TRANSFORMER_MODEL)
+    parser.add_argument("--fast-model", default=CASCADE_FAST_MODEL)
+    parser.add_argument("--threshold", type=float, default=SOFT_COSINE_THRESHOLD)
+    parser.add_argument("--fast-threshold", type=float, default=None)
+    parser.add_argument("--band", type=float, default=0.05)
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.pairs_file) if args.pairs_file else synthetic_pairs(args.pairs, random.Random(0))
+    for model_name in (args.full_model, args.fast_model):
+        get_embedding_service(model_name).warmup()
+
+    single = SemanticSimilarityEvaluator(args.full_model, mode="single", threshold=args.threshold)
+    cascade = SemanticSimilarityEvaluator(
+        args.full_model,
+        mode="cascade",
+        fast_model=args.fast_model,
+        band=args.band,
+        threshold=args.threshold,
+        fast_threshold=args.fast_threshold,
+        calibration_log="",
+        )
+
+    single_scores, single_cpu = run_mode(single, pairs)
+    cascade_scores, cascade_cpu = run_mode(cascade, pairs)
+
+    escalated = sum(score["similarity_tier"] == "full" for score in cascade_scores)
+    agree = sum(
+        (s["soft_cosine_similarity"] >= args.threshold) == (c["soft_cosine_similarity"] >= args.threshold)
+        for s, c in zip(single_scores, cascade_scores)
+        )
+    print(f"{len(pairs)} pairs | full model {args.full_model} | fast model {args.fast_model} | band {args.band}")
+    print(f"single  CPU {single_cpu:.2f}s ({1000 * single_cpu / len(pairs):.1f} ms/pair)")
+    print(f"cascade CPU {cascade_cpu:.2f}s ({1000 * cascade_cpu / len(pairs):.1f} ms/pair)")
+    print(f"CPU time saved: {100 * (1 - cascade_cpu / single_cpu):.1f}%")
+    print(f"escalated to the full model: {escalated}/{len(pairs)} | gate agreement: {agree}/{len(pairs)}")
+    print(f"cascade counters: { {k: v for k, v in metrics.snapshot()['counters'].items() if k.startswith('similarity.')} }")
+
+if __name__ == "__main__":
+    main()
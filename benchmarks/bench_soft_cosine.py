@@ -0,0 +1,95 @@
+"""
+This file contains the regression check and benchmark of the soft cosine similarity scorers
+authors: Erin Hwang
+
+Pins the O(d) soft_cosine_similarity (and its batch/matrix variants) to the original
+implementation, which built the d x d feature similarity matrix, then times both.
+
+usage (from the repository root):
+    python -m benchmarks.bench_soft_cosine --dim 768 --listings 500
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.controllers.threshold_evaluator import (
+    soft_cosine_similarity,
+    soft_cosine_similarity_batch,
+    soft_cosine_similarity_matrix,
+)
+
+def dense_soft_cosine_similarity(embedding1, embedding2):
+    """The original implementation materializing the d x d feature similarity matrix"""
+    combined_embeddings = np.vstack([embedding1, embedding2])
+
+    feature_vectors = combined_embeddings.T
+    similarity_matrix = cosine_similarity(feature_vectors)
+
+    e1 = np.array(embedding1).flatten()
+    e2 = np.array(embedding2).flatten()
+
+    numerator = np.dot(np.dot(e1, similarity_matrix), e2)
+    denominator = (
+        np.sqrt(np.dot(np.dot(e1, similarity_matrix), e1)) *
+        np.sqrt(np.dot(np.dot(e2, similarity_matrix), e2))
+    )
+    return numerator / denominator if denominator != 0 else 0
+
+def check_equality(dim: int, n_pairs: int, rng: np.random.Generator) -> None:
+    """Assert every scorer matches the dense implementation"""
+    for i in range(n_pairs):
+        e1 = rng.standard_normal((1, dim)).astype(np.float32)
+        e2 = rng.standard_normal((1, dim)).astype(np.float32)
+        if i % 3 == 0:
+            # exercise features where both embeddings are zero
+            e1[0, : dim // 10] = 0
+            e2[0, : dim // 10] = 0
+        expected = dense_soft_cosine_similarity(e1, e2)
+        assert np.isclose(soft_cosine_similarity(e1, e2), expected, rtol=1e-5, atol=1e-6), (i, expected)
+
+    resumes = rng.standard_normal((4, dim)).astype(np.float32)
+    listings = rng.standard_normal((25, dim)).astype(np.float32)
+    expected = np.array([[dense_soft_cosine_similarity(r, l) for l in listings] for r in resumes])
+    assert np.allclose(soft_cosine_similarity_batch(resumes[0], listings), expected[0], rtol=1e-5, atol=1e-6)
+    assert np.allclose(soft_cosine_similarity_matrix(resumes, listings), expected, rtol=1e-5, atol=1e-6)
+    assert np.allclose(
+        soft_cosine_similarity_matrix(resumes, listings, max_elements=dim), expected, rtol=1e-5, atol=1e-6
+        )
+    assert soft_cosine_similarity(np.zeros(dim), np.zeros(dim)) == 0
+    print(f"equality check passed for {n_pairs} pairs and a {len(resumes)}x{len(listings)} matrix")
+
+def timeit(func, repeat: int) -> float:
+    """Best wall time of `repeat` calls in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--listings", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    check_equality(args.dim, 50, rng)
+
+    e1 = rng.standard_normal((1, args.dim)).astype(np.float32)
+    e2 = rng.standard_normal((1, args.dim)).astype(np.float32)
+    listings = rng.standard_normal((args.listings, args.dim)).astype(np.float32)
+
+    dense_ms = timeit(lambda: dense_soft_cosine_similarity(e1, e2), args.repeat)
+    linear_ms = timeit(lambda: soft_cosine_similarity(e1, e2), args.repeat)
+    loop_ms = timeit(lambda: [dense_soft_cosine_similarity(e1, l) for l in listings], 1)
+    batch_ms = timeit(lambda: soft_cosine_similarity_batch(e1, listings), args.repeat)
+
+    print(f"single pair (d={args.dim}): dense {dense_ms:.3f} ms | O(d) {linear_ms:.3f} ms")
+    print(f"1 x {args.listings} listings: dense loop {loop_ms:.1f} ms | batch {batch_ms:.3f} ms")
+
+if __name__ == "__main__":
+    main()